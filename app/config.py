@@ -0,0 +1,153 @@
+import os, threading
+from typing import Any, Callable, Dict
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+# ---------- lazy client registry ----------
+# Clients are built on first use, never at import, so workers boot without
+# touching the network (or importing the SDKs) and a missing key only fails
+# the requests that need it.
+
+_clients: Dict[str, Any] = {}
+_clients_lock = threading.Lock()
+
+
+def _client(name: str, factory: Callable[[], Any]) -> Any:
+    c = _clients.get(name)
+    if c is None:
+        with _clients_lock:
+            c = _clients.get(name)
+            if c is None:
+                c = _clients[name] = factory()
+    return c
+
+
+def get_openai():
+    def build():
+        from openai import OpenAI
+        from app.services.metrics import TracedOpenAI
+        from app.services.llm_gateway import GatedOpenAI
+        return GatedOpenAI(TracedOpenAI(OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)))
+    return _client("openai", build)
+
+
+def get_async_openai():
+    def build():
+        from openai import AsyncOpenAI
+        from app.services.metrics import TracedOpenAI
+        from app.services.llm_gateway import GatedOpenAI
+        return GatedOpenAI(TracedOpenAI(AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0), is_async=True), is_async=True)
+    return _client("async_openai", build)
+
+
+def get_redis(decode_responses: bool = True):
+    from app.services.redis_client import get_redis as pooled
+    return pooled(decode_responses)
+
+
+def get_vector_index():
+    from app.services.pinecone_client import get_pinecone_index
+    return get_pinecone_index()
+
+
+async def close_clients() -> None:
+    """Lifespan shutdown: closes whatever was actually created."""
+    with _clients_lock:
+        clients = dict(_clients)
+        _clients.clear()
+    if "async_openai" in clients:
+        await clients["async_openai"].close()
+    if "openai" in clients:
+        clients["openai"].close()
+    from app.services.redis_client import close_pools
+    close_pools()
+
+# Blocking work (sync OpenAI / vector / Redis calls) dispatched from async routes
+BLOCKING_WORKERS = int(os.getenv("BLOCKING_WORKERS", "16"))
+BLOCKING_QUEUE_LIMIT = int(os.getenv("BLOCKING_QUEUE_LIMIT", "256"))
+
+# Bulk recipe ingestion (recipe_ingest.py)
+INGEST_EMBED_BATCH = int(os.getenv("INGEST_EMBED_BATCH", "100"))
+INGEST_UPSERT_BATCH = int(os.getenv("INGEST_UPSERT_BATCH", "32"))
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "4"))
+INGEST_MAX_RETRIES = int(os.getenv("INGEST_MAX_RETRIES", "3"))
+
+# New-user corpus bootstrap (meal_agent_smart.py)
+BOOTSTRAP_RECIPES = int(os.getenv("BOOTSTRAP_RECIPES", "60"))
+BOOTSTRAP_EMBED_BATCH = int(os.getenv("BOOTSTRAP_EMBED_BATCH", "8"))
+BOOTSTRAP_WAIT_SECONDS = float(os.getenv("BOOTSTRAP_WAIT_SECONDS", "120"))
+
+# Meal scheduling: "local" (constraint solver, local_planner.py) or "llm"
+PLANNER_BACKEND = os.getenv("PLANNER_BACKEND", "local").lower()
+PLANNER_LLM_POLISH = os.getenv("PLANNER_LLM_POLISH", "0") == "1"
+PLAN_NO_REPEAT_DAYS = int(os.getenv("PLAN_NO_REPEAT_DAYS", "2"))
+
+# Plan cache (plan_cache.py): "auto" caches only when scheduling calls an LLM,
+# i.e. it is off with the default local planner unless PLAN_CACHE=on
+PLAN_CACHE = os.getenv("PLAN_CACHE", "auto").lower()
+PLAN_CACHE_TTL = int(os.getenv("PLAN_CACHE_TTL", str(24 * 3600)))
+PLAN_CACHE_MAX_ENTRIES = int(os.getenv("PLAN_CACHE_MAX_ENTRIES", "5000"))
+# reuse a plan for the same profile when candidate sets overlap this much (Jaccard);
+# 0 (default) disables it and the per-miss scan it costs
+PLAN_CACHE_NEAR_HIT = float(os.getenv("PLAN_CACHE_NEAR_HIT", "0"))
+
+# recipe_rag.compile_grounded_plan prompt: "compact" (aliases, slots only) or "full"
+RAG_PROMPT_MODE = os.getenv("RAG_PROMPT_MODE", "compact").lower()
+
+# Background jobs (jobs.py). BOOTSTRAP_MODE=queue returns 202 + a job handle
+# (or a partial plan) instead of bootstrapping inside the request.
+BOOTSTRAP_MODE = os.getenv("BOOTSTRAP_MODE", "queue").lower()
+BOOTSTRAP_PARTIAL_MIN = int(os.getenv("BOOTSTRAP_PARTIAL_MIN", "6"))
+BOOTSTRAP_LOCK_SECONDS = int(os.getenv("BOOTSTRAP_LOCK_SECONDS", "600"))
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", str(24 * 3600)))
+# a running job's lease, renewed by its worker; a job whose lease lapses (worker died) is requeued
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "30"))
+# runs a job may start before it is marked failed (a job that keeps killing its worker)
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# worker threads started inside the API process; 0 when running `python -m app.services.jobs`
+JOBS_INPROCESS_WORKERS = int(os.getenv("JOBS_INPROCESS_WORKERS", "1"))
+
+# Corpus warm-up when preferences are saved (corpus_warmup.py)
+WARMUP_ON_SAVE = os.getenv("WARMUP_ON_SAVE", "1") == "1"
+WARMUP_DEBOUNCE_SECONDS = float(os.getenv("WARMUP_DEBOUNCE_SECONDS", "20"))
+
+# Embeddings (embedding_providers.py): "openai" (text-embedding-3-large) or
+# "local" (sentence-transformers on CPU, micro-batched across requests).
+# Non-default models write to "<namespace>@<model>"; on Pinecone the index
+# dimension (PINECONE_DIMENSION) must match the model.
+EMBED_PROVIDER = os.getenv("EMBED_PROVIDER", "openai").lower()
+LOCAL_EMBED_MODEL = os.getenv("LOCAL_EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+# a batch waits at most this long for more concurrent requests to join
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "64"))
+# quantise local vectors to int8 (cached as 1 byte per dimension)
+EMBED_INT8 = os.getenv("EMBED_INT8", "0") == "1"
+
+# Per-stage timing breakdown (ms) in the plan response's audit["timings_ms"] (metrics.py)
+AUDIT_TIMINGS = os.getenv("AUDIT_TIMINGS", "0") == "1"
+
+# LLM gateway (llm_gateway.py): every chat completion is admitted against
+# these budgets, interactive calls before background jobs. Budgets are per
+# process: set them to the account limits divided by the number of workers.
+LLM_RPM = int(os.getenv("LLM_RPM", "500"))
+LLM_TPM = int(os.getenv("LLM_TPM", "300000"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+# completion tokens reserved for a call that sets no max_tokens (corrected from usage afterwards)
+LLM_COMPLETION_ESTIMATE = int(os.getenv("LLM_COMPLETION_ESTIMATE", "1000"))
+# seconds a call may wait for admission before failing with 503 (background jobs wait longer)
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+LLM_BACKGROUND_QUEUE_TIMEOUT = float(os.getenv("LLM_BACKGROUND_QUEUE_TIMEOUT", "300"))
+# retries of 429 / 5xx / connection errors (replaces the SDK's own retries)
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "20"))
+
+# Coalescing of identical in-flight plan requests (singleflight.py): followers
+# wait for the leader's result instead of planning again
+SINGLEFLIGHT = os.getenv("SINGLEFLIGHT", "1") == "1"
+# also across workers, through Redis (leader lock + a short-lived shared result)
+SINGLEFLIGHT_REDIS = os.getenv("SINGLEFLIGHT_REDIS", "0") == "1"
+SINGLEFLIGHT_LOCK_SECONDS = float(os.getenv("SINGLEFLIGHT_LOCK_SECONDS", "120"))
+# with Redis, a finished result still answers retries of the same request for this long
+SINGLEFLIGHT_RESULT_TTL = int(os.getenv("SINGLEFLIGHT_RESULT_TTL", "10"))
@@ -1,6 +1,6 @@
 from fastapi import HTTPException
 from app.services.location_agent import get_local_groceries
-from app.database import redis_client
+from app.services import profile_store
 
 class LocationController:
     
@@ -10,7 +10,7 @@ class LocationController:
         if not chat_id or not location_data:
             raise HTTPException(status_code=400, detail="Location data is required")
         
-        redis_client.set(f"user:{chat_id}:location", str(location_data))
+        profile_store.save_location(chat_id, location_data)
         return {"message": "Location saved successfully"}
 
     @staticmethod
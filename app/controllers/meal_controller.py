@@ -1,9 +1,20 @@
-from app.services.meal_agent_smart import generate_smart_meal_plan
-from app.services.build_plan_adapter import build_plan_fn
+from app.config import PLANNER_BACKEND
+from app.services.meal_agent_smart import agenerate_smart_meal_plan
+from app.services.build_plan_adapter import abuild_plan_fn
+from app.services.local_planner import aplan_with_optional_polish
+from app.services.plan_stream import sse_response
+from app.services.singleflight import coalesce
 from app.models.meal import MealPlanRequest
 
 class MealController:
     @staticmethod
-    def create_meal_plan(request: MealPlanRequest):
+    async def create_meal_plan(request: MealPlanRequest):
         payload = request.dict()
-        return generate_smart_meal_plan(payload, build_plan_fn)
+        plan_fn = abuild_plan_fn if PLANNER_BACKEND == "llm" else aplan_with_optional_polish
+        return await coalesce("smart", payload, lambda: agenerate_smart_meal_plan(payload, plan_fn))
+
+    @staticmethod
+    async def create_meal_plan_stream(request: MealPlanRequest):
+        payload = request.dict()
+        plan_fn = abuild_plan_fn if PLANNER_BACKEND == "llm" else aplan_with_optional_polish
+        return sse_response(lambda emit: agenerate_smart_meal_plan(payload, plan_fn, on_event=emit))
@@ -1,5 +1,6 @@
 from fastapi import Body, HTTPException
-from app.services.recipe_corpus import generate_recipe_cards, upsert_recipe_cards
+from app.services.recipe_corpus import generate_recipe_cards
+from app.services.recipe_ingest import ingest_recipes
 import time
 
 class RecipeController:
@@ -15,5 +16,5 @@ class RecipeController:
         for i, r in enumerate(recipes):
             r["id"] = f"r_{user_id}_{ts}_{i}"
 
-        stored = upsert_recipe_cards(str(user_id), recipes)
+        stored = ingest_recipes(str(user_id), recipes)
         return {"stored": stored, "sample": recipes[:3]}
@@ -1,5 +1,10 @@
 from fastapi import HTTPException
-from app.database import redis_client
+from app.services import profile_store
+from app.services.corpus_warmup import schedule_warmup
+from app.models.user import UserProfile, BulkProfilesRequest
+
+# bulk reads are meant for batch jobs, not unbounded scans
+MAX_BULK_PROFILES = 5000
 
 class UserController:
 
@@ -9,14 +14,30 @@ class UserController:
         if not chat_id or not preferences:
             raise HTTPException(status_code=400, detail="Invalid preferences data")
         
-        redis_client.set(f"user:{chat_id}:preferences", str(preferences))
-        return {"message": "User preferences saved"}
+        profile_store.save_preferences(chat_id, preferences)
+
+        # best-effort: get the recipe corpus ready before the first plan request
+        try:
+            warmup = schedule_warmup(str(preferences.get("user_id") or chat_id), preferences)
+        except Exception as e:
+            print("Corpus warm-up not scheduled:", e)
+            warmup = None
+        return {"message": "User preferences saved", "warmup": warmup}
 
     @staticmethod
     def get_user_preferences(chat_id: str):
         """ Retrieve user preferences from Redis """
-        preferences = redis_client.get(f"user:{chat_id}:preferences")
+        preferences = profile_store.get_preferences(chat_id)
         if not preferences:
             raise HTTPException(status_code=404, detail="No preferences found")
         
-        return {"preferences": eval(preferences)}
+        return {"preferences": preferences}
+
+    @staticmethod
+    def get_profiles_bulk(request: BulkProfilesRequest):
+        """ Preferences and/or location for many users in one Redis round trip """
+        if len(request.chat_ids) > MAX_BULK_PROFILES:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_PROFILES} chat_ids per request")
+
+        profiles = profile_store.get_profiles(request.chat_ids, request.fields)
+        return {"profiles": [UserProfile(chat_id=c, **p) for c, p in profiles.items()]}
@@ -1,30 +1,15 @@
-import os
-import redis
-from dotenv import load_dotenv
-from pinecone import Pinecone
-
-# Load environment variables
-load_dotenv()
-
-# Initialize Redis client
-redis_client = redis.Redis(
-    host=os.getenv("REDIS_HOST", "localhost"),
-    port=int(os.getenv("REDIS_PORT", 6379)),
-    decode_responses=True  # Ensures output is returned as strings
-)
-
-# Initialize Pinecone client
-pinecone_api_key = os.getenv("PINECONE_API_KEY")
-
-if not pinecone_api_key:
-    raise ValueError("PINECONE_API_KEY is missing. Check your .env file.")
-
-pc = Pinecone(api_key=pinecone_api_key)
-
-# Connect to Pinecone index
-index_name = os.getenv("PINECONE_INDEX")
-
-if index_name not in pc.list_indexes().names():
-    pc.create_index(name=index_name, dimension=3072, metric="cosine")
-
-index = pc.Index(index_name)
+# app/database.py
+"""
+Backwards-compatible names for the shared clients. Nothing here connects at
+import time: `redis_client` and `index` resolve lazily on first attribute
+access (use app.config.get_redis / get_vector_index in new code).
+"""
+from app.config import get_redis, get_vector_index
+
+
+def __getattr__(name):
+    if name == "redis_client":
+        return get_redis()
+    if name == "index":
+        return get_vector_index()
+    raise AttributeError(f"module 'app.database' has no attribute {name!r}")
@@ -0,0 +1,61 @@
+# app/import_budget.py
+"""
+Import-time budget check: imports the app in a fresh interpreter and fails
+if it takes longer than the budget or eagerly loads a heavy SDK.
+
+    python -m app.import_budget                 # main.py, 800 ms
+    python -m app.import_budget --budget-ms 500 --module main --top 15
+"""
+import os, re, sys, json, time, argparse, subprocess
+from typing import List, Tuple
+
+# must only be imported on first use, never while booting a worker
+HEAVY_MODULES = ("openai", "pinecone", "torch", "transformers", "sentence_transformers", "langchain", "pandas")
+
+_IMPORTTIME_RE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\| (.+)$")
+
+
+def _slowest(stderr: str, top: int) -> List[Tuple[float, str]]:
+    rows = []
+    for line in stderr.splitlines():
+        m = _IMPORTTIME_RE.match(line)
+        if m:
+            rows.append((int(m.group(2)) / 1000.0, m.group(3).rstrip()))
+    # top-level packages only: nested entries are already in their parent's cumulative time
+    rows = [(ms, name) for ms, name in rows if not name.startswith(" ")]
+    return sorted(rows, reverse=True)[:top]
+
+
+def measure(module: str) -> Tuple[float, List[str], str]:
+    code = f"import sys, json; import {module}; print(json.dumps(sorted(sys.modules)))"
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, env=env)
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    loaded = json.loads(proc.stdout.strip().splitlines()[-1])
+    return elapsed_ms, loaded, proc.stderr
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Fail if importing the app is slow or loads heavy SDKs eagerly.")
+    ap.add_argument("--module", default="main")
+    ap.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", "800")))
+    ap.add_argument("--top", type=int, default=10)
+    args = ap.parse_args(argv)
+
+    elapsed_ms, loaded, stderr = measure(args.module)
+    heavy = sorted({m.split(".")[0] for m in loaded} & set(HEAVY_MODULES))
+
+    print(f"import {args.module}: {elapsed_ms:.0f} ms (budget {args.budget_ms:.0f} ms, includes interpreter start)")
+    for ms, name in _slowest(stderr, args.top):
+        print(f"  {ms:8.1f} ms  {name}")
+    if heavy:
+        print("eagerly imported heavy modules:", ", ".join(heavy))
+
+    return 0 if elapsed_ms <= args.budget_ms and not heavy else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,14 @@
+# app/models/location.py
+from pydantic import BaseModel
+from typing import Optional
+
+class Address(BaseModel):
+    city: Optional[str] = None
+    state: Optional[str] = None
+    postcode: Optional[str] = None
+    country: Optional[str] = None
+
+class Location(BaseModel):
+    address: Address = Address()
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
@@ -11,6 +11,8 @@ class Preferences(BaseModel):
     exclusions: List[str] = []
     days: int = 7
     ingredientsAtHome: List[str] = []
+    max_time_minutes: Optional[int] = None
+    calories: Optional[float] = None
 
 class MealPlanRequest(BaseModel):
     chat_id: Optional[str] = None
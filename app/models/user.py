@@ -0,0 +1,12 @@
+# app/models/user.py
+from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
+
+class UserProfile(BaseModel):
+    chat_id: str
+    preferences: Optional[Dict[str, Any]] = None
+    location: Optional[Dict[str, Any]] = None
+
+class BulkProfilesRequest(BaseModel):
+    chat_ids: List[str]
+    fields: List[str] = ["preferences", "location"]
@@ -1,5 +1,9 @@
 from fastapi import APIRouter
 from app.services.recipe_corpus import retrieve_recipes_for_request
+from app.services.pinecone_client import vector_health
+from app.services.blocking_executor import executor_metrics
+from app.services.llm_gateway import gateway_stats
+from app.services.plan_cache import stats as plan_cache_stats
 
 router = APIRouter()
 
@@ -17,3 +21,23 @@ def debug_retrieve_full(payload: dict):
         }
         for r in recipes
     ]
+
+
+@router.get("/debug/vector-health")
+def debug_vector_health():
+    return vector_health()
+
+
+@router.get("/debug/executor")
+def debug_executor():
+    return executor_metrics()
+
+
+@router.get("/debug/llm-gateway")
+def debug_llm_gateway():
+    return gateway_stats()
+
+
+@router.get("/debug/plan-cache")
+def debug_plan_cache():
+    return plan_cache_stats()
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from app.services.grocery_agent import generate_grocery_list
+from app.services.blocking_executor import run_blocking
 
 router = APIRouter()
 
@@ -12,5 +13,5 @@ async def generate_grocery(request: GroceryRequest):
     """API to generate grocery list from meal plan"""
     if not request.meal_plan:
         raise HTTPException(status_code=400, detail="Meal plan is required")
-    grocery_list = generate_grocery_list(request.meal_plan)
+    grocery_list = await run_blocking(generate_grocery_list, request.meal_plan)
     return {"grocery_list": grocery_list}
@@ -1,9 +1,18 @@
 # app/routes/grounded_meal_routes.py
 from fastapi import APIRouter
-from app.services.grounded_planner import build_grounded_meal_plan
+from app.services.grounded_planner import abuild_grounded_meal_plan
+from app.services.plan_stream import sse_response
+from app.services.singleflight import coalesce
 
 router = APIRouter()
 
 @router.post("/grounded")
-def grounded(payload: dict):
-    return build_grounded_meal_plan(payload)
+async def grounded(payload: dict):
+    # double-submits and retries share one plan (the stream below is per client)
+    return await coalesce("grounded", payload, lambda: abuild_grounded_meal_plan(payload))
+
+
+@router.post("/grounded/stream")
+async def grounded_stream(payload: dict):
+    # text/event-stream: stage, day, groceries, then done (or error)
+    return sse_response(lambda emit: abuild_grounded_meal_plan(payload, on_event=emit))
@@ -0,0 +1,13 @@
+# app/routes/job_routes.py
+from fastapi import APIRouter, HTTPException
+from app.services.jobs import get_job
+from app.services.blocking_executor import run_blocking
+
+router = APIRouter()
+
+@router.get("/{job_id}")
+async def job_status(job_id: str):
+    job = await run_blocking(get_job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
@@ -1,21 +1,27 @@
 # app/routes/meal_routes.py
 from fastapi import APIRouter, HTTPException, Request
-from app.services.meal_agent import generate_rag_meal_plan
+from app.services.meal_agent import generate_rag_meal_plan, agenerate_rag_meal_plan_stream
+from app.services.plan_stream import sse_response
+from app.controllers.meal_controller import MealController
+from app.services.blocking_executor import run_blocking, ExecutorSaturated
 
 router = APIRouter()
 
+router.post("/smart")(MealController.create_meal_plan)
+router.post("/smart/stream")(MealController.create_meal_plan_stream)
+
 @router.post("/generate")
 async def generate_meal_plan_route(request: Request):
     try:
         body = await request.json()
         print("Received meal plan request:", body)
 
-        meal_plan = generate_rag_meal_plan(body)
+        meal_plan = await run_blocking(generate_rag_meal_plan, body)
         if not meal_plan:
             raise HTTPException(status_code=500, detail="Meal plan generation failed.")
 
         return {"meal_plan": meal_plan}
-    except HTTPException:
+    except (HTTPException, ExecutorSaturated):
         raise
     except Exception as e:
         # Print detailed exception during dev
@@ -23,3 +29,9 @@ async def generate_meal_plan_route(request: Request):
         traceback.print_exc()
         print("Error generating meal plan:", e)
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/generate/stream")
+async def generate_meal_plan_stream_route(request: Request):
+    body = await request.json()
+    return sse_response(lambda emit: agenerate_rag_meal_plan_stream(body, emit))
@@ -1,5 +1,6 @@
 from fastapi import APIRouter
 from app.controllers.user_controller import UserController
+from app.models.user import BulkProfilesRequest
 
 router = APIRouter()
 
@@ -12,3 +13,8 @@ def save_preferences(chat_id: str, preferences: dict):
 def get_preferences(chat_id: str):
     """ Retrieve user meal preferences """
     return UserController.get_user_preferences(chat_id)
+
+@router.post("/profiles/bulk")
+def get_profiles_bulk(request: BulkProfilesRequest):
+    """ Retrieve many users' preferences and location in one round trip """
+    return UserController.get_profiles_bulk(request)
@@ -0,0 +1,106 @@
+# app/services/blocking_executor.py
+import asyncio, contextvars, threading, time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from app.config import BLOCKING_WORKERS, BLOCKING_QUEUE_LIMIT
+
+
+class ExecutorSaturated(RuntimeError):
+    """Raised when the blocking executor's queue is full (mapped to 503 in main.py)."""
+
+
+class BlockingExecutor:
+    """
+    Bounded thread pool for blocking LLM / vector calls made from async routes.
+    At most `workers` calls run at once and at most `max_queue` wait; beyond
+    that submissions are rejected instead of piling up.
+    """
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="blocking")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._recent_waits: deque = deque(maxlen=1024)
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        with self._lock:
+            if self._queued >= self.max_queue:
+                self._rejected += 1
+                raise ExecutorSaturated(f"Blocking executor queue is full ({self.max_queue} waiting)")
+            self._queued += 1
+
+        enqueued = time.perf_counter()
+
+        def task():
+            waited = time.perf_counter() - enqueued
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+                self._recent_waits.append(waited)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+
+        # keep request-scoped context (e.g. timing collectors) inside the worker thread
+        ctx = contextvars.copy_context()
+        fut = self._pool.submit(ctx.run, task)
+        fut.add_done_callback(self._forget_cancelled)
+        return fut
+
+    def _forget_cancelled(self, fut: Future) -> None:
+        # cancelled while still queued (caller gone): task() never runs to uncount it
+        if fut.cancelled():
+            with self._lock:
+                self._queued -= 1
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = sorted(self._recent_waits)
+            started = self._completed + self._running
+
+            def pct(p: float) -> float:
+                if not waits:
+                    return 0.0
+                return round(waits[min(len(waits) - 1, int(p * len(waits)))] * 1000, 2)
+
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "queue_depth": self._queued,
+                "running": self._running,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "queue_wait_ms_avg": round(self._wait_total / started * 1000, 2) if started else 0.0,
+                "queue_wait_ms_max": round(self._wait_max * 1000, 2),
+                "queue_wait_ms_p50": pct(0.50),
+                "queue_wait_ms_p95": pct(0.95),
+            }
+
+
+executor = BlockingExecutor(BLOCKING_WORKERS, BLOCKING_QUEUE_LIMIT)
+
+
+async def run_blocking(fn: Callable, *args, **kwargs) -> Any:
+    """Awaitable wrapper used by async routes/services for any blocking call."""
+    return await executor.run(fn, *args, **kwargs)
+
+
+def executor_metrics() -> Dict[str, Any]:
+    return executor.metrics()
@@ -1,15 +1,14 @@
 # app/services/build_plan_adapter.py
 import json
-from typing import Dict, Any, List
-from openai import OpenAI
-import os
+from typing import Dict, Any, List, Optional, Callable
 from dotenv import load_dotenv
 
+from app.config import get_openai, get_async_openai
+from app.services.plan_stream import astream_json_days
+
 load_dotenv(override=True)
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-def build_plan_fn(*, user_id: str, prefs: Dict[str, Any], candidates: List[Dict[str, Any]], memory: List[str]) -> Dict[str, Any]:
-    
+def _plan_messages(prefs: Dict[str, Any], candidates: List[Dict[str, Any]], memory: List[str]) -> List[Dict[str, str]]:
     provided = [{"id": r["id"], "title": r.get("title"), "kcal": r.get("kcal"), "time_minutes": r.get("time_minutes"), "tags": r.get("tags", [])}
                 for r in candidates]
     allowed_ids = [r["id"] for r in candidates]
@@ -31,19 +30,13 @@ def build_plan_fn(*, user_id: str, prefs: Dict[str, Any], candidates: List[Dict[
         }
     }
 
-    resp = client.chat.completions.create(
-        model="gpt-4-turbo",
-        temperature=0.2,
-        response_format={"type":"json_object"},
-        messages=[
-            {"role": "system", "content": "You are a grounded meal planner. Use only allowed_recipe_ids."},
-            {"role": "user", "content": json.dumps(prompt)},
-        ],
-    )
-    plan = json.loads(resp.choices[0].message.content)
+    return [
+        {"role": "system", "content": "You are a grounded meal planner. Use only allowed_recipe_ids."},
+        {"role": "user", "content": json.dumps(prompt)},
+    ]
 
-   
-    retrieved_set = set(allowed_ids)
+def _validate_plan(plan: Dict[str, Any], candidates: List[Dict[str, Any]]) -> Dict[str, Any]:
+    retrieved_set = set(r["id"] for r in candidates)
     used = set()
     for d in plan.get("days", []):
         for m in d.get("meals", []):
@@ -51,7 +44,73 @@ def build_plan_fn(*, user_id: str, prefs: Dict[str, Any], candidates: List[Dict[
                 used.add(m["recipe_id"])
     bad = sorted(list(used - retrieved_set))
     if bad:
-        
         raise ValueError(f"Planner used invalid recipe_ids: {bad[:5]}")
 
     return plan
+
+def build_plan_fn(*, user_id: str, prefs: Dict[str, Any], candidates: List[Dict[str, Any]], memory: List[str]) -> Dict[str, Any]:
+    resp = get_openai().chat.completions.create(
+        model="gpt-4-turbo",
+        temperature=0.2,
+        response_format={"type":"json_object"},
+        messages=_plan_messages(prefs, candidates, memory),
+    )
+    plan = json.loads(resp.choices[0].message.content)
+    return _validate_plan(plan, candidates)
+
+async def abuild_plan_fn(*, user_id: str, prefs: Dict[str, Any], candidates: List[Dict[str, Any]], memory: List[str],
+                         on_day: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    if on_day:
+        # streamed: each day is reported as soon as the completion contains it
+        plan = await astream_json_days(
+            get_async_openai(), _plan_messages(prefs, candidates, memory), on_day,
+            model="gpt-4-turbo", temperature=0.2, response_format={"type":"json_object"},
+        )
+        return _validate_plan(plan, candidates)
+
+    resp = await get_async_openai().chat.completions.create(
+        model="gpt-4-turbo",
+        temperature=0.2,
+        response_format={"type":"json_object"},
+        messages=_plan_messages(prefs, candidates, memory),
+    )
+    plan = json.loads(resp.choices[0].message.content)
+    return _validate_plan(plan, candidates)
+
+def _polish_messages(prefs: Dict[str, Any], candidates: List[Dict[str, Any]], memory: List[str], draft: Dict[str, Any]) -> List[Dict[str, str]]:
+    messages = _plan_messages(prefs, candidates, memory)
+    messages.append({
+        "role": "user",
+        "content": json.dumps({
+            "draft_plan": {"days": draft.get("days", [])},
+            "instruction": "Improve variety and fit to user_memory by swapping recipe_ids where useful. Keep the same days and meal slots. Return the full plan JSON.",
+        }),
+    })
+    return messages
+
+def polish_plan_fn(*, user_id: str, prefs: Dict[str, Any], candidates: List[Dict[str, Any]], memory: List[str], draft: Dict[str, Any]) -> Dict[str, Any]:
+    """Optional LLM pass over a local_planner draft; falls back to the draft on any failure."""
+    try:
+        resp = get_openai().chat.completions.create(
+            model="gpt-4-turbo",
+            temperature=0.2,
+            response_format={"type":"json_object"},
+            messages=_polish_messages(prefs, candidates, memory, draft),
+        )
+        return _validate_plan(json.loads(resp.choices[0].message.content), candidates)
+    except Exception as e:
+        print(f"Plan polish failed, using local draft: {e}")
+        return draft
+
+async def apolish_plan_fn(*, user_id: str, prefs: Dict[str, Any], candidates: List[Dict[str, Any]], memory: List[str], draft: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        resp = await get_async_openai().chat.completions.create(
+            model="gpt-4-turbo",
+            temperature=0.2,
+            response_format={"type":"json_object"},
+            messages=_polish_messages(prefs, candidates, memory, draft),
+        )
+        return _validate_plan(json.loads(resp.choices[0].message.content), candidates)
+    except Exception as e:
+        print(f"Plan polish failed, using local draft: {e}")
+        return draft
@@ -0,0 +1,55 @@
+# app/services/corpus_warmup.py
+import json, hashlib
+from typing import Dict, Any, Optional
+
+from app.config import WARMUP_ON_SAVE, WARMUP_DEBOUNCE_SECONDS, JOB_TTL_SECONDS
+from app.services.redis_client import get_redis
+from app.services.jobs import schedule_debounced, job_handle
+
+# Saving preferences schedules a debounced background warm-up, so the first
+# plan request finds a corpus (and cached query embedding) ready:
+#   1. bootstrap the corpus if the filtered retrieval can't cover the prefs
+#   2. run the plan-time retrieval once, which fills the shared Redis caches
+WARMED_PREFIX = "warmup:prefs:"
+
+
+def _prefs_digest(prefs: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(prefs, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def schedule_warmup(user_id: str, prefs: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Returns the job handle, or None when disabled or the prefs are unchanged since the last warm-up."""
+    if not WARMUP_ON_SAVE or not user_id:
+        return None
+    prefs = prefs.get("preferences", prefs)
+
+    if get_redis().get(WARMED_PREFIX + user_id) == _prefs_digest(prefs):
+        return None
+
+    job = schedule_debounced(
+        "warmup",
+        {"user_id": user_id, "preferences": prefs},
+        debounce_key=f"warmup:{user_id}",
+        delay_seconds=WARMUP_DEBOUNCE_SECONDS,
+    )
+    return {**job_handle(job), "run_at": job["run_at"]}
+
+
+def run_warmup_job(payload: Dict[str, Any], progress) -> Dict[str, Any]:
+    """Job handler (jobs.HANDLERS["warmup"])."""
+    # lazy: pulls in the OpenAI / vector clients
+    from app.services.meal_agent_smart import run_bootstrap_job, _min_needed
+    from app.services.recipe_corpus import retrieve_recipes_for_request
+
+    user_id = str(payload["user_id"])
+    prefs = payload.get("preferences") or {}
+
+    # the bootstrap handler itself skips users whose corpus already covers prefs
+    bootstrap = run_bootstrap_job(payload, progress)
+
+    candidates = retrieve_recipes_for_request(user_id, prefs, top_k=50)
+    covered = len(candidates) >= _min_needed(prefs)
+    if covered:
+        get_redis().set(WARMED_PREFIX + user_id, _prefs_digest(prefs), ex=JOB_TTL_SECONDS * 7)
+
+    return {"bootstrap": bootstrap, "candidates": len(candidates), "covered": covered}
@@ -0,0 +1,179 @@
+# app/services/embedding_providers.py
+import queue, asyncio, threading, time
+from concurrent.futures import Future
+from typing import List, Tuple, Protocol
+
+from app.config import (
+    get_openai, get_async_openai, _client,
+    EMBED_PROVIDER, LOCAL_EMBED_MODEL, EMBED_BATCH_WINDOW_MS, EMBED_MAX_BATCH, EMBED_INT8,
+)
+
+# Every embedding goes through one provider (embeddings.py adds the cache tiers).
+# A provider has:
+#   model      embedding model; recorded per vector namespace
+#   name       model plus output format; part of every cache key
+#   slug       suffix for vector namespaces ("" keeps the namespace name), so
+#              vectors from different models never land in the same namespace
+#   int8       vectors are quantised to int8 (values are multiples of 1/127)
+#   embed / aembed
+OPENAI_MODEL = "text-embedding-3-large"
+
+
+class EmbeddingProvider(Protocol):
+    model: str
+    name: str
+    slug: str
+    int8: bool
+
+    def embed(self, texts: List[str]) -> List[List[float]]: ...
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]: ...
+
+
+def physical_namespace(provider: EmbeddingProvider, namespace: str) -> str:
+    return f"{namespace}@{provider.slug}" if provider.slug else namespace
+
+
+class OpenAIProvider:
+    int8 = False
+
+    def __init__(self, model: str = OPENAI_MODEL):
+        self.model = self.name = model
+        # the original namespaces were written with text-embedding-3-large
+        self.slug = "" if model == OPENAI_MODEL else model
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        resp = get_openai().embeddings.create(model=self.model, input=texts)
+        return [d.embedding for d in resp.data]
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        resp = await get_async_openai().embeddings.create(model=self.model, input=texts)
+        return [d.embedding for d in resp.data]
+
+# ---------- local CPU backend ----------
+
+def quantize_int8(mat):
+    """Unit vectors -> int8 with a fixed scale, so codes are comparable across batches."""
+    import numpy as np
+    return np.clip(np.rint(mat * 127.0), -127, 127).astype(np.int8)
+
+
+class _MicroBatcher:
+    """
+    Coalesces concurrent embed calls into one model forward pass. The first
+    request of a batch waits at most window_ms for others to join; a batch
+    closes early once it holds max_batch texts.
+    """
+
+    def __init__(self, encode, window_ms: float, max_batch: int):
+        self._encode = encode
+        self._window = window_ms / 1000.0
+        self._max_batch = max(1, max_batch)
+        self._queue: "queue.Queue[Tuple[List[str], Future]]" = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, texts: List[str]) -> Future:
+        fut: Future = Future()
+        if not texts:
+            fut.set_result([])
+            return fut
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+                    self._thread.start()
+        self._queue.put((texts, fut))
+        return fut
+
+    def _collect(self) -> List[Tuple[List[str], Future]]:
+        batch = [self._queue.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self._window
+        while size < self._max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            # callers cancelled while queued (aembed via asyncio.wrap_future) are dropped here
+            batch = [(item, fut) for item, fut in self._collect() if fut.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                self._resolve(batch)
+            except Exception as e:
+                # the thread must survive: every later embed call depends on it
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+
+    def _resolve(self, batch: List[Tuple[List[str], Future]]) -> None:
+        vecs = self._encode([t for item, _ in batch for t in item])
+        i = 0
+        for item, fut in batch:
+            if not fut.done():
+                fut.set_result(vecs[i:i + len(item)])
+            i += len(item)
+
+
+class LocalProvider:
+    """sentence-transformers on CPU; the model loads on the first embed call."""
+
+    def __init__(self, model: str = LOCAL_EMBED_MODEL, int8: bool = EMBED_INT8,
+                 window_ms: float = EMBED_BATCH_WINDOW_MS, max_batch: int = EMBED_MAX_BATCH):
+        self.model = model
+        self.int8 = int8
+        self.name = f"local:{model}" + (":int8" if int8 else "")
+        self.slug = model.rsplit("/", 1)[-1]
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._max_batch = max_batch
+        self._batcher = _MicroBatcher(self._encode, window_ms, max_batch)
+
+    def _load(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    # lazy: torch + transformers take seconds to import
+                    from sentence_transformers import SentenceTransformer
+                    self._model = SentenceTransformer(self.model, device="cpu")
+        return self._model
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        import numpy as np
+        mat = self._load().encode(
+            texts,
+            batch_size=self._max_batch,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+        if self.int8:
+            mat = quantize_int8(mat).astype(np.float32) / 127.0
+        return mat.astype(np.float32).tolist()
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return self._batcher.submit(texts).result()
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        # waits on the batcher thread, not on the shared blocking executor
+        return await asyncio.wrap_future(self._batcher.submit(texts))
+
+
+def get_provider() -> EmbeddingProvider:
+    def build():
+        if EMBED_PROVIDER == "local":
+            return LocalProvider()
+        if EMBED_PROVIDER != "openai":
+            raise ValueError(f"Unknown EMBED_PROVIDER: {EMBED_PROVIDER}")
+        return OpenAIProvider()
+    return _client("embed_provider", build)
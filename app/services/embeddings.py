@@ -0,0 +1,161 @@
+# app/services/embeddings.py
+import os, hashlib
+from array import array
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from app.services.embedding_providers import EmbeddingProvider, OPENAI_MODEL, get_provider
+from app.services.lru import LRUCache
+from app.services.redis_client import RedisBackoff
+from app.services.blocking_executor import run_blocking
+from app.services.metrics import external, count_embed_cache
+
+load_dotenv(override=True)
+
+EMBED_MODEL = OPENAI_MODEL
+
+CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "4096"))
+REDIS_TTL = int(os.getenv("EMBED_CACHE_TTL", str(30 * 24 * 3600)))
+REDIS_PREFIX = "emb:"
+
+# ---------- tier 1: in-process LRU ----------
+
+_lru = LRUCache(CACHE_SIZE)
+
+# ---------- tier 2: Redis (float32 bytes, int8 for int8 providers) ----------
+
+# Redis is only a cache here: after a failure, embed without it for a while
+_redis = RedisBackoff(decode_responses=False)
+
+
+def _pack(vec: List[float], int8: bool = False) -> bytes:
+    if int8:
+        return array("b", (round(x * 127) for x in vec)).tobytes()
+    return array("f", vec).tobytes()
+
+
+def _unpack(raw: bytes, int8: bool = False) -> List[float]:
+    a = array("b" if int8 else "f")
+    a.frombytes(raw)
+    return [x / 127 for x in a] if int8 else a.tolist()
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+
+def _redis_get_many(keys: List[str], int8: bool = False) -> Dict[str, List[float]]:
+    r = _redis.client()
+    if r is None or not keys:
+        return {}
+    try:
+        raws = r.mget([REDIS_PREFIX + k for k in keys])
+    except Exception:
+        _redis.failed()
+        return {}
+    return {k: _unpack(raw, int8) for k, raw in zip(keys, raws) if raw}
+
+
+def _redis_put_many(items: Dict[str, List[float]], int8: bool = False) -> None:
+    r = _redis.client()
+    if r is None or not items:
+        return
+    try:
+        pipe = r.pipeline(transaction=False)
+        for k, vec in items.items():
+            pipe.set(REDIS_PREFIX + k, _pack(vec, int8), ex=REDIS_TTL)
+        pipe.execute()
+    except Exception:
+        _redis.failed()
+
+def _from_lru(keys: List[str]) -> Dict[str, List[float]]:
+    found: Dict[str, List[float]] = {}
+    for k in keys:
+        if k not in found:
+            v = _lru.get(k)
+            if v is not None:
+                found[k] = v
+    return found
+
+
+def _from_redis(keys: List[str], int8: bool = False) -> Dict[str, List[float]]:
+    found = _redis_get_many(keys, int8)
+    for k, v in found.items():
+        _lru.put(k, v)
+    return found
+
+
+def _remember(fresh: Dict[str, List[float]], int8: bool = False) -> None:
+    for k, v in fresh.items():
+        _lru.put(k, v)
+    _redis_put_many(fresh, int8)
+
+
+def _missing(keys: List[str], found: Dict[str, List[float]]) -> List[str]:
+    return [k for k in dict.fromkeys(keys) if k not in found]
+
+
+# ---------- public API ----------
+
+def embed_texts(texts: List[str], provider: Optional[EmbeddingProvider] = None) -> List[List[float]]:
+    """
+    Embeds texts through the LRU -> Redis -> provider tiers.
+    Only cache misses (deduplicated) are sent to the provider; order is preserved.
+    """
+    provider = provider or get_provider()
+    keys = [cache_key(provider.name, t) for t in texts]
+    found = _from_lru(keys)
+    count_embed_cache("lru", len(found))
+
+    missing = _missing(keys, found)
+    if missing:
+        from_redis = _from_redis(missing, provider.int8)
+        count_embed_cache("redis", len(from_redis))
+        found.update(from_redis)
+
+    missing = _missing(keys, found)
+    if missing:
+        count_embed_cache("miss", len(missing))
+        text_of = dict(zip(keys, texts))
+        with external("embed", "embed", provider.name):
+            vecs = provider.embed([text_of[k] for k in missing])
+        fresh = dict(zip(missing, vecs))
+        _remember(fresh, provider.int8)
+        found.update(fresh)
+
+    return [found[k] for k in keys]
+
+
+def embed_text(text: str, provider: Optional[EmbeddingProvider] = None) -> List[float]:
+    return embed_texts([text], provider=provider)[0]
+
+
+async def aembed_texts(texts: List[str], provider: Optional[EmbeddingProvider] = None) -> List[List[float]]:
+    """Async twin of embed_texts (same cache tiers, provider.aembed for misses)."""
+    provider = provider or get_provider()
+    keys = [cache_key(provider.name, t) for t in texts]
+    found = _from_lru(keys)
+    count_embed_cache("lru", len(found))
+
+    missing = _missing(keys, found)
+    if missing:
+        from_redis = await run_blocking(_from_redis, missing, provider.int8)
+        count_embed_cache("redis", len(from_redis))
+        found.update(from_redis)
+
+    missing = _missing(keys, found)
+    if missing:
+        count_embed_cache("miss", len(missing))
+        text_of = dict(zip(keys, texts))
+        with external("embed", "embed", provider.name):
+            vecs = await provider.aembed([text_of[k] for k in missing])
+        fresh = dict(zip(missing, vecs))
+        await run_blocking(_remember, fresh, provider.int8)
+        found.update(fresh)
+
+    return [found[k] for k in keys]
+
+
+async def aembed_text(text: str, provider: Optional[EmbeddingProvider] = None) -> List[float]:
+    return (await aembed_texts([text], provider=provider))[0]
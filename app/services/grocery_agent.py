@@ -1,12 +1,4 @@
-import openai
-import os
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
-
-# Set OpenAI API key
-client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from app.config import get_openai
 
 def generate_grocery_list(meal_plan: str):
     """ Convert meal plan into a structured grocery list """
@@ -32,9 +24,7 @@ def generate_grocery_list(meal_plan: str):
     **Do not include:** section headers grams etc just number (Breakfast, Lunch, Dinner), calorie counts, or extra descriptions.
     """
 
-    client = openai.OpenAI()
-
-    response = client.chat.completions.create(
+    response = get_openai().chat.completions.create(
         model="gpt-4-turbo",
         messages=[
             {"role": "system", "content": "You are a structured grocery list generator."},
@@ -0,0 +1,185 @@
+# app/services/grocery_aggregate.py
+from functools import lru_cache
+from typing import Dict, Any, List, Tuple, Optional
+
+# ---------- precompiled normalization tables ----------
+
+_UNIT_ALIASES = {
+    "tablespoon": "tbsp", "tablespoons": "tbsp", "tbsp": "tbsp", "tbs": "tbsp", "tbsps": "tbsp",
+    "teaspoon": "tsp", "teaspoons": "tsp", "tsp": "tsp", "tsps": "tsp",
+    "cup": "cup", "cups": "cup",
+    "ml": "ml", "milliliter": "ml", "milliliters": "ml", "millilitre": "ml", "millilitres": "ml",
+    "l": "l", "liter": "l", "liters": "l", "litre": "l", "litres": "l",
+    "g": "grams", "gram": "grams", "grams": "grams", "gr": "grams",
+    "kg": "kg", "kilogram": "kg", "kilograms": "kg",
+    "oz": "oz", "ounce": "oz", "ounces": "oz",
+    "lb": "lb", "lbs": "lb", "pound": "lb", "pounds": "lb",
+    "clove": "cloves", "cloves": "cloves",
+    "count": "count", "piece": "count", "pieces": "count",
+}
+
+# canonical unit -> (dimension, factor to the dimension's base unit)
+_CONVERSIONS = {
+    "tsp": ("volume", 4.92892),
+    "tbsp": ("volume", 14.7868),
+    "cup": ("volume", 236.588),
+    "ml": ("volume", 1.0),
+    "l": ("volume", 1000.0),
+    "grams": ("mass", 1.0),
+    "kg": ("mass", 1000.0),
+    "oz": ("mass", 28.3495),
+    "lb": ("mass", 453.592),
+}
+_BASE_UNIT = {"volume": "ml", "mass": "grams"}
+
+_NAME_ALIASES = {
+    "tortilla": "tortillas",
+}
+
+_SKIP_UNITS = {"to taste", "taste"}
+
+
+@lru_cache(maxsize=4096)
+def norm_name(name: str) -> str:
+    n = (name or "").strip().lower()
+    if n.endswith("tortilla") or n.endswith("tortillas"):
+        return "tortillas"
+    return _NAME_ALIASES.get(n, n)
+
+
+@lru_cache(maxsize=512)
+def norm_unit(unit: str) -> str:
+    u = (unit or "").strip().lower()
+    return _UNIT_ALIASES.get(u, u or "unit")
+
+
+def _qty(qty: Any) -> float:
+    try:
+        return float(qty) if qty not in (None, "") else 1.0
+    except Exception:
+        return 1.0
+
+
+# ---------- per-recipe parsing (done once per recipe in batch mode) ----------
+
+# (name, unit bucket, source unit, qty in bucket units)
+_Line = Tuple[str, str, str, float]
+
+
+def _recipe_lines(r: Dict[str, Any]) -> List[_Line]:
+    lines: List[_Line] = []
+    for ing in (r.get("ingredients") or []):
+        if not isinstance(ing, dict):
+            continue
+        name = norm_name(str(ing.get("name", "")))
+        unit = norm_unit(str(ing.get("unit") or "unit"))
+        if not name or unit in _SKIP_UNITS:
+            continue
+        qty = _qty(ing.get("qty"))
+        conv = _CONVERSIONS.get(unit)
+        if conv:
+            dim, factor = conv
+            lines.append((name, _BASE_UNIT[dim], unit, qty * factor))
+        else:
+            lines.append((name, unit, unit, qty))
+    return lines
+
+
+class _Accumulator:
+    """Totals keyed by a single int per (name, unit bucket)."""
+
+    def __init__(self, ids: Dict[Tuple[str, str], int]):
+        self._ids = ids  # shared interning table in batch mode
+        self.totals: Dict[int, float] = {}
+        self.sources: Dict[int, set] = {}
+
+    def add(self, lines: List[_Line]) -> None:
+        ids = self._ids
+        totals = self.totals
+        for name, bucket, source, qty in lines:
+            k = ids.get((name, bucket))
+            if k is None:
+                k = ids[(name, bucket)] = len(ids)
+            if k in totals:
+                totals[k] += qty
+                self.sources[k].add(source)
+            else:
+                totals[k] = qty
+                self.sources[k] = {source}
+
+    def result(self, keys: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        grocery = []
+        for k, qty in self.totals.items():
+            name, bucket = keys[k]
+            unit = bucket
+            srcs = self.sources[k]
+            if len(srcs) == 1 and bucket in _BASE_UNIT.values():
+                # a single source unit: report it in that unit, not the base unit
+                unit = next(iter(srcs))
+                qty = qty / _CONVERSIONS[unit][1]
+            grocery.append({"name": name, "qty": round(qty, 2), "unit": unit})
+        grocery.sort(key=lambda x: x["name"])
+        return grocery
+
+
+def _keys(ids: Dict[Tuple[str, str], int]) -> List[Tuple[str, str]]:
+    keys: List[Optional[Tuple[str, str]]] = [None] * len(ids)
+    for pair, k in ids.items():
+        keys[k] = pair
+    return keys
+
+
+# ---------- public API ----------
+
+def aggregate_groceries(used_recipe_ids: List[str], recipe_by_id: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Combines ingredients of the used recipes into one grocery list.
+    Compatible units are merged (tsp/tbsp/cup/ml/l -> ml, g/kg/oz/lb -> grams);
+    "to taste" items are dropped; a missing qty counts as 1.
+    """
+    ids: Dict[Tuple[str, str], int] = {}
+    acc = _Accumulator(ids)
+    for rid in used_recipe_ids:
+        acc.add(_recipe_lines(recipe_by_id.get(rid) or {}))
+    return acc.result(_keys(ids))
+
+
+def aggregate_many(
+    plans: List[List[str]],
+    recipe_by_id: Dict[str, Any],
+    combined: bool = False,
+) -> Dict[str, Any]:
+    """
+    Batch aggregation for many plans (e.g. a household): every recipe is parsed
+    once no matter how many plans use it. Returns {"plans": [grocery_list, ...]}
+    plus "combined" (one roll-up over all plans) when requested.
+    """
+    ids: Dict[Tuple[str, str], int] = {}
+    parsed: Dict[str, List[_Line]] = {}
+
+    def lines(rid: str) -> List[_Line]:
+        ls = parsed.get(rid)
+        if ls is None:
+            ls = parsed[rid] = _recipe_lines(recipe_by_id.get(rid) or {})
+        return ls
+
+    per_plan = []
+    total = _Accumulator(ids) if combined else None
+    for used in plans:
+        acc = _Accumulator(ids)
+        for rid in used:
+            ls = lines(rid)
+            acc.add(ls)
+            if total is not None:
+                total.add(ls)
+        per_plan.append(acc)
+
+    keys = _keys(ids)
+    out: Dict[str, Any] = {"plans": [acc.result(keys) for acc in per_plan]}
+    if total is not None:
+        out["combined"] = total.result(keys)
+    return out
+
+
+def to_kroger_payload(grocery_list: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [{"name": g["name"], "quantity": g["qty"], "unit": g["unit"]} for g in grocery_list]
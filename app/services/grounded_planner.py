@@ -1,77 +1,25 @@
 # app/services/grounded_planner.py
-import os, json
-from typing import Dict, Any, List
-from collections import defaultdict
+import json, asyncio
+from typing import Dict, Any, List, Optional
 from dotenv import load_dotenv
-from openai import OpenAI
 
-from app.services.recipe_corpus import retrieve_recipes_for_request
-from app.services.user_memory import retrieve_memory
+from app.config import PLANNER_BACKEND, get_openai, get_async_openai
+from app.services.grocery_aggregate import aggregate_groceries, to_kroger_payload
+from app.services.local_planner import plan_with_optional_polish, aplan_with_optional_polish
+from app.services.metrics import traced, stage
+from app.services.plan_cache import cached_plan, acached_plan
+from app.services.plan_stream import Emit, GroundedDays, astream_json_days
+from app.services.recipe_corpus import retrieve_recipes_for_request, aretrieve_recipes_for_request
+from app.services.user_memory import retrieve_memory, aretrieve_memory, MEMORY_PROBE
 
 load_dotenv(override=True)
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-
-def _norm_name(name: str) -> str:
-    n = (name or "").strip().lower()
-    # singularize a few common plurals (cheap + effective)
-    if n.endswith("tortillas"):
-        n = "tortillas"
-    elif n.endswith("tortilla"):
-        n = "tortillas"
-    # optional: normalize other easy ones
-    return n
-
-def _norm_unit(unit: str) -> str:
-    u = (unit or "").strip().lower()
-    mapping = {
-        "tbsp": "tbsp",
-        "tablespoon": "tbsp",
-        "tablespoons": "tbsp",
-        "tsp": "tsp",
-        "teaspoon": "tsp",
-        "teaspoons": "tsp",
-        "clove": "cloves",
-        "cloves": "cloves",
-        "gram": "grams",
-        "g": "grams",
-        "grams": "grams",
-        "ml": "ml",
-        "l": "l",
-        "count": "count",
-    }
-    return mapping.get(u, u or "unit")
-
-
-def _aggregate_grocery_list(used_recipe_ids: List[str], recipe_by_id: Dict[str, Any]) -> List[Dict[str, Any]]:
-    totals = defaultdict(lambda: defaultdict(float))  # totals[name][unit] -> qty
-
-    for rid in used_recipe_ids:
-        r = recipe_by_id.get(rid) or {}
-        for ing in r.get("ingredients", []) or []:
-            name = _norm_name(str(ing.get("name", "")))
-            unit = _norm_unit(str(ing.get("unit") or "unit"))
-
-            qty = ing.get("qty")
-
-            
-            try:
-                qty_val = float(qty) if qty not in (None, "") else 1.0
-            except Exception:
-                qty_val = 1.0
 
-            if name:
-                totals[name][unit] += qty_val
 
-    grocery = []
-    for name, units in totals.items():
-        for unit, qty in units.items():
-            grocery.append({"name": name, "qty": round(qty, 2), "unit": unit})
+def _min_candidates(days: int) -> int:
+    return max(5, min(15, days * 3))
 
-    grocery.sort(key=lambda x: x["name"])
-    return grocery
 
-def build_grounded_meal_plan(payload: Dict[str, Any]) -> Dict[str, Any]:
+def _resolve_request(payload: Dict[str, Any]):
     prefs = payload.get("preferences") or payload
 
     user_id = (
@@ -80,30 +28,12 @@ def build_grounded_meal_plan(payload: Dict[str, Any]) -> Dict[str, Any]:
         or prefs.get("user_id")
         or prefs.get("chat_id")
     )
-    if not user_id:
-        return {"error": "Missing user_id (or chat_id) in request payload."}
-
     days = int(prefs.get("days") or payload.get("days") or 3)
+    return prefs, user_id, days
 
-    # 1) Retrieve candidate recipes (personalized via filter inside retrieve_recipes_for_request)
-    candidates = retrieve_recipes_for_request(str(user_id), prefs, top_k=50)
 
-   
-
-    if len(candidates) < max(5, min(15, days * 3)):
-        return {
-            "error": "Not enough recipes in corpus. Call /recipes/generate-and-store with a larger count first.",
-            "retrieved": len(candidates),
-        }
-
-    # 2) Retrieve user memory and inject into planning
-    memory = retrieve_memory(
-        str(user_id),
-        query="Food preferences, dislikes, time constraints, favorite cuisines, and feedback",
-        top_k=6,
-    )
-
-    # 3) Provide only needed fields to model
+def _schedule_messages(days: int, candidates: List[Dict[str, Any]], memory: List[str]) -> List[Dict[str, str]]:
+    # Provide only needed fields to model
     provided = []
     for r in candidates:
         provided.append({
@@ -115,9 +45,7 @@ def build_grounded_meal_plan(payload: Dict[str, Any]) -> Dict[str, Any]:
         })
 
     allowed_ids = [r["id"] for r in candidates]
-    recipe_by_id = {r["id"]: r for r in candidates}
 
-    # 4) LLM compiles ONLY schedule 
     prompt = {
         "task": "Create a meal plan grounded ONLY in provided_recipes.",
         "days": days,
@@ -139,20 +67,19 @@ def build_grounded_meal_plan(payload: Dict[str, Any]) -> Dict[str, Any]:
         }
     }
 
-    resp = client.chat.completions.create(
-        model="gpt-4-turbo",
-        temperature=0.2,
-        response_format={"type": "json_object"},
-        messages=[
-            {"role": "system", "content": "You are a grounded meal planner. Use only allowed_recipe_ids."},
-            {"role": "user", "content": json.dumps(prompt)},
-        ],
-    )
+    return [
+        {"role": "system", "content": "You are a grounded meal planner. Use only allowed_recipe_ids."},
+        {"role": "user", "content": json.dumps(prompt)},
+    ]
 
-    plan = json.loads(resp.choices[0].message.content)
+
+def _finalize_plan(plan: Dict[str, Any], candidates: List[Dict[str, Any]], memory: List[str]) -> Dict[str, Any]:
     plan.setdefault("audit", {})
 
-    # 5) Hard validation: recipe_ids must be subset of retrieved ids
+    allowed_ids = [r["id"] for r in candidates]
+    recipe_by_id = {r["id"]: r for r in candidates}
+
+    # Hard validation: recipe_ids must be subset of retrieved ids
     used_ids = set()
     for d in plan.get("days", []):
         for m in d.get("meals", []):
@@ -173,11 +100,117 @@ def build_grounded_meal_plan(payload: Dict[str, Any]) -> Dict[str, Any]:
     plan["audit"]["retrieved_recipe_ids"] = allowed_ids
     plan["audit"]["memory_used"] = memory
 
-    # 6) Deterministic groceries + Kroger payload
-    grocery_list = _aggregate_grocery_list(plan["audit"]["used_recipe_ids"], recipe_by_id)
-    kroger_payload = [{"name": g["name"], "quantity": g["qty"], "unit": g["unit"]} for g in grocery_list]
+    # Deterministic groceries + Kroger payload
+    grocery_list = aggregate_groceries(plan["audit"]["used_recipe_ids"], recipe_by_id)
+    kroger_payload = to_kroger_payload(grocery_list)
 
     plan["grocery_list"] = grocery_list
     plan["kroger_payload"] = kroger_payload
 
     return plan
+
+
+def _not_enough(candidates: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "error": "Not enough recipes in corpus. Call /recipes/generate-and-store with a larger count first.",
+        "retrieved": len(candidates),
+    }
+
+
+@traced("grounded")
+def build_grounded_meal_plan(payload: Dict[str, Any]) -> Dict[str, Any]:
+    prefs, user_id, days = _resolve_request(payload)
+    if not user_id:
+        return {"error": "Missing user_id (or chat_id) in request payload."}
+
+    # 1) Retrieve candidate recipes (personalized via filter inside retrieve_recipes_for_request)
+    with stage("candidates"):
+        candidates = retrieve_recipes_for_request(str(user_id), prefs, top_k=50)
+
+    if len(candidates) < _min_candidates(days):
+        return _not_enough(candidates)
+
+    # 2) Retrieve user memory and inject into planning
+    with stage("memory"):
+        memory = retrieve_memory(str(user_id), query=MEMORY_PROBE, top_k=6)
+
+    # 3) Schedule: local solver by default, LLM when PLANNER_BACKEND=llm (cached per profile)
+    def schedule() -> Dict[str, Any]:
+        if PLANNER_BACKEND == "llm":
+            resp = get_openai().chat.completions.create(
+                model="gpt-4-turbo",
+                temperature=0.2,
+                response_format={"type": "json_object"},
+                messages=_schedule_messages(days, candidates, memory),
+            )
+            return json.loads(resp.choices[0].message.content)
+        return plan_with_optional_polish(user_id=str(user_id), prefs={**prefs, "days": days}, candidates=candidates, memory=memory)
+
+    with stage("scheduling"):
+        plan = cached_plan(prefs, days, candidates, memory, schedule)
+
+    # 4) Validate grounding, attach audit and groceries
+    with stage("groceries"):
+        return _finalize_plan(plan, candidates, memory)
+
+
+@traced("grounded")
+async def abuild_grounded_meal_plan(payload: Dict[str, Any], on_event: Optional[Emit] = None) -> Dict[str, Any]:
+    """
+    Async build_grounded_meal_plan: recipe retrieval and memory retrieval are
+    independent, so both run concurrently before the single LLM call.
+    on_event (see plan_stream) receives stage, day and grocery events as they happen.
+    """
+    emit = on_event or (lambda event, data: None)
+    prefs, user_id, days = _resolve_request(payload)
+    if not user_id:
+        return {"error": "Missing user_id (or chat_id) in request payload."}
+
+    async def recipes() -> List[Dict[str, Any]]:
+        with stage("candidates"):
+            found = await aretrieve_recipes_for_request(str(user_id), prefs, top_k=50)
+        emit("stage", {"stage": "candidates", "count": len(found)})
+        return found
+
+    async def user_memory() -> List[str]:
+        with stage("memory"):
+            found = await aretrieve_memory(str(user_id), query=MEMORY_PROBE, top_k=6)
+        emit("stage", {"stage": "memory", "count": len(found)})
+        return found
+
+    candidates, memory = await asyncio.gather(recipes(), user_memory())
+
+    if len(candidates) < _min_candidates(days):
+        return _not_enough(candidates)
+
+    # days go out only once their recipe_ids are known to be retrieved ones
+    on_day = GroundedDays(on_event, candidates)
+
+    async def schedule() -> Dict[str, Any]:
+        if PLANNER_BACKEND == "llm":
+            messages = _schedule_messages(days, candidates, memory)
+            if on_event:
+                return await astream_json_days(
+                    get_async_openai(), messages, on_day,
+                    model="gpt-4-turbo", temperature=0.2, response_format={"type": "json_object"},
+                )
+            resp = await get_async_openai().chat.completions.create(
+                model="gpt-4-turbo",
+                temperature=0.2,
+                response_format={"type": "json_object"},
+                messages=messages,
+            )
+            return json.loads(resp.choices[0].message.content)
+        return await aplan_with_optional_polish(user_id=str(user_id), prefs={**prefs, "days": days}, candidates=candidates, memory=memory)
+
+    emit("stage", {"stage": "scheduling"})
+    with stage("scheduling"):
+        plan = await acached_plan(prefs, days, candidates, memory, schedule)
+
+    with stage("groceries"):
+        result = _finalize_plan(plan, candidates, memory)
+    if "grocery_list" in result:
+        # cache hits and the local solver produce the whole plan at once
+        on_day.finish(result)
+        emit("groceries", {"grocery_list": result["grocery_list"], "kroger_payload": result["kroger_payload"]})
+    return result
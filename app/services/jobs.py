@@ -0,0 +1,378 @@
+# app/services/jobs.py
+"""
+Redis-backed background jobs.
+
+    jobs:queue            list of job ids (LPUSH / BRPOPLPUSH)
+    jobs:processing       ids taken by a worker, until the run ends
+    jobs:lease:<id>       worker token with a short TTL, renewed while the job runs
+    jobs:delayed          zset job id -> run_at, promoted to the queue by workers
+    job:<id>              hash: kind, status, payload, result, error, progress, attempts, timestamps
+    jobs:dedupe:<key>     idempotency key -> job id, so concurrent requests share one job
+    jobs:debounce:<key>   key -> scheduled job id, whose delay restarts on every call
+    lock:<name>           short-lived distributed lock (SET NX PX + token-checked release)
+
+A worker that dies mid-job stops renewing its lease. Other workers requeue
+jobs left in jobs:processing without a lease, and enqueue treats a running
+job without a lease as finished, so a dedupe key never pins a dead job.
+
+Worker:
+    python -m app.services.jobs --concurrency 2
+"""
+import sys, json, time, uuid, signal, argparse, importlib, threading
+from typing import Dict, Any, Optional, Callable
+
+from app.config import JOB_TTL_SECONDS, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS
+from app.services.redis_client import get_redis
+from app.services.llm_gateway import llm_priority, BACKGROUND
+
+QUEUE_KEY = "jobs:queue"
+PROCESSING_KEY = "jobs:processing"
+DELAYED_KEY = "jobs:delayed"
+LEASE_PREFIX = "jobs:lease:"
+
+# kind -> "module:function"; handlers are imported lazily (they pull in OpenAI/Pinecone)
+HANDLERS = {
+    "bootstrap": "app.services.meal_agent_smart:run_bootstrap_job",
+    "warmup": "app.services.corpus_warmup:run_warmup_job",
+}
+
+_RELEASE_LUA = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+
+# KEYS: dedupe key, new job hash, queue. ARGV: new job id, ttl, now, kind, payload, dedupe key.
+# Returns the hash of the live job holding the key. Otherwise (no holder, or
+# it finished, expired or lost its lease) creates and queues the new job and
+# points the key at it, all in one step, so the key never names a missing job.
+_DEDUPE_LUA = """
+local cur = redis.call('get', KEYS[1])
+if cur then
+  local status = redis.call('hget', 'job:' .. cur, 'status')
+  if status == 'queued' or (status == 'running' and redis.call('exists', 'jobs:lease:' .. cur) == 1) then
+    return redis.call('hgetall', 'job:' .. cur)
+  end
+end
+redis.call('hset', KEYS[2], 'id', ARGV[1], 'kind', ARGV[4], 'status', 'queued', 'payload', ARGV[5], 'dedupe_key', ARGV[6], 'created', ARGV[3])
+redis.call('expire', KEYS[2], ARGV[2])
+redis.call('lpush', KEYS[3], ARGV[1])
+redis.call('set', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return false
+"""
+
+# KEYS: delayed zset, queue, job hash. ARGV: job id. Moves one due job to the queue;
+# the ZREM decides which worker owns the promotion.
+_PROMOTE_LUA = """
+if redis.call('zrem', KEYS[1], ARGV[1]) == 0 then return 0 end
+redis.call('hset', KEYS[3], 'status', 'queued')
+redis.call('lpush', KEYS[2], ARGV[1])
+return 1
+"""
+
+# KEYS: delayed zset, job hash. ARGV: job id, run_at, payload.
+# Delays a job that is still waiting; 0 once a worker has promoted it.
+_DEBOUNCE_LUA = """
+if redis.call('hget', KEYS[2], 'status') ~= 'scheduled' or not redis.call('zscore', KEYS[1], ARGV[1]) then
+  return 0
+end
+redis.call('zadd', KEYS[1], ARGV[2], ARGV[1])
+redis.call('hset', KEYS[2], 'payload', ARGV[3], 'run_at', ARGV[2])
+return 1
+"""
+
+# KEYS: job hash, lease. ARGV: token, lease ms, now, max attempts.
+# 1 = claimed, 0 = not queued (already taken / finished), -1 = out of attempts.
+_CLAIM_LUA = """
+if redis.call('hget', KEYS[1], 'status') ~= 'queued' then return 0 end
+if redis.call('hincrby', KEYS[1], 'attempts', 1) > tonumber(ARGV[4]) then
+  redis.call('hset', KEYS[1], 'status', 'failed', 'error', 'worker died during every attempt', 'finished', ARGV[3])
+  return -1
+end
+redis.call('hset', KEYS[1], 'status', 'running', 'started', ARGV[3])
+redis.call('set', KEYS[2], ARGV[1], 'PX', ARGV[2])
+return 1
+"""
+
+# KEYS: processing, queue, job hash, lease. ARGV: job id.
+# Requeues a job whose worker is gone; only one reclaimer wins the LREM.
+_RECLAIM_LUA = """
+if redis.call('exists', KEYS[4]) == 1 then return 0 end
+if redis.call('lrem', KEYS[1], 0, ARGV[1]) == 0 then return 0 end
+local status = redis.call('hget', KEYS[3], 'status')
+if status == 'queued' or status == 'running' then
+  redis.call('hset', KEYS[3], 'status', 'queued')
+  redis.call('lpush', KEYS[2], ARGV[1])
+  return 1
+end
+return 0
+"""
+
+
+def _job_key(job_id: str) -> str:
+    return f"job:{job_id}"
+
+
+def _dump(v: Any) -> str:
+    return json.dumps(v, default=str)
+
+# ---------- producer side ----------
+
+def enqueue(kind: str, payload: Dict[str, Any], dedupe_key: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Queues a job and returns its handle. With dedupe_key, a job for the same
+    key that is still queued or running is returned instead of a new one.
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+
+    r = get_redis()
+    job_id = uuid.uuid4().hex
+    now = time.time()
+
+    if dedupe_key:
+        # one script: return the live holder, or create the job and take the key over
+        existing = r.eval(_DEDUPE_LUA, 3, f"jobs:dedupe:{dedupe_key}", _job_key(job_id), QUEUE_KEY,
+                          job_id, JOB_TTL_SECONDS, now, kind, _dump(payload), dedupe_key)
+        if existing:
+            return {**_job_from_hash(dict(zip(existing[::2], existing[1::2]))), "deduplicated": True}
+        return {"id": job_id, "kind": kind, "status": "queued", "created": now, "deduplicated": False}
+
+    pipe = r.pipeline()
+    pipe.hset(_job_key(job_id), mapping={
+        "id": job_id,
+        "kind": kind,
+        "status": "queued",
+        "payload": _dump(payload),
+        "dedupe_key": "",
+        "created": now,
+    })
+    pipe.expire(_job_key(job_id), JOB_TTL_SECONDS)
+    pipe.lpush(QUEUE_KEY, job_id)
+    pipe.execute()
+    return {"id": job_id, "kind": kind, "status": "queued", "created": now, "deduplicated": False}
+
+
+def schedule_debounced(kind: str, payload: Dict[str, Any], debounce_key: str, delay_seconds: float) -> Dict[str, Any]:
+    """
+    Runs `kind` once, delay_seconds after the LAST call for debounce_key:
+    while the job is still waiting, each call replaces its payload and
+    pushes its start time back. Once it has started, the next call
+    schedules a new job.
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+
+    r = get_redis()
+    run_at = time.time() + delay_seconds
+    dkey = f"jobs:debounce:{debounce_key}"
+
+    existing = r.get(dkey)
+    # only if it is still waiting: checked and updated in one script, so a worker cannot promote it in between
+    if existing and r.eval(_DEBOUNCE_LUA, 2, DELAYED_KEY, _job_key(existing), existing, run_at, _dump(payload)):
+        return {"id": existing, "kind": kind, "status": "scheduled", "run_at": run_at, "debounced": True}
+
+    job_id = uuid.uuid4().hex
+    pipe = r.pipeline()
+    pipe.hset(_job_key(job_id), mapping={
+        "id": job_id,
+        "kind": kind,
+        "status": "scheduled",
+        "payload": _dump(payload),
+        "debounce_key": debounce_key,
+        "created": time.time(),
+        "run_at": run_at,
+    })
+    pipe.expire(_job_key(job_id), JOB_TTL_SECONDS)
+    pipe.set(dkey, job_id, ex=JOB_TTL_SECONDS)
+    pipe.zadd(DELAYED_KEY, {job_id: run_at})
+    pipe.execute()
+    return {"id": job_id, "kind": kind, "status": "scheduled", "run_at": run_at, "debounced": False}
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    raw = get_redis().hgetall(_job_key(job_id))
+    return _job_from_hash(raw) if raw else None
+
+
+def _job_from_hash(raw: Dict[str, str]) -> Dict[str, Any]:
+    job: Dict[str, Any] = {
+        "id": raw.get("id"),
+        "kind": raw.get("kind"),
+        "status": raw.get("status"),
+        "created": float(raw.get("created") or 0),
+    }
+    for f in ("run_at", "started", "finished"):
+        if raw.get(f):
+            job[f] = float(raw[f])
+    for f in ("progress", "result"):
+        if raw.get(f):
+            job[f] = json.loads(raw[f])
+    if raw.get("error"):
+        job["error"] = raw["error"]
+    return job
+
+
+def job_handle(job: Dict[str, Any]) -> Dict[str, Any]:
+    """What API responses expose for polling."""
+    return {"job_id": job["id"], "status": job["status"], "status_url": f"/jobs/{job['id']}"}
+
+# ---------- distributed lock ----------
+
+class Lock:
+    """SET NX lock with a per-holder token; expires on its own if the holder dies."""
+
+    def __init__(self, name: str, ttl_seconds: float):
+        self.key = f"lock:{name}"
+        self.ttl_ms = int(ttl_seconds * 1000)
+        self.token = uuid.uuid4().hex
+        self._r = get_redis()
+
+    def acquire(self) -> bool:
+        return bool(self._r.set(self.key, self.token, nx=True, px=self.ttl_ms))
+
+    def release(self) -> None:
+        self._r.eval(_RELEASE_LUA, 1, self.key, self.token)
+
+    def __enter__(self) -> "Lock":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+# ---------- worker side ----------
+
+def _handler(kind: str) -> Callable[[Dict[str, Any], Callable[[Dict[str, Any]], None]], Dict[str, Any]]:
+    module, fn = HANDLERS[kind].split(":")
+    return getattr(importlib.import_module(module), fn)
+
+
+def _heartbeat(r, lease_key: str, token: str, done: threading.Event) -> None:
+    while not done.wait(JOB_LEASE_SECONDS / 3):
+        try:
+            r.set(lease_key, token, px=JOB_LEASE_SECONDS * 1000, xx=True)
+        except Exception as e:
+            print("Job worker: lease renewal failed:", e, file=sys.stderr)
+
+
+def run_job(job_id: str) -> None:
+    r = get_redis()
+    key = _job_key(job_id)
+    lease_key = LEASE_PREFIX + job_id
+    token = uuid.uuid4().hex
+    try:
+        claimed = r.eval(_CLAIM_LUA, 2, key, lease_key, token, JOB_LEASE_SECONDS * 1000, time.time(), JOB_MAX_ATTEMPTS)
+        raw = r.hgetall(key) if claimed else {}
+        if claimed == -1 and raw.get("dedupe_key"):
+            r.eval(_RELEASE_LUA, 1, f"jobs:dedupe:{raw['dedupe_key']}", job_id)
+        if claimed != 1 or not raw:
+            return
+        _run_claimed(r, job_id, raw, lease_key, token)
+    finally:
+        r.lrem(PROCESSING_KEY, 0, job_id)
+
+
+def _run_claimed(r, job_id: str, raw: Dict[str, str], lease_key: str, token: str) -> None:
+    key = _job_key(job_id)
+    done = threading.Event()
+    threading.Thread(target=_heartbeat, args=(r, lease_key, token, done), name=f"lease-{job_id[:8]}", daemon=True).start()
+
+    if raw.get("debounce_key"):
+        # from now on a new call schedules a fresh job instead of delaying this one
+        r.eval(_RELEASE_LUA, 1, f"jobs:debounce:{raw['debounce_key']}", job_id)
+    last = [0.0]
+
+    def progress(p: Dict[str, Any]) -> None:
+        # throttled: handlers may report on every batch
+        now = time.time()
+        if now - last[0] >= 0.5:
+            last[0] = now
+            r.hset(key, "progress", _dump(p))
+
+    try:
+        # job LLM calls queue behind interactive requests (llm_gateway)
+        with llm_priority(BACKGROUND):
+            result = _handler(raw["kind"])(json.loads(raw.get("payload") or "{}"), progress)
+        r.hset(key, mapping={"status": "done", "result": _dump(result), "finished": time.time()})
+    except Exception as e:
+        r.hset(key, mapping={"status": "failed", "error": str(e), "finished": time.time()})
+    finally:
+        done.set()
+        r.eval(_RELEASE_LUA, 1, lease_key, token)
+        if raw.get("dedupe_key"):
+            # the next request for this key may start a fresh job
+            r.eval(_RELEASE_LUA, 1, f"jobs:dedupe:{raw['dedupe_key']}", job_id)
+
+
+class _Reclaimer:
+    """
+    Requeues jobs left in jobs:processing by dead workers. An id is requeued
+    only if it had no lease on two passes a lease period apart, so a job that
+    was just taken (lease not set yet) is never mistaken for an orphan.
+    """
+
+    def __init__(self):
+        self._suspects: set = set()
+        self._next = 0.0
+
+    def __call__(self, r) -> None:
+        now = time.time()
+        if now < self._next:
+            return
+        self._next = now + JOB_LEASE_SECONDS
+        ids = r.lrange(PROCESSING_KEY, 0, -1)
+        if not ids:
+            self._suspects = set()
+            return
+        leased = r.mget([LEASE_PREFIX + i for i in ids])
+        orphans = {i for i, lease in zip(ids, leased) if not lease}
+        for job_id in orphans & self._suspects:
+            if r.eval(_RECLAIM_LUA, 4, PROCESSING_KEY, QUEUE_KEY, _job_key(job_id), LEASE_PREFIX + job_id, job_id):
+                print(f"Job worker: requeued orphaned job {job_id}", file=sys.stderr)
+        self._suspects = orphans
+
+
+def _promote_due(r) -> None:
+    for job_id in r.zrangebyscore(DELAYED_KEY, "-inf", time.time(), start=0, num=50):
+        # one script per job: a crash between the ZREM and the LPUSH cannot lose it
+        r.eval(_PROMOTE_LUA, 3, DELAYED_KEY, QUEUE_KEY, _job_key(job_id), job_id)
+
+
+def work(stop: threading.Event, poll_seconds: int = 1) -> None:
+    r = get_redis()
+    reclaim = _Reclaimer()
+    while not stop.is_set():
+        try:
+            _promote_due(r)
+            reclaim(r)
+            # the id stays in jobs:processing until run_job ends, so a crash cannot lose it
+            job_id = r.brpoplpush(QUEUE_KEY, PROCESSING_KEY, timeout=poll_seconds)
+        except Exception as e:
+            print("Job worker: redis error:", e, file=sys.stderr)
+            stop.wait(poll_seconds)
+            continue
+        if job_id:
+            try:
+                run_job(job_id)
+            except Exception as e:
+                # redis failed mid-run: the id may be left in jobs:processing, the reclaimer requeues it
+                print(f"Job worker: job {job_id} interrupted:", e, file=sys.stderr)
+
+
+def start_workers(n: int, stop: threading.Event) -> None:
+    for i in range(n):
+        threading.Thread(target=work, args=(stop,), name=f"jobs-{i}", daemon=True).start()
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Run background job workers.")
+    ap.add_argument("--concurrency", type=int, default=2)
+    args = ap.parse_args(argv)
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    start_workers(args.concurrency, stop)
+    print(f"Job workers running ({args.concurrency}); queue={QUEUE_KEY}", file=sys.stderr)
+    stop.wait()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
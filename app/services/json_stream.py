@@ -0,0 +1,83 @@
+# app/services/json_stream.py
+import json, re
+from typing import Any, Dict, List, Optional
+
+
+class JsonArrayStream:
+    """
+    Incremental parser for streamed JSON completions such as
+        {"recipes": [ {...}, {...}, ...
+    feed() takes the next text chunk and returns every object of the target
+    array that became complete, so callers can act on each element before
+    the completion finishes. key=None targets the first array in the text.
+    """
+
+    def __init__(self, key: Optional[str] = None):
+        self._start_re = re.compile(r'"%s"\s*:\s*\[' % re.escape(key)) if key else re.compile(r"\[")
+        self._buf = ""
+        self._i = 0
+        self._in_array = False
+        self._closed = False
+        self._depth = 0
+        self._obj_start = -1
+        self._in_string = False
+        self._escape = False
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        if self._closed or not chunk:
+            return []
+        self._buf += chunk
+
+        if not self._in_array:
+            m = self._start_re.search(self._buf)
+            if not m:
+                return []
+            self._in_array = True
+            self._i = m.end()
+
+        out: List[Dict[str, Any]] = []
+        buf = self._buf
+        i = self._i
+        while i < len(buf):
+            c = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = True
+            elif c in "{[":
+                if self._depth == 0:
+                    self._obj_start = i
+                self._depth += 1
+            elif c in "}]":
+                if self._depth == 0:
+                    # end of the target array
+                    self._closed = True
+                    i += 1
+                    break
+                self._depth -= 1
+                if self._depth == 0 and self._obj_start >= 0:
+                    try:
+                        item = json.loads(buf[self._obj_start : i + 1])
+                    except ValueError:
+                        item = None
+                    if isinstance(item, dict):
+                        out.append(item)
+                    self._obj_start = -1
+            i += 1
+
+        # drop consumed text so long streams stay cheap
+        keep = self._obj_start if self._obj_start >= 0 else i
+        self._buf = buf[keep:]
+        self._i = i - keep
+        if self._obj_start >= 0:
+            self._obj_start = 0
+        return out
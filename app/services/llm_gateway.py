@@ -0,0 +1,446 @@
+# app/services/llm_gateway.py
+import time, math, heapq, random, asyncio, threading, itertools, contextvars, contextlib
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, List, Optional, Iterator
+
+from fastapi import HTTPException
+
+from app.config import (
+    LLM_RPM, LLM_TPM, LLM_MAX_CONCURRENCY, LLM_COMPLETION_ESTIMATE,
+    LLM_QUEUE_TIMEOUT, LLM_BACKGROUND_QUEUE_TIMEOUT,
+    LLM_MAX_RETRIES, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX,
+)
+from app.services.metrics import registry
+
+# One gateway per process in front of the OpenAI clients (config.get_openai /
+# get_async_openai wrap them), so every chat completion is:
+#   - admitted against requests/min and tokens/min buckets and a concurrency
+#     cap, strictly in priority order (interactive before background);
+#   - retried on 429 / 5xx / connection errors with jittered exponential
+#     backoff, never sooner than the provider's Retry-After. A 429 also pauses
+#     admission for every caller, so a rate-limit storm backs off together.
+# Embedding calls get the retries but not the admission budgets.
+
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+_priority: contextvars.ContextVar[int] = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+
+registry.describe("mealplan_llm_queue_depth", "gauge", "LLM calls waiting for admission.")
+registry.describe("mealplan_llm_in_flight", "gauge", "LLM calls admitted and not yet finished.")
+registry.describe("mealplan_llm_queue_wait_seconds", "histogram", "Time LLM calls waited for admission.")
+registry.describe("mealplan_llm_retries_total", "counter", "Retried LLM calls by reason.")
+registry.describe("mealplan_llm_queue_timeouts_total", "counter", "LLM calls rejected after waiting too long for admission.")
+
+
+@contextlib.contextmanager
+def llm_priority(level: int) -> Iterator[None]:
+    """LLM calls made inside (and in run_blocking / copied-context threads) queue at this priority."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class LLMQueueTimeout(HTTPException):
+    """503 + Retry-After: the call could not be admitted within its queue timeout."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(
+            status_code=503,
+            detail="LLM capacity exhausted, retry shortly.",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+
+class _Bucket:
+    """Token bucket holding one minute of budget, refilled continuously. per_minute <= 0 disables it."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self._t = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self._t) * self.rate)
+        self._t = now
+
+    def wait(self, n: float, now: float) -> float:
+        """Seconds until n can be taken (n is capped at capacity so oversized calls still pass)."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        n = min(n, self.capacity)
+        return 0.0 if self.level >= n else (n - self.level) / self.rate
+
+    def take(self, n: float) -> None:
+        # may go negative (oversized call, or usage above the estimate): later calls wait it out
+        if self.rate > 0:
+            self.level -= n
+
+
+class _Ticket:
+    __slots__ = ("priority", "seq", "cost", "loop", "event", "queued")
+
+    def __init__(self, priority: int, seq: int, cost: int, loop: Optional[asyncio.AbstractEventLoop]):
+        self.priority = priority
+        self.seq = seq
+        self.cost = cost
+        self.loop = loop
+        self.event = asyncio.Event() if loop else None
+        self.queued = True
+
+    def __lt__(self, other: "_Ticket") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+_IDLE = 1.0  # re-check interval for tickets that are not at the head (they are also woken on every change)
+
+
+class Gateway:
+    """
+    Admission control shared by sync callers (threads) and async callers
+    (event loop). Waiters form one priority queue; only its head may be
+    admitted, once the concurrency cap, both buckets and any 429 pause allow.
+    """
+
+    def __init__(self, rpm: int, tpm: int, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self._cond = threading.Condition()
+        self._requests = _Bucket(rpm)
+        self._tokens = _Bucket(tpm)
+        self._queue: List[_Ticket] = []
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._paused_until = 0.0
+
+    # ---------- under the lock ----------
+
+    def _wake(self) -> None:
+        self._cond.notify_all()
+        for t in self._queue:
+            if t.loop:
+                try:
+                    t.loop.call_soon_threadsafe(t.event.set)
+                except RuntimeError:  # loop closed
+                    pass
+
+    def _gauges(self) -> None:
+        depth = {p: 0 for p in PRIORITY_NAMES}
+        for t in self._queue:
+            depth[t.priority] = depth.get(t.priority, 0) + 1
+        for p, n in depth.items():
+            registry.set("mealplan_llm_queue_depth", {"priority": PRIORITY_NAMES.get(p, str(p))}, n)
+        registry.set("mealplan_llm_in_flight", {}, self._in_flight)
+
+    def _enqueue(self, cost: int, loop: Optional[asyncio.AbstractEventLoop]) -> _Ticket:
+        t = _Ticket(_priority.get(), next(self._seq), cost, loop)
+        heapq.heappush(self._queue, t)
+        self._gauges()
+        return t
+
+    def _drop(self, t: _Ticket) -> None:
+        if t.queued:
+            t.queued = False
+            self._queue.remove(t)
+            heapq.heapify(self._queue)
+            self._gauges()
+            self._wake()
+
+    def _admit(self, t: _Ticket) -> float:
+        """Admits t (returns 0) or returns how long to wait before trying again."""
+        if self._queue[0] is not t or self._in_flight >= self.max_concurrency:
+            return _IDLE
+        now = time.monotonic()
+        wait = max(self._paused_until - now, self._requests.wait(1, now), self._tokens.wait(t.cost, now))
+        if wait > 0:
+            return wait
+        heapq.heappop(self._queue)
+        t.queued = False
+        self._requests.take(1)
+        self._tokens.take(t.cost)
+        self._in_flight += 1
+        self._gauges()
+        self._wake()  # the next ticket is now at the head
+        return 0.0
+
+    # ---------- public ----------
+
+    def _timeout(self, t: _Ticket, wait: float) -> LLMQueueTimeout:
+        self._drop(t)
+        registry.inc("mealplan_llm_queue_timeouts_total", {"priority": PRIORITY_NAMES.get(t.priority, str(t.priority))})
+        return LLMQueueTimeout(wait)
+
+    def _queue_timeout(self) -> float:
+        return LLM_BACKGROUND_QUEUE_TIMEOUT if _priority.get() >= BACKGROUND else LLM_QUEUE_TIMEOUT
+
+    def _waited(self, t: _Ticket, t0: float) -> None:
+        registry.observe("mealplan_llm_queue_wait_seconds",
+                         {"priority": PRIORITY_NAMES.get(t.priority, str(t.priority))}, time.monotonic() - t0)
+
+    def acquire(self, cost: int) -> None:
+        t0 = time.monotonic()
+        deadline = t0 + self._queue_timeout()
+        with self._cond:
+            t = self._enqueue(cost, None)
+            try:
+                while True:
+                    wait = self._admit(t)
+                    if wait == 0:
+                        break
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        raise self._timeout(t, wait)
+                    self._cond.wait(min(wait, left))
+            except BaseException:
+                self._drop(t)
+                raise
+        self._waited(t, t0)
+
+    async def aacquire(self, cost: int) -> None:
+        t0 = time.monotonic()
+        deadline = t0 + self._queue_timeout()
+        with self._cond:
+            t = self._enqueue(cost, asyncio.get_running_loop())
+        try:
+            while True:
+                with self._cond:
+                    wait = self._admit(t)
+                    if wait == 0:
+                        break
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        raise self._timeout(t, wait)
+                    t.event.clear()
+                try:
+                    await asyncio.wait_for(t.event.wait(), min(wait, left))
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            with self._cond:
+                self._drop(t)
+            raise
+        self._waited(t, t0)
+
+    def release(self, cost: int, used: Optional[int] = None) -> None:
+        """Frees the call's slot; with the actual token usage, corrects the tokens/min bucket."""
+        with self._cond:
+            self._in_flight -= 1
+            if used is not None:
+                self._tokens.take(used - cost)
+            self._gauges()
+            self._wake()
+
+    def pause(self, seconds: float) -> None:
+        """Stops admitting anyone for `seconds` (after a 429)."""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            now = time.monotonic()
+            self._requests._refill(now)
+            self._tokens._refill(now)
+            queued: Dict[str, int] = {}
+            for t in self._queue:
+                name = PRIORITY_NAMES.get(t.priority, str(t.priority))
+                queued[name] = queued.get(name, 0) + 1
+            return {
+                "in_flight": self._in_flight,
+                "max_concurrency": self.max_concurrency,
+                "queued": queued,
+                "paused_for_s": round(max(0.0, self._paused_until - now), 3),
+                "requests_available": round(self._requests.level, 1) if self._requests.rate else None,
+                "tokens_available": round(self._tokens.level) if self._tokens.rate else None,
+            }
+
+
+gateway = Gateway(LLM_RPM, LLM_TPM, LLM_MAX_CONCURRENCY)
+
+
+def gateway_stats() -> Dict[str, Any]:
+    return gateway.stats()
+
+# ---------- retries ----------
+
+def estimate_tokens(kwargs: Dict[str, Any]) -> int:
+    """Prompt (~4 chars per token) plus the completion allowance."""
+    chars = sum(len(str(m.get("content") or "")) for m in kwargs.get("messages") or [] if isinstance(m, dict))
+    return chars // 4 + int(kwargs.get("max_tokens") or LLM_COMPLETION_ESTIMATE)
+
+
+def _retry_after(err: Exception) -> Optional[float]:
+    headers = getattr(getattr(err, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _retry_reason(err: Exception) -> Optional[str]:
+    from openai import APIConnectionError, APIStatusError
+
+    if isinstance(err, APIStatusError):
+        if err.status_code == 429:
+            # an exhausted quota does not come back by waiting
+            return None if getattr(err, "code", None) == "insufficient_quota" else "rate_limit"
+        if err.status_code in (408, 409) or err.status_code >= 500:
+            return "server"
+        return None
+    if isinstance(err, APIConnectionError):  # includes timeouts
+        return "connection"
+    return None
+
+
+def _backoff(err: Exception, attempt: int) -> Optional[float]:
+    """Seconds to wait before retrying err, or None when it should be raised."""
+    reason = _retry_reason(err) if attempt < LLM_MAX_RETRIES else None
+    if reason is None:
+        return None
+    delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+    retry_after = _retry_after(err)
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    if reason == "rate_limit":
+        gateway.pause(delay)
+    registry.inc("mealplan_llm_retries_total", {"reason": reason})
+    return delay
+
+
+def _usage(resp: Any) -> Optional[int]:
+    return getattr(getattr(resp, "usage", None), "total_tokens", None)
+
+# ---------- client wrapper ----------
+
+class _GatedStream:
+    """Holds the call's slot until the stream is exhausted or closed."""
+
+    def __init__(self, stream, cost: int):
+        self._stream = stream
+        self._cost = cost
+        self._used: Optional[int] = None
+        self._released = False
+
+    def _release(self) -> None:
+        if not self._released:
+            self._released = True
+            gateway.release(self._cost, self._used)
+
+    def __iter__(self):
+        try:
+            for chunk in self._stream:
+                # usage arrives on the last chunk when stream_options={"include_usage": True}
+                self._used = _usage(chunk) or self._used
+                yield chunk
+        finally:
+            self._release()
+
+    def __aiter__(self):
+        return self._aiter()
+
+    async def _aiter(self):
+        try:
+            async for chunk in self._stream:
+                self._used = _usage(chunk) or self._used
+                yield chunk
+        finally:
+            self._release()
+
+    def close(self):
+        # the OpenAI async stream's close() is a coroutine; returned for the caller to await
+        self._release()
+        close = getattr(self._stream, "close", None)
+        return close() if close else None
+
+    def __del__(self):
+        # a stream dropped without being iterated
+        self._release()
+
+    def __getattr__(self, name: str):
+        return getattr(self._stream, name)
+
+
+class _GatedCreate:
+    def __init__(self, create, is_async: bool, admit: bool):
+        self._create = create
+        self._async = is_async
+        self._admit = admit
+
+    def _done(self, resp: Any, cost: int, stream: bool) -> Any:
+        if not self._admit:
+            return resp
+        if stream:
+            return _GatedStream(resp, cost)
+        gateway.release(cost, _usage(resp))
+        return resp
+
+    def __call__(self, *args, **kwargs):
+        if self._async:
+            return self._acall(*args, **kwargs)
+        cost = estimate_tokens(kwargs)
+        attempt = 0
+        while True:
+            if self._admit:
+                gateway.acquire(cost)
+            try:
+                resp = self._create(*args, **kwargs)
+            except BaseException as e:
+                # BaseException: a cancelled call (client disconnect) must give its slot back too
+                if self._admit:
+                    gateway.release(cost)
+                delay = _backoff(e, attempt) if isinstance(e, Exception) else None
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+                continue
+            return self._done(resp, cost, bool(kwargs.get("stream")))
+
+    async def _acall(self, *args, **kwargs):
+        cost = estimate_tokens(kwargs)
+        attempt = 0
+        while True:
+            if self._admit:
+                await gateway.aacquire(cost)
+            try:
+                resp = await self._create(*args, **kwargs)
+            except BaseException as e:
+                # BaseException: a cancelled call (client disconnect) must give its slot back too
+                if self._admit:
+                    gateway.release(cost)
+                delay = _backoff(e, attempt) if isinstance(e, Exception) else None
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            return self._done(resp, cost, bool(kwargs.get("stream")))
+
+
+class _Namespace:
+    def __init__(self, **attrs):
+        self.__dict__.update(attrs)
+
+
+class GatedOpenAI:
+    """OpenAI client (build it with max_retries=0) whose calls go through the gateway."""
+
+    def __init__(self, client, is_async: bool = False):
+        self._client = client
+        self.chat = _Namespace(completions=_Namespace(
+            create=_GatedCreate(client.chat.completions.create, is_async, admit=True)))
+        self.embeddings = _Namespace(create=_GatedCreate(client.embeddings.create, is_async, admit=False))
+
+    def __getattr__(self, name: str):
+        return getattr(self._client, name)
@@ -0,0 +1,215 @@
+# app/services/local_planner.py
+import re
+from typing import Dict, Any, List, Optional, Set
+from fastapi import HTTPException
+
+from app.config import PLANNER_LLM_POLISH, PLAN_NO_REPEAT_DAYS
+from app.services.recipe_filters import ingredient_tokens, exclusion_ids
+
+MEAL_TYPES = ["breakfast", "lunch", "dinner"]
+
+# share of the daily kcal target per slot
+KCAL_SHARE = {"breakfast": 0.25, "lunch": 0.35, "dinner": 0.40}
+
+_TYPE_TAGS = {
+    "breakfast": "breakfast",
+    "brunch": "breakfast",
+    "lunch": "lunch",
+    "dinner": "dinner",
+    "supper": "dinner",
+}
+
+# memory lines such as "Avoid ingredients: peanuts, shrimp" or "I don't like olives"
+# whole words only: "whatever" is not "hate", "avoidance" is not "avoid"
+_DISLIKE_RE = re.compile(
+    r"\b(?:(?:avoid(?:\s+ingredients)?|dislikes?|allergic\s+to|(?:don't|do not)\s+(?:like|eat)|hates?)\b|allergy\s*:)\s*:?\s*(.+)",
+    re.IGNORECASE,
+)
+_SPLIT_RE = re.compile(r",|/|;|\band\b|\bor\b")
+
+
+def _as_list(x) -> List[str]:
+    if x is None:
+        return []
+    if isinstance(x, list):
+        return [str(i).strip() for i in x if str(i).strip()]
+    if isinstance(x, str):
+        return [s.strip() for s in x.split(",") if s.strip()]
+    return []
+
+
+def memory_exclusions(memory: List[str]) -> Set[str]:
+    terms: Set[str] = set()
+    for line in memory or []:
+        m = _DISLIKE_RE.search(str(line))
+        if not m:
+            continue
+        for part in _SPLIT_RE.split(m.group(1).strip().rstrip(".")):
+            t = part.strip().lower()
+            if t and t not in {"none", "no", "n/a", "nothing"}:
+                terms.add(t)
+    return terms
+
+
+def _meal_types(r: Dict[str, Any]) -> Set[str]:
+    out = set()
+    for t in r.get("tags") or []:
+        mt = _TYPE_TAGS.get(str(t).strip().lower())
+        if mt:
+            out.add(mt)
+    return out
+
+
+def _is_excluded(r: Dict[str, Any], ex_ids: Set[str]) -> bool:
+    """
+    ex_ids from recipe_filters.exclusion_ids, matched on whole ingredient words
+    ("egg" skips eggplant). Titles are not checked: "Egg-Free Muffins" is fine.
+    Same rule as recipe_filters.uses_excluded on the retrieval path.
+    """
+    if not ex_ids:
+        return False
+    names = [str(i.get("name") or "") for i in (r.get("ingredients") or []) if isinstance(i, dict)]
+    names += [str(n) for n in (r.get("ingredient_names") or [])]
+    return not ex_ids.isdisjoint(ingredient_tokens(names))
+
+
+def _num(x) -> Optional[float]:
+    try:
+        return float(x) if x not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+def solve_schedule(
+    candidates: List[Dict[str, Any]],
+    days: int,
+    *,
+    exclusions: Set[str] = frozenset(),
+    max_time_minutes: Optional[float] = None,
+    daily_kcal: Optional[float] = None,
+    no_repeat_days: int = PLAN_NO_REPEAT_DAYS,
+) -> List[Dict[str, Any]]:
+    """
+    Greedy slot filler. For each day and meal slot it picks the best candidate
+    that satisfies, in order of strictness:
+      1. tagged for the slot's meal type (untagged recipes fit lunch/dinner),
+      2. within the time budget,
+      3. not used in the previous `no_repeat_days` days,
+    relaxing the constraints in reverse order only when nothing qualifies.
+    Recipes matching an exclusion are never used; raises ValueError if that
+    leaves none. Deterministic: ties keep candidate order.
+    """
+    ex_ids = set(exclusion_ids(list(exclusions)))
+    pool = []
+    for pos, r in enumerate(candidates):
+        if not r.get("id") or _is_excluded(r, ex_ids):
+            continue
+        pool.append({
+            "r": r,
+            "pos": pos,
+            "types": _meal_types(r),
+            "time": _num(r.get("time_minutes")),
+            "kcal": _num(r.get("kcal")),
+            "base": _num(r.get("score")) or 0.0,
+        })
+    if not pool and days > 0:
+        raise ValueError(f"All {len(candidates)} candidate recipes match an exclusion.")
+
+    last_day: Dict[str, int] = {}
+    uses: Dict[str, int] = {}
+
+    def fits_type(c, mt: str) -> bool:
+        return mt in c["types"] if c["types"] else mt != "breakfast"
+
+    def within_time(c) -> bool:
+        return max_time_minutes is None or c["time"] is None or c["time"] <= max_time_minutes
+
+    def rested(c, day: int, window: int) -> bool:
+        rid = c["r"]["id"]
+        return rid not in last_day or day - last_day[rid] > window
+
+    def score(c, mt: str) -> float:
+        s = c["base"] - 0.5 * uses.get(c["r"]["id"], 0)
+        if daily_kcal and c["kcal"]:
+            target = daily_kcal * KCAL_SHARE[mt]
+            s -= abs(c["kcal"] - target) / target
+        if c["time"]:
+            s -= 0.01 * c["time"]
+        return s
+
+    levels = [
+        lambda c, mt, d: fits_type(c, mt) and within_time(c) and rested(c, d, no_repeat_days),
+        lambda c, mt, d: fits_type(c, mt) and rested(c, d, no_repeat_days),
+        lambda c, mt, d: within_time(c) and rested(c, d, no_repeat_days),
+        lambda c, mt, d: rested(c, d, 0),
+        lambda c, mt, d: True,
+    ]
+
+    plan_days = []
+    for day in range(1, days + 1):
+        meals = []
+        used_today: Set[str] = set()
+        for mt in MEAL_TYPES:
+            pick = None
+            for ok in levels:
+                best = None
+                for c in pool:
+                    if c["r"]["id"] in used_today or not ok(c, mt, day):
+                        continue
+                    s = score(c, mt)
+                    if best is None or s > best[0] or (s == best[0] and c["pos"] < best[1]["pos"]):
+                        best = (s, c)
+                if best:
+                    pick = best[1]
+                    break
+            if pick is None:
+                # fewer usable candidates than meals in a day: allow same-day repeats
+                pick = next(iter(pool), None)
+            if pick is None:
+                continue
+
+            rid = pick["r"]["id"]
+            used_today.add(rid)
+            last_day[rid] = day
+            uses[rid] = uses.get(rid, 0) + 1
+            meals.append({"type": mt, "recipe_id": rid, "title": pick["r"].get("title")})
+        plan_days.append({"day": day, "meals": meals})
+
+    return plan_days
+
+
+def local_build_plan_fn(*, user_id: str, prefs: Dict[str, Any], candidates: List[Dict[str, Any]], memory: List[str]) -> Dict[str, Any]:
+    """Drop-in replacement for build_plan_adapter.build_plan_fn that needs no LLM call."""
+    days = int(prefs.get("days") or 7)
+    exclusions = {e.lower() for e in _as_list(prefs.get("exclusions"))} | memory_exclusions(memory)
+
+    try:
+        plan_days = solve_schedule(
+            candidates,
+            days,
+            exclusions=exclusions,
+            max_time_minutes=_num(prefs.get("max_time_minutes")),
+            daily_kcal=_num(prefs.get("calories") or prefs.get("kcal_target")),
+        )
+    except ValueError as e:
+        # rather than days with empty meals
+        raise HTTPException(status_code=422, detail={"error": str(e), "exclusions": sorted(exclusions)})
+
+    used = sorted({m["recipe_id"] for d in plan_days for m in d["meals"]})
+    return {"days": plan_days, "audit": {"used_recipe_ids": used, "planner": "local"}}
+
+
+def plan_with_optional_polish(*, user_id: str, prefs: Dict[str, Any], candidates: List[Dict[str, Any]], memory: List[str]) -> Dict[str, Any]:
+    draft = local_build_plan_fn(user_id=user_id, prefs=prefs, candidates=candidates, memory=memory)
+    if not PLANNER_LLM_POLISH:
+        return draft
+    from app.services.build_plan_adapter import polish_plan_fn
+    return polish_plan_fn(user_id=user_id, prefs=prefs, candidates=candidates, memory=memory, draft=draft)
+
+
+async def aplan_with_optional_polish(*, user_id: str, prefs: Dict[str, Any], candidates: List[Dict[str, Any]], memory: List[str]) -> Dict[str, Any]:
+    draft = local_build_plan_fn(user_id=user_id, prefs=prefs, candidates=candidates, memory=memory)
+    if not PLANNER_LLM_POLISH:
+        return draft
+    from app.services.build_plan_adapter import apolish_plan_fn
+    return await apolish_plan_fn(user_id=user_id, prefs=prefs, candidates=candidates, memory=memory, draft=draft)
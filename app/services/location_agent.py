@@ -1,16 +1,16 @@
 import requests
-from app.database import redis_client  
-import json
+from app.services.profile_store import get_location
+from app.models.location import Location
 
 
 def get_local_groceries(chat_id):
-    location_data = redis_client.get(f"user:{chat_id}:location")
-    if not location_data:
+    location = get_location(chat_id)
+    if not location:
         return "No location found."
 
-    location = eval(location_data)  # Convert string back to dict
-    
-    city = location["address"]["city"]
+    city = Location.parse_obj(location).address.city
+    if not city:
+        return "No city in stored location."
     
     response = requests.get(f"https://api.kroger.com/v1/products?filter.location={city}")
     return response.json()
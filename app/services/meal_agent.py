@@ -1,23 +1,18 @@
 # app/services/meal_agent.py
-import os
+import re
 from typing import Dict, List, Any, Optional
 
 from dotenv import load_dotenv
-from openai import OpenAI  
+from fastapi import HTTPException
 
-try:
-    from app.database import index
-except Exception:
-    index = None 
+from app.config import get_openai, get_async_openai, get_vector_index
+from app.services.embeddings import embed_text
+from app.services.blocking_executor import run_blocking
+from app.services.metrics import traced, stage
 
 load_dotenv(override=True)
 
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY")) 
-print("OPENAI_API_KEY loaded?", bool(os.getenv("OPENAI_API_KEY")))
-print("OPENAI_API_KEY starts with:", (os.getenv("OPENAI_API_KEY") or "")[:7])
-
-
 # -------- Utilities --------
 
 def _as_list(value: Any) -> List[str]:
@@ -107,7 +102,7 @@ STRICT FORMAT:
 - Each meal MUST include estimated calories (e.g., "Oatmeal with banana - 350 kcal").
 - No extra descriptions, just the meal name and calories.
 """
-    resp = client.chat.completions.create(
+    resp = get_openai().chat.completions.create(
         model="gpt-4-turbo",
         messages=[
             {"role": "system", "content": "You are a structured meal planning assistant."},
@@ -117,12 +112,7 @@ STRICT FORMAT:
     return resp.choices[0].message.content
 
 
-def generate_rag_meal_plan(body: Dict[str, Any]) -> str:
-    """Generate a meal plan using past meals and user preferences (tolerant to payload shapes)."""
-    data = _normalize_payload(body)
-
-    
-    past_plan = get_past_meals(data.get("chat_id")) if data.get("chat_id") else None
+def _rag_messages(data: Dict[str, Any], past_plan: Optional[str]) -> List[Dict[str, str]]:
     past_context = f"\nPast plan for personalization:\n{past_plan}\n" if past_plan and "No past meal plans" not in past_plan else ""
 
     prompt = f"""
@@ -151,34 +141,89 @@ Recipe: <2–5 concise steps>
 
 Keep it readable with blank lines between sections, but DO NOT use markdown formatting.
 """
-    resp = client.chat.completions.create(
-        model="gpt-4-turbo",
-        messages=[
-            {"role": "system", "content": "You are a meal planning assistant."},
-            {"role": "user", "content": prompt},
-        ],
-    )
+    return [
+        {"role": "system", "content": "You are a meal planning assistant."},
+        {"role": "user", "content": prompt},
+    ]
+
+
+@traced("rag")
+def generate_rag_meal_plan(body: Dict[str, Any]) -> str:
+    """Generate a meal plan using past meals and user preferences (tolerant to payload shapes)."""
+    data = _normalize_payload(body)
+
+    with stage("past_plan"):
+        past_plan = get_past_meals(data.get("chat_id")) if data.get("chat_id") else None
+
+    with stage("generate"):
+        resp = get_openai().chat.completions.create(
+            model="gpt-4-turbo",
+            messages=_rag_messages(data, past_plan),
+        )
     meal_plan = resp.choices[0].message.content
     return meal_plan
 
 
+_DAY_HEADER = re.compile(r"(?m)^\s*Day\s+(\d+)\s*:")
+
+
+@traced("rag")
+async def agenerate_rag_meal_plan_stream(body: Dict[str, Any], on_event) -> Dict[str, Any]:
+    """
+    Streaming generate_rag_meal_plan: emits each "Day N:" block as soon as
+    the next header (or the end of the completion) shows it is complete.
+    """
+    data = _normalize_payload(body)
+
+    with stage("past_plan"):
+        past_plan = await run_blocking(get_past_meals, data.get("chat_id")) if data.get("chat_id") else None
+    on_event("stage", {"stage": "past_plan", "found": bool(past_plan and "No past meal plans" not in past_plan)})
+
+    stream = await get_async_openai().chat.completions.create(
+        model="gpt-4-turbo",
+        messages=_rag_messages(data, past_plan),
+        stream=True,
+        stream_options={"include_usage": True},  # usage on the last chunk, for metrics and the gateway
+    )
+
+    text = ""
+    sent = 0  # offset of the first day block not yet emitted
+
+    def emit_days(final: bool) -> None:
+        nonlocal sent
+        headers = list(_DAY_HEADER.finditer(text, sent))
+        ends = [h.start() for h in headers[1:]] + ([len(text)] if final else [])
+        for h, end in zip(headers, ends):
+            on_event("day", {"day": int(h.group(1)), "text": text[h.start():end].strip()})
+            sent = end
+
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        text += chunk.choices[0].delta.content or ""
+        emit_days(final=False)
+    emit_days(final=True)
+
+    if not text:
+        raise HTTPException(status_code=500, detail="Meal plan generation failed.")
+    return {"meal_plan": text}
+
+
 
 def store_meal_plan(user_id: str, meal_plan: str):
     """Generate an embedding for the meal plan and store it in Pinecone (namespace 'meal-plans')."""
+    index = get_vector_index()
     if not index:
         return {"message": "Pinecone index not configured; skipping store."}
 
-    embedding_response = client.embeddings.create(
-        model="text-embedding-3-large",
-        input=meal_plan
-    )
-    embedding = embedding_response.data[0].embedding
+    embedding = embed_text(meal_plan)
     index.upsert(vectors=[(user_id, embedding, {"meal_plan": meal_plan})], namespace="meal-plans")
     return {"message": "Meal plan stored successfully"}
 
 
 def get_past_meals(user_id: Optional[str] = None) -> str:
     """Retrieve the most similar past meal plan for personalization."""
+    index = get_vector_index() if user_id else None
     if not user_id or not index:
         return "No past meal plans found."
 
@@ -186,7 +231,7 @@ def get_past_meals(user_id: Optional[str] = None) -> str:
         # Real similarity search requires a query vector, not an id.
         # If you store per-user last plan, you could also fetch by id. Here we demo similarity.
         probe = f"Past meal plan for user {user_id}"
-        emb = client.embeddings.create(model="text-embedding-3-large", input=probe).data[0].embedding
+        emb = embed_text(probe)
 
         results = index.query(
             vector=emb,
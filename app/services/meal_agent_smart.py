@@ -1,41 +1,38 @@
 # app/services/meal_agent_smart.py
-import time, json
-from typing import Dict, Any, List
-from collections import defaultdict
+import time, asyncio, inspect, threading
+from typing import Dict, Any, List, Optional, Union
 from fastapi import HTTPException
+from fastapi.responses import JSONResponse
 
+from app.config import (
+    BOOTSTRAP_RECIPES,
+    BOOTSTRAP_EMBED_BATCH,
+    BOOTSTRAP_WAIT_SECONDS,
+    BOOTSTRAP_MODE,
+    BOOTSTRAP_PARTIAL_MIN,
+    BOOTSTRAP_LOCK_SECONDS,
+)
 from app.services.recipe_corpus import (
-    generate_recipe_cards,
-    upsert_recipe_cards,
+    stream_recipe_cards,
     retrieve_recipes_for_request,
+    aretrieve_recipes_for_request,
+)
+from app.services.recipe_ingest import ingest_recipes
+from app.services.grocery_aggregate import aggregate_groceries, to_kroger_payload
+from app.services.blocking_executor import run_blocking
+from app.services.metrics import traced, stage
+from app.services.jobs import Lock, enqueue, job_handle
+from app.services.plan_stream import Emit, GroundedDays
+from app.services.user_memory import (
+    retrieve_memory,
+    remember_preferences,
+    aretrieve_memory,
+    aremember_preferences,
+    MEMORY_PROBE,
 )
-from app.services.user_memory import retrieve_memory, store_memory
 
 # ---------- helpers ----------
 
-def _norm_name(name: str) -> str:
-    n = (name or "").strip().lower()
-    if n in {"tortilla", "tortillas"}:
-        return "tortillas"
-    return n
-
-def _norm_unit(unit: str) -> str:
-    u = (unit or "").strip().lower()
-    return {
-        "tablespoon": "tbsp",
-        "tablespoons": "tbsp",
-        "tbsp": "tbsp",
-        "teaspoon": "tsp",
-        "teaspoons": "tsp",
-        "tsp": "tsp",
-        "g": "grams",
-        "gram": "grams",
-        "grams": "grams",
-        "clove": "cloves",
-        "cloves": "cloves",
-        "count": "count",
-    }.get(u, u or "unit")
-
 def plan_to_text(plan: Dict[str, Any]) -> str:
     if not plan or "days" not in plan:
         return "No plan generated."
@@ -47,92 +44,132 @@ def plan_to_text(plan: Dict[str, Any]) -> str:
         out.append("")
     return "\n".join(out).strip()
 
-def aggregate_groceries(used_recipe_ids: List[str], recipe_by_id: Dict[str, Any]) -> List[Dict[str, Any]]:
-    totals = defaultdict(lambda: defaultdict(float))
+# ---------- main agent ----------
+
+def _resolve_request(payload: Dict[str, Any]):
+    prefs = payload.get("preferences") or {}
+    user_id = payload.get("user_id") or prefs.get("user_id") or payload.get("chat_id")
+    if not user_id:
+        raise HTTPException(status_code=400, detail="Missing user_id")
+    return prefs, str(user_id)
+
+def _min_needed(prefs: Dict[str, Any]) -> int:
+    days = int(prefs.get("days") or 7)
+    return max(12, min(30, days * 3))
 
-    for rid in used_recipe_ids:
-        r = recipe_by_id.get(rid) or {}
-        for ing in (r.get("ingredients") or []):
-            name = _norm_name(str(ing.get("name", "")))
-            unit = _norm_unit(str(ing.get("unit") or "unit"))
-            if unit in {"to taste", "taste"}:
-                continue
+def _generated_cards(user_id: str, prefs: Dict[str, Any], sink: List[Dict[str, Any]] = None):
+    ts = int(time.time() * 1000)
+    for i, r in enumerate(stream_recipe_cards(prefs, n=BOOTSTRAP_RECIPES)):
+        r["id"] = f"r_{user_id}_{ts}_{i}"
+        if sink is not None:
+            sink.append(r)
+        yield r
 
-            qty = ing.get("qty")
-            try:
-                qty_val = float(qty) if qty not in (None, "") else 1.0
-            except Exception:
-                qty_val = 1.0
+def _start_bootstrap(user_id: str, prefs: Dict[str, Any], min_needed: int, on_ready) -> List[Dict[str, Any]]:
+    """
+    Streams generation of the new user's corpus straight into ingestion on a
+    background thread and calls on_ready() once min_needed recipes are stored
+    (or generation ends). Returns the list the generated recipes are added to.
+    """
+    generated: List[Dict[str, Any]] = []
+    fired = threading.Event()
 
-            if name:
-                totals[name][unit] += qty_val
+    def ready() -> None:
+        if not fired.is_set():
+            fired.set()
+            on_ready()
 
-    grocery = []
-    for name, units in totals.items():
-        for unit, qty in units.items():
-            grocery.append({"name": name, "qty": round(qty, 2), "unit": unit})
+    def on_progress(p: Dict[str, Any]) -> None:
+        if p["upserted"] >= min_needed:
+            ready()
 
-    grocery.sort(key=lambda x: x["name"])
-    return grocery
+    def run() -> None:
+        try:
+            ingest_recipes(user_id, _generated_cards(user_id, prefs, generated), embed_batch_size=BOOTSTRAP_EMBED_BATCH, on_progress=on_progress)
+        finally:
+            ready()
 
-# ---------- main agent ----------
+    threading.Thread(target=run, name=f"bootstrap-{user_id}", daemon=True).start()
+    return generated
 
-def generate_smart_meal_plan(payload: Dict[str, Any], build_plan_fn) -> Dict[str, Any]:
+def _bootstrap_corpus(user_id: str, prefs: Dict[str, Any], min_needed: int) -> List[Dict[str, Any]]:
     """
-    build_plan_fn: a function that takes (user_id, prefs, candidates, memory) and returns
-    a structured plan with at least {"days": [...]} and audit used_recipe_ids, or recipe_ids in meals.
-    (You can plug in your existing grounded planner here.)
+    Returns the recipes generated so far, as soon as min_needed are stored (or
+    generation ends, or BOOTSTRAP_WAIT_SECONDS pass). Remaining shards keep
+    generating/ingesting in the background.
     """
+    ready = threading.Event()
+    generated = _start_bootstrap(user_id, prefs, min_needed, ready.set)
+    ready.wait(timeout=BOOTSTRAP_WAIT_SECONDS)
+    return list(generated)
 
-    prefs = payload.get("preferences") or {}
-    user_id = payload.get("user_id")
-    if not user_id:
-        raise HTTPException(status_code=400, detail="Missing user_id")
+async def _abootstrap_corpus(user_id: str, prefs: Dict[str, Any], min_needed: int) -> List[Dict[str, Any]]:
+    """Async _bootstrap_corpus: waits on the event loop, not on a blocking-executor worker."""
+    loop = asyncio.get_running_loop()
+    ready = asyncio.Event()
 
-   
-    exclusions = prefs.get("exclusions") or []
-    cuisines = prefs.get("cuisines") or []
-    diet = prefs.get("diet")
-    if diet:
-        store_memory(user_id, f"Diet preference: {diet}", mtype="preference")
-    if cuisines:
-        store_memory(user_id, f"Preferred cuisines: {', '.join(cuisines)}", mtype="preference")
-    if exclusions:
-        store_memory(user_id, f"Avoid ingredients: {', '.join(exclusions)}", mtype="preference")
+    def wake() -> None:
+        try:
+            loop.call_soon_threadsafe(ready.set)
+        except RuntimeError:
+            pass  # loop closed: nobody is waiting any more
 
-    days = int(prefs.get("days") or 7)
-    min_needed = max(12, min(30, days * 3))
+    generated = _start_bootstrap(user_id, prefs, min_needed, wake)
+    try:
+        await asyncio.wait_for(ready.wait(), BOOTSTRAP_WAIT_SECONDS)
+    except asyncio.TimeoutError:
+        pass
+    return list(generated)
 
-    # 1) Retrieve current corpus
-    candidates = retrieve_recipes_for_request(user_id, prefs, top_k=50)
+def run_bootstrap_job(payload: Dict[str, Any], progress) -> Dict[str, Any]:
+    """Job handler (jobs.HANDLERS["bootstrap"]): full corpus bootstrap, one per user at a time."""
+    user_id = str(payload["user_id"])
+    prefs = payload.get("preferences") or {}
 
-    # 2) Bootstrap for new users
-    if len(candidates) < min_needed:
-        recipes = generate_recipe_cards(prefs, n=60)
-        ts = int(time.time() * 1000)
-        for i, r in enumerate(recipes):
-            r["id"] = f"r_{user_id}_{ts}_{i}"
-        upsert_recipe_cards(user_id, recipes)
+    lock = Lock(f"bootstrap:{user_id}", BOOTSTRAP_LOCK_SECONDS)
+    if not lock.acquire():
+        return {"ok": True, "skipped": "bootstrap already running for this user"}
+    with lock:
+        have = len(retrieve_recipes_for_request(user_id, prefs, top_k=50))
+        if have >= _min_needed(prefs):
+            return {"ok": True, "skipped": "corpus already large enough", "retrieved": have}
+        return ingest_recipes(user_id, _generated_cards(user_id, prefs), embed_batch_size=BOOTSTRAP_EMBED_BATCH, on_progress=progress)
 
-        candidates = retrieve_recipes_for_request(user_id, prefs, top_k=50)
+def bootstrap_pending(handle: Dict[str, Any]) -> JSONResponse:
+    """202 + job handle: the corpus is being built in the background; poll status_url."""
+    return JSONResponse(
+        status_code=202,
+        content={"message": "Building your recipe corpus. Poll status_url, then retry.", **handle},
+        headers={"Location": handle["status_url"], "Retry-After": "5"},
+    )
 
-        if len(candidates) < min_needed:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Bootstrap failed: only {len(candidates)} recipes retrieved after generation.",
-            )
+def _queue_bootstrap(user_id: str, prefs: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Queues (or joins) the user's bootstrap job and returns its handle, or
+    None if the queue is unavailable (caller bootstraps inline).
+    """
+    try:
+        job = enqueue("bootstrap", {"user_id": user_id, "preferences": prefs}, dedupe_key=f"bootstrap:{user_id}")
+    except Exception as e:
+        print("Bootstrap queue unavailable, bootstrapping inline:", e)
+        return None
+    return job_handle(job)
 
-    # 3) Retrieve memory
-    memory = retrieve_memory(
-        user_id,
-        query="Food preferences, dislikes, time constraints, favorite cuisines, and feedback",
-        top_k=6,
-    )
+def _with_generated(candidates: List[Dict[str, Any]], generated: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Freshly upserted vectors may not be queryable yet; plan against the
+    # validated cards we just generated as well.
+    have = {r["id"] for r in candidates}
+    return candidates + [r for r in generated if r["id"] not in have]
 
-    # 4) Build grounded plan using your existing grounded planner logic
-    plan = build_plan_fn(user_id=user_id, prefs=prefs, candidates=candidates, memory=memory)
+def _bootstrap_failed(candidates: List[Dict[str, Any]]) -> HTTPException:
+    return HTTPException(
+        status_code=500,
+        detail=f"Bootstrap failed: only {len(candidates)} recipes retrieved after generation.",
+    )
 
-    # 5) Compute groceries deterministically from used recipes
+def _assemble_response(user_id: str, plan: Dict[str, Any], candidates: List[Dict[str, Any]], memory: List[str],
+                       bootstrap: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    # Compute groceries deterministically from used recipes
     recipe_by_id = {r["id"]: r for r in candidates}
 
     # Derive used_ids from plan (either from audit or from day meals)
@@ -144,17 +181,138 @@ def generate_smart_meal_plan(payload: Dict[str, Any], build_plan_fn) -> Dict[str
     used_ids = sorted(list(used_ids))
 
     grocery_list = aggregate_groceries(used_ids, recipe_by_id)
-    kroger_payload = [{"name": g["name"], "quantity": g["qty"], "unit": g["unit"]} for g in grocery_list]
+    kroger_payload = to_kroger_payload(grocery_list)
+
+    audit = {
+        "user_id": user_id,
+        "retrieved_count": len(candidates),
+        "used_recipe_ids": used_ids,
+        "memory_used": memory,
+    }
+    if (plan.get("audit") or {}).get("truncated"):
+        audit["truncated"] = True
+    if bootstrap:
+        # planned from a partial corpus while the bootstrap job runs
+        audit["partial"] = True
+        audit["bootstrap"] = bootstrap
 
-    
     return {
-        "meal_plan": plan_to_text(plan),       
+        "meal_plan": plan_to_text(plan),
         "grocery_list_structured": grocery_list,
         "kroger_payload": kroger_payload,
-        "audit": {
-            "user_id": user_id,
-            "retrieved_count": len(candidates),
-            "used_recipe_ids": used_ids,
-            "memory_used": memory,
-        },
+        "audit": audit,
     }
+
+@traced("smart")
+def generate_smart_meal_plan(payload: Dict[str, Any], build_plan_fn) -> Union[Dict[str, Any], JSONResponse]:
+    """
+    build_plan_fn: a function that takes (user_id, prefs, candidates, memory) and returns
+    a structured plan with at least {"days": [...]} and audit used_recipe_ids, or recipe_ids in meals.
+    (You can plug in your existing grounded planner here.)
+    Returns a 202 response with the job handle while a new user's corpus is
+    still being built in the background (BOOTSTRAP_MODE=queue).
+    """
+    prefs, user_id = _resolve_request(payload)
+
+    with stage("store_memory"):
+        remember_preferences(user_id, prefs)
+
+    min_needed = _min_needed(prefs)
+
+    # 1) Retrieve current corpus
+    with stage("candidates"):
+        candidates = retrieve_recipes_for_request(user_id, prefs, top_k=50)
+
+    # 2) Bootstrap for new users: background job (202 / partial plan) or inline
+    bootstrap = None
+    if len(candidates) < min_needed:
+        with stage("bootstrap"):
+            if BOOTSTRAP_MODE == "queue":
+                bootstrap = _queue_bootstrap(user_id, prefs)
+                if bootstrap and len(candidates) < BOOTSTRAP_PARTIAL_MIN:
+                    return bootstrap_pending(bootstrap)
+
+            if bootstrap is None:
+                generated = _bootstrap_corpus(user_id, prefs, min_needed)
+
+                candidates = _with_generated(retrieve_recipes_for_request(user_id, prefs, top_k=50), generated)
+
+                if len(candidates) < min_needed:
+                    raise _bootstrap_failed(candidates)
+
+    # 3) Retrieve memory
+    with stage("memory"):
+        memory = retrieve_memory(user_id, query=MEMORY_PROBE, top_k=6)
+
+    # 4) Build grounded plan using your existing grounded planner logic
+    with stage("scheduling"):
+        plan = build_plan_fn(user_id=user_id, prefs=prefs, candidates=candidates, memory=memory)
+
+    # 5) Groceries + response
+    with stage("groceries"):
+        return _assemble_response(user_id, plan, candidates, memory, bootstrap)
+
+@traced("smart")
+async def agenerate_smart_meal_plan(payload: Dict[str, Any], build_plan_fn, on_event: Optional[Emit] = None) -> Union[Dict[str, Any], JSONResponse]:
+    """
+    Async generate_smart_meal_plan. The memory branch (store preference facts,
+    then retrieve memory) runs concurrently with recipe retrieval.
+    build_plan_fn may be sync or async; if it takes on_day, days are streamed.
+    on_event (see plan_stream) receives stage, day and grocery events as they happen.
+    """
+    emit = on_event or (lambda event, data: None)
+    prefs, user_id = _resolve_request(payload)
+    min_needed = _min_needed(prefs)
+
+    async def recipes() -> List[Dict[str, Any]]:
+        with stage("candidates"):
+            found = await aretrieve_recipes_for_request(user_id, prefs, top_k=50)
+        emit("stage", {"stage": "candidates", "count": len(found)})
+        return found
+
+    async def memory_branch() -> List[str]:
+        with stage("store_memory"):
+            await aremember_preferences(user_id, prefs)
+        with stage("memory"):
+            found = await aretrieve_memory(user_id, query=MEMORY_PROBE, top_k=6)
+        emit("stage", {"stage": "memory", "count": len(found)})
+        return found
+
+    candidates, memory = await asyncio.gather(recipes(), memory_branch())
+
+    bootstrap = None
+    if len(candidates) < min_needed:
+        emit("stage", {"stage": "bootstrap", "have": len(candidates), "need": min_needed, "mode": BOOTSTRAP_MODE})
+        with stage("bootstrap"):
+            if BOOTSTRAP_MODE == "queue":
+                bootstrap = await run_blocking(_queue_bootstrap, user_id, prefs)
+                if bootstrap and len(candidates) < BOOTSTRAP_PARTIAL_MIN:
+                    return bootstrap_pending(bootstrap)
+
+            if bootstrap is None:
+                generated = await _abootstrap_corpus(user_id, prefs, min_needed)
+
+                candidates = _with_generated(await aretrieve_recipes_for_request(user_id, prefs, top_k=50), generated)
+                emit("stage", {"stage": "candidates", "count": len(candidates)})
+
+                if len(candidates) < min_needed:
+                    raise _bootstrap_failed(candidates)
+
+    # days go out only once their recipe_ids are known to be retrieved ones
+    on_day = GroundedDays(on_event, candidates)
+    kwargs: Dict[str, Any] = {"user_id": user_id, "prefs": prefs, "candidates": candidates, "memory": memory}
+    if on_event and "on_day" in inspect.signature(build_plan_fn).parameters:
+        kwargs["on_day"] = on_day
+
+    emit("stage", {"stage": "scheduling"})
+    with stage("scheduling"):
+        if inspect.iscoroutinefunction(build_plan_fn):
+            plan = await build_plan_fn(**kwargs)
+        else:
+            plan = await run_blocking(build_plan_fn, **kwargs)
+    on_day.finish(plan)
+
+    with stage("groceries"):
+        result = _assemble_response(user_id, plan, candidates, memory, bootstrap)
+    emit("groceries", {"grocery_list": result["grocery_list_structured"], "kroger_payload": result["kroger_payload"]})
+    return result
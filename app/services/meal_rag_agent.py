@@ -4,7 +4,10 @@ from app.services.recipe_rag import (
     build_recipe_query, retrieve_recipes, retrieve_user_memory,
     select_recipes, compile_grounded_plan
 )
+from app.services.metrics import traced, stage
 
+
+@traced("grounded_rag")
 def generate_grounded_meal_plan(body: Dict[str, Any]) -> Dict[str, Any]:
     """
     Orchestrates RAG:
@@ -29,22 +32,26 @@ def generate_grounded_meal_plan(body: Dict[str, Any]) -> Dict[str, Any]:
         "days": days,
     })
 
-    candidates = retrieve_recipes(query, k=35)
-    memory = retrieve_user_memory(str(chat_id), k=6) if chat_id else []
+    with stage("retrieve"):
+        candidates = retrieve_recipes(query, k=35)
+    with stage("memory"):
+        memory = retrieve_user_memory(str(chat_id), k=6) if chat_id else []
 
-    selected = select_recipes(candidates, target_meals=days * 3, data={
-        "ingredients_at_home": data.get("ingredients_at_home", []),
-        "exclusions": data.get("exclusions", []),
-    })
+    with stage("select"):
+        selected = select_recipes(candidates, target_meals=days * 3, data={
+            "ingredients_at_home": data.get("ingredients_at_home", []),
+            "exclusions": data.get("exclusions", []),
+        })
 
-    plan = compile_grounded_plan({
-        "goal": data.get("goal"),
-        "diet": data.get("diet"),
-        "cuisines": data.get("cuisines", []),
-        "exclusions": data.get("exclusions", []),
-        "budget": data.get("budget"),
-        "ingredients_at_home": data.get("ingredients_at_home", []),
-        "days": days,
-    }, selected, memory)
+    with stage("compile"):
+        plan = compile_grounded_plan({
+            "goal": data.get("goal"),
+            "diet": data.get("diet"),
+            "cuisines": data.get("cuisines", []),
+            "exclusions": data.get("exclusions", []),
+            "budget": data.get("budget"),
+            "ingredients_at_home": data.get("ingredients_at_home", []),
+            "days": days,
+        }, selected, memory)
 
     return plan
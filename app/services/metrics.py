@@ -0,0 +1,360 @@
+# app/services/metrics.py
+import time, asyncio, functools, threading, contextvars, contextlib
+from typing import Dict, Any, List, Optional, Tuple, Iterator
+
+from app.config import AUDIT_TIMINGS
+
+# In-process metrics, rendered in Prometheus text format on /metrics.
+# Each worker process keeps its own registry (scrape every worker, or run one).
+#
+#   mealplan_stage_seconds{pipeline,stage}              pipeline stages
+#   mealplan_external_seconds{service,op,model}         OpenAI / embedding / vector calls
+#   mealplan_external_errors_total{service,op,model}
+#   mealplan_llm_tokens_total{model,direction}          direction = in | out
+#   mealplan_embed_cache_total{tier}                    lru | redis | miss
+#
+# A request-scoped trace (contextvar, carried into run_blocking threads)
+# also sums the same timings per request; with AUDIT_TIMINGS=1 the planners
+# put them in audit["timings_ms"].
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class _Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v: float) -> None:
+        for i, b in enumerate(BUCKETS):
+            if v <= b:
+                self.counts[i] += 1
+                break
+        self.sum += v
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._gauges: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], _Histogram] = {}
+
+    def describe(self, name: str, kind: str, text: str) -> None:
+        self._help[name] = (kind, text)
+
+    def inc(self, name: str, labels: Dict[str, str], amount: float = 1.0) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + amount
+
+    def set(self, name: str, labels: Dict[str, str], value: float) -> None:
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name: str, labels: Dict[str, str], value: float) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            h = self._histograms.get(key)
+            if h is None:
+                h = self._histograms[key] = _Histogram()
+            h.observe(value)
+
+    def render(self) -> str:
+        with self._lock:
+            values = {"counter": dict(self._counters), "gauge": dict(self._gauges)}
+            histograms = {k: (list(h.counts), h.sum, h.count) for k, h in self._histograms.items()}
+
+        lines: List[str] = []
+        for name, (kind, text) in sorted(self._help.items()):
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind in values:
+                for (n, labels), v in sorted(values[kind].items()):
+                    if n == name:
+                        lines.append(f"{name}{_fmt(labels)} {_num(v)}")
+            else:
+                for (n, labels), (counts, total, count) in sorted(histograms.items()):
+                    if n != name:
+                        continue
+                    cumulative = 0
+                    for b, c in zip(BUCKETS, counts):
+                        cumulative += c
+                        lines.append(f"{name}_bucket{_fmt(labels + (('le', _num(b)),))} {cumulative}")
+                    lines.append(f"{name}_bucket{_fmt(labels + (('le', '+Inf'),))} {count}")
+                    lines.append(f"{name}_sum{_fmt(labels)} {_num(total)}")
+                    lines.append(f"{name}_count{_fmt(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt(labels: Labels) -> str:
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels) + "}" if labels else ""
+
+
+def _num(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+registry = Registry()
+registry.describe("mealplan_stage_seconds", "histogram", "Wall time of planner pipeline stages.")
+registry.describe("mealplan_external_seconds", "histogram", "Wall time of calls to external services.")
+registry.describe("mealplan_external_errors_total", "counter", "Failed calls to external services.")
+registry.describe("mealplan_llm_tokens_total", "counter", "LLM tokens by model and direction (in = prompt, out = completion).")
+registry.describe("mealplan_embed_cache_total", "counter", "Embedding lookups by the tier that answered them.")
+
+# ---------- request-scoped trace ----------
+
+class Trace:
+    def __init__(self, pipeline: str):
+        self.pipeline = pipeline
+        self._ms: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self._ms[name] = self._ms.get(name, 0.0) + seconds * 1000
+
+    def breakdown(self) -> Dict[str, float]:
+        """Milliseconds per stage / external call. Concurrent stages overlap, so they can add up to more than "total"."""
+        with self._lock:
+            return {k: round(v, 1) for k, v in self._ms.items()}
+
+
+_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("mealplan_trace", default=None)
+
+
+def current_pipeline() -> str:
+    t = _trace.get()
+    return t.pipeline if t else "none"
+
+
+@contextlib.contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Times one pipeline stage (histogram + the current request's trace)."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        registry.observe("mealplan_stage_seconds", {"pipeline": current_pipeline(), "stage": name}, elapsed)
+        t = _trace.get()
+        if t:
+            t.add(name, elapsed)
+
+
+class _Call:
+    """One timed external call; usable as a context manager or finished by hand (streams)."""
+
+    def __init__(self, service: str, op: str, model: str):
+        self.model = model
+        self._labels = {"service": service, "op": op, "model": model}
+        self._name = f"{service}.{op}"
+        self._t0 = time.perf_counter()
+        self._finished = False
+
+    def tokens(self, resp: Any) -> None:
+        """Counts prompt/completion tokens from an OpenAI response's usage, if any."""
+        usage = getattr(resp, "usage", None)
+        if usage is None:
+            return
+        tokens_in = getattr(usage, "prompt_tokens", None) or 0
+        tokens_out = getattr(usage, "completion_tokens", None) or 0
+        if tokens_in:
+            registry.inc("mealplan_llm_tokens_total", {"model": self.model, "direction": "in"}, tokens_in)
+        if tokens_out:
+            registry.inc("mealplan_llm_tokens_total", {"model": self.model, "direction": "out"}, tokens_out)
+
+    def finish(self, failed: bool = False) -> None:
+        if self._finished:
+            return
+        self._finished = True
+        elapsed = time.perf_counter() - self._t0
+        if failed:
+            registry.inc("mealplan_external_errors_total", self._labels)
+        registry.observe("mealplan_external_seconds", self._labels, elapsed)
+        t = _trace.get()
+        if t:
+            t.add(self._name, elapsed)
+
+    def __enter__(self) -> "_Call":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.finish(failed=exc_type is not None)
+
+
+def external(service: str, op: str, model: str = "") -> _Call:
+    """Times one call to an external service (`with external(...) as call:`); failures are counted."""
+    return _Call(service, op, model)
+
+
+def count_embed_cache(tier: str, n: int) -> None:
+    if n:
+        registry.inc("mealplan_embed_cache_total", {"tier": tier}, n)
+
+
+def _attach(result: Any, t: Trace) -> Any:
+    if AUDIT_TIMINGS and isinstance(result, dict) and isinstance(result.get("audit"), dict):
+        result["audit"]["timings_ms"] = t.breakdown()
+    return result
+
+
+def traced(pipeline: str):
+    """
+    Decorator for a planner entry point (sync or async): opens the request
+    trace, times the whole call as stage "total", and with AUDIT_TIMINGS=1
+    adds the per-stage breakdown to the returned plan's audit. A pipeline
+    called from inside another one records into the caller's trace.
+    """
+    def deco(fn):
+        @contextlib.contextmanager
+        def scope() -> Iterator[Optional[Trace]]:
+            if _trace.get() is not None:
+                with stage(pipeline):
+                    yield None
+                return
+            t = Trace(pipeline)
+            token = _trace.set(t)
+            try:
+                with stage("total"):
+                    yield t
+            finally:
+                _trace.reset(token)
+
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def awrapper(*args, **kwargs):
+                with scope() as t:
+                    result = await fn(*args, **kwargs)
+                return _attach(result, t) if t else result
+            return awrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with scope() as t:
+                result = fn(*args, **kwargs)
+            return _attach(result, t) if t else result
+        return wrapper
+    return deco
+
+# ---------- OpenAI client instrumentation ----------
+
+class _Stream:
+    """
+    Wraps a streamed completion: the call is timed until the stream is
+    exhausted, closed, abandoned or cancelled, whichever comes first.
+    """
+
+    def __init__(self, stream, call: _Call):
+        self._stream = stream
+        self._call = call
+
+    def __iter__(self):
+        failed = False
+        try:
+            for chunk in self._stream:
+                # usage arrives on the last chunk when stream_options={"include_usage": True}
+                self._call.tokens(chunk)
+                yield chunk
+        except Exception:
+            failed = True
+            raise
+        finally:
+            # also on GeneratorExit (consumer stopped early) and CancelledError
+            self._call.finish(failed=failed)
+
+    def __aiter__(self):
+        return self._aiter()
+
+    async def _aiter(self):
+        failed = False
+        try:
+            async for chunk in self._stream:
+                self._call.tokens(chunk)
+                yield chunk
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self._call.finish(failed=failed)
+
+    def close(self):
+        # the OpenAI async stream's close() is a coroutine; returned for the caller to await
+        self._call.finish()
+        close = getattr(self._stream, "close", None)
+        return close() if close else None
+
+    def __del__(self):
+        # a stream dropped without being iterated
+        self._call.finish()
+
+    def __getattr__(self, name: str):
+        return getattr(self._stream, name)
+
+
+class _Create:
+    def __init__(self, create, service: str, op: str, is_async: bool):
+        self._create = create
+        self._service = service
+        self._op = op
+        self._async = is_async
+
+    def _done(self, call: _Call, resp: Any, stream: bool) -> Any:
+        if stream:
+            return _Stream(resp, call)
+        call.tokens(resp)
+        call.finish()
+        return resp
+
+    def __call__(self, *args, **kwargs):
+        if self._async:
+            return self._acall(*args, **kwargs)
+        call = external(self._service, self._op, str(kwargs.get("model") or ""))
+        try:
+            resp = self._create(*args, **kwargs)
+        except Exception:
+            call.finish(failed=True)
+            raise
+        return self._done(call, resp, bool(kwargs.get("stream")))
+
+    async def _acall(self, *args, **kwargs):
+        call = external(self._service, self._op, str(kwargs.get("model") or ""))
+        try:
+            resp = await self._create(*args, **kwargs)
+        except Exception:
+            call.finish(failed=True)
+            raise
+        return self._done(call, resp, bool(kwargs.get("stream")))
+
+
+class _Namespace:
+    def __init__(self, **attrs):
+        self.__dict__.update(attrs)
+
+
+class TracedOpenAI:
+    """
+    OpenAI client whose chat.completions.create is timed and token-counted.
+    Embeddings are timed in embeddings.py, per provider.
+    """
+
+    def __init__(self, client, is_async: bool = False):
+        self._client = client
+        self.chat = _Namespace(completions=_Namespace(
+            create=_Create(client.chat.completions.create, "openai", "chat", is_async)))
+
+    def __getattr__(self, name: str):
+        return getattr(self._client, name)
+
+
+def render() -> str:
+    return registry.render()
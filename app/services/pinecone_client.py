@@ -1,18 +1,268 @@
-import os
+import os, json, threading, time
+from typing import Any, Dict, Optional
 from dotenv import load_dotenv
 load_dotenv(override=True)
 
-from pinecone import Pinecone
+from app.services.blocking_executor import run_blocking
+from app.services.metrics import external
 
-def get_pinecone_index():
-    api_key = os.getenv("PINECONE_API_KEY")
-    host = os.getenv("PINECONE_HOST")
-    index_name = os.getenv("PINECONE_INDEX")
+POOL_THREADS = int(os.getenv("PINECONE_POOL_THREADS", "8"))
+POOL_MAXSIZE = int(os.getenv("PINECONE_POOL_MAXSIZE", "16"))
+DIMENSION = int(os.getenv("PINECONE_DIMENSION", "3072"))
 
-    if not api_key or not (host or index_name):
-        return None
+
+def _pinecone_config():
+    return os.getenv("PINECONE_API_KEY"), os.getenv("PINECONE_HOST"), os.getenv("PINECONE_INDEX")
+
+
+class IndexManager:
+    """
+    Process-wide owner of the Pinecone client and Index handle.
+    The handle (and its HTTP connection pool) is built once and reused by
+    every request; reset() drops it so the next call reconnects.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._handle = None
+        self._config = None
+
+    def configured(self) -> bool:
+        api_key, host, index_name = _pinecone_config()
+        return bool(api_key and (host or index_name))
+
+    def handle(self):
+        config = _pinecone_config()
+        h = self._handle
+        if h is not None and self._config == config:
+            return h
+        with self._lock:
+            if self._handle is None or self._config != config:
+                from pinecone import Pinecone
+
+                api_key, host, index_name = config
+                pc = Pinecone(api_key=api_key, pool_threads=POOL_THREADS)
+                opts = {"pool_threads": POOL_THREADS, "connection_pool_maxsize": POOL_MAXSIZE}
+                self._handle = pc.Index(host=host, **opts) if host else pc.Index(index_name, **opts)
+                self._config = config
+            return self._handle
+
+    def reset(self) -> None:
+        with self._lock:
+            self._handle = None
+            self._config = None
+
+    def health(self) -> Dict[str, Any]:
+        if not self.configured():
+            return {"ok": False, "error": "Pinecone not configured"}
+        t0 = time.perf_counter()
+        try:
+            stats = self.handle().describe_index_stats()
+        except Exception as e:
+            self.reset()
+            return {"ok": False, "error": str(e)}
+        total = stats.get("total_vector_count") if hasattr(stats, "get") else getattr(stats, "total_vector_count", None)
+        return {
+            "ok": True,
+            "latency_ms": round((time.perf_counter() - t0) * 1000, 1),
+            "total_vector_count": total,
+        }
+
+    def warm_up(self, namespace: str = "recipes") -> Dict[str, Any]:
+        """Opens the connection pool and primes the server with one tiny query."""
+        status = self.health()
+        if status.get("ok"):
+            try:
+                self.handle().query(vector=[1e-3] * DIMENSION, top_k=1, namespace=namespace)
+            except Exception as e:
+                status = {"ok": False, "error": str(e)}
+        return status
+
+
+def _retryable(e: Exception) -> bool:
+    # client errors (bad filter, wrong dimension...) will not go away on reconnect
+    status = getattr(e, "status", None)
+    return not (isinstance(status, int) and 400 <= status < 500)
+
+
+class _ManagedIndex:
+    """Index proxy: every call goes to the pooled handle and reconnects once on failure."""
+
+    def __init__(self, manager: IndexManager):
+        self._manager = manager
+
+    def __getattr__(self, name: str):
+        if not callable(getattr(self._manager.handle(), name)):
+            return getattr(self._manager.handle(), name)
+
+        def call(*args, **kwargs):
+            try:
+                return getattr(self._manager.handle(), name)(*args, **kwargs)
+            except Exception as e:
+                if not _retryable(e):
+                    raise
+                self._manager.reset()
+                return getattr(self._manager.handle(), name)(*args, **kwargs)
+
+        return call
+
+
+index_manager = IndexManager()
+_managed = _ManagedIndex(index_manager)
+
+
+def ensure_index() -> Dict[str, Any]:
+    """Creates PINECONE_INDEX if missing. Called from app startup when PINECONE_ENSURE_INDEX=1, never at import."""
+    api_key, host, index_name = _pinecone_config()
+    if not api_key or host or not index_name:
+        return {"ok": False, "skipped": "needs PINECONE_API_KEY and PINECONE_INDEX (not PINECONE_HOST)"}
+    from pinecone import Pinecone
 
     pc = Pinecone(api_key=api_key)
-    if host:
-        return pc.Index(host=host)
-    return pc.Index(index_name)
+    if index_name in pc.list_indexes().names():
+        return {"ok": True, "created": False}
+    pc.create_index(name=index_name, dimension=DIMENSION, metric="cosine")
+    return {"ok": True, "created": True}
+
+
+# ---------- namespaces per embedding model ----------
+
+NAMESPACE_REGISTRY_KEY = "vector:namespaces"
+_registered: Dict[str, Dict[str, Any]] = {}
+
+
+def _values(rec: Any) -> Any:
+    return rec["values"] if isinstance(rec, dict) else rec[1]
+
+
+def _check_namespace(namespace: str, model: str, dimension: int, write: bool) -> None:
+    """
+    Each physical namespace records {model, dimension} (Redis hash
+    vector:namespaces) the first time it is written, and refuses vectors
+    from any other model afterwards.
+    """
+    info = _registered.get(namespace)
+    if info is None:
+        try:
+            from app.services.redis_client import get_redis
+            r = get_redis()
+            if write:
+                r.hsetnx(NAMESPACE_REGISTRY_KEY, namespace, json.dumps({"model": model, "dimension": dimension}))
+            raw = r.hget(NAMESPACE_REGISTRY_KEY, namespace)
+        except Exception:
+            # registry unavailable: the index still rejects wrong dimensions
+            return
+        if raw is None:
+            return
+        info = _registered[namespace] = json.loads(raw)
+
+    if info["model"] != model or info["dimension"] != dimension:
+        raise ValueError(
+            f"Namespace {namespace!r} holds {info['model']} vectors ({info['dimension']}d); "
+            f"got {model} ({dimension}d)"
+        )
+
+
+class _ModelScopedIndex:
+    """
+    Index view for the active embedding provider: logical namespaces map to
+    per-model physical ones (see embedding_providers.physical_namespace) and
+    are checked against the registry before vectors go in or out.
+    """
+
+    def __init__(self, index, provider):
+        self._index = index
+        self._provider = provider
+
+    def _ns(self, namespace: str) -> str:
+        from app.services.embedding_providers import physical_namespace
+        return physical_namespace(self._provider, namespace)
+
+    def upsert(self, vectors, namespace: str = "", **kwargs):
+        vectors = list(vectors)
+        ns = self._ns(namespace)
+        if vectors:
+            _check_namespace(ns, self._provider.model, len(_values(vectors[0])), write=True)
+        with external("vector", "upsert"):
+            return self._index.upsert(vectors=vectors, namespace=ns, **kwargs)
+
+    def query(self, vector=None, namespace: str = "", **kwargs):
+        ns = self._ns(namespace)
+        if vector is not None:
+            _check_namespace(ns, self._provider.model, len(vector), write=False)
+        with external("vector", "query"):
+            return self._index.query(vector=vector, namespace=ns, **kwargs)
+
+    def fetch(self, ids, namespace: str = "", **kwargs):
+        with external("vector", "fetch"):
+            return self._index.fetch(ids=ids, namespace=self._ns(namespace), **kwargs)
+
+    def delete(self, namespace: str = "", **kwargs):
+        with external("vector", "delete"):
+            return self._index.delete(namespace=self._ns(namespace), **kwargs)
+
+    def __getattr__(self, name: str):
+        return getattr(self._index, name)
+
+
+def _raw_index():
+    if os.getenv("VECTOR_BACKEND", "pinecone").lower() == "local":
+        from app.services.vector_store import get_local_index
+        return get_local_index()
+
+    if not index_manager.configured():
+        return None
+    return _managed
+
+
+def get_pinecone_index():
+    """
+    Returns the vector index used by every service, scoped to the active
+    embedding provider. VECTOR_BACKEND=local keeps vectors in an in-process,
+    memory-mapped index (see app/services/vector_store.py); anything else uses
+    the pooled Pinecone handle.
+    """
+    index = _raw_index()
+    if index is None:
+        return None
+    from app.services.embedding_providers import get_provider
+    return _ModelScopedIndex(index, get_provider())
+
+
+class AsyncIndex:
+    """
+    Awaitable view of a (blocking) vector index: each call runs on the shared
+    blocking executor so independent queries can be awaited concurrently.
+    """
+
+    def __init__(self, index):
+        self._index = index
+
+    async def query(self, **kwargs):
+        return await run_blocking(self._index.query, **kwargs)
+
+    async def upsert(self, **kwargs):
+        return await run_blocking(self._index.upsert, **kwargs)
+
+    async def fetch(self, **kwargs):
+        return await run_blocking(self._index.fetch, **kwargs)
+
+
+def get_async_index() -> Optional[AsyncIndex]:
+    index = get_pinecone_index()
+    return AsyncIndex(index) if index is not None else None
+
+
+def vector_health() -> Dict[str, Any]:
+    if os.getenv("VECTOR_BACKEND", "pinecone").lower() == "local":
+        from app.services.vector_store import get_local_index
+        return {"ok": True, "backend": "local", **get_local_index().describe_index_stats()}
+    return {"backend": "pinecone", **index_manager.health()}
+
+
+def warm_up_vector_index() -> Optional[Dict[str, Any]]:
+    if os.getenv("VECTOR_BACKEND", "pinecone").lower() == "local":
+        return vector_health()
+    if not index_manager.configured():
+        return None
+    return index_manager.warm_up()
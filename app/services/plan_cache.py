@@ -0,0 +1,298 @@
+# app/services/plan_cache.py
+import json, time, hashlib
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Tuple
+
+from app.config import (
+    PLANNER_BACKEND,
+    PLANNER_LLM_POLISH,
+    PLAN_CACHE,
+    PLAN_CACHE_TTL,
+    PLAN_CACHE_MAX_ENTRIES,
+    PLAN_CACHE_NEAR_HIT,
+)
+from app.services.redis_client import RedisBackoff
+from app.services.blocking_executor import run_blocking
+
+# Schedules keyed by (canonical preferences, candidate id set, memory digest).
+# Recipe ids are per user (r_<user>_...), so entries are effectively per user:
+# hits come from the same user re-planning against an unchanged corpus.
+#   plan:entry:<profile>:<cands>  JSON {plan, candidate_ids, compute_ms}, with TTL
+#   plan:profile:<profile>        hash cands -> candidate ids; only with PLAN_CACHE_NEAR_HIT
+#   plan:lru                      zset entry key -> last access, for LRU eviction
+#   plan:stats                    hash hits / near_hits / misses / saved_ms
+PREFIX = "plan:"
+LRU_KEY = PREFIX + "lru"
+STATS_KEY = PREFIX + "stats"
+MAX_NEAR_CANDIDATES = 16
+
+_PREF_FIELDS = ("goal", "diet", "cuisines", "exclusions", "ingredientsAtHome", "budget", "max_time_minutes", "calories")
+
+# the cache is optional: after a failure, plan without it for a while
+_redis = RedisBackoff()
+
+
+def enabled() -> bool:
+    if PLAN_CACHE == "auto":
+        return PLANNER_BACKEND == "llm" or PLANNER_LLM_POLISH
+    return PLAN_CACHE in ("1", "true", "on")
+
+# ---------- keys ----------
+
+def _canon(v: Any) -> Any:
+    if isinstance(v, str):
+        return v.strip().lower()
+    if isinstance(v, (list, tuple, set)):
+        return sorted({str(_canon(x)) for x in v if str(x).strip()})
+    if isinstance(v, float) and v.is_integer():
+        return int(v)
+    return v
+
+
+def _digest(obj: Any) -> str:
+    raw = json.dumps(obj, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:24]
+
+
+def profile_key(prefs: Dict[str, Any], days: int, memory: List[str]) -> str:
+    """Canonical preferences + memory digest + planner mode."""
+    canon = {f: _canon(prefs.get(f)) for f in _PREF_FIELDS if prefs.get(f) not in (None, "", [])}
+    canon["days"] = int(days)
+    canon["planner"] = [PLANNER_BACKEND, PLANNER_LLM_POLISH]
+    mem = sorted(str(m).strip() for m in (memory or []) if str(m).strip())
+    return _digest([canon, mem])
+
+
+def candidates_key(candidate_ids: List[str]) -> str:
+    return _digest(sorted(set(candidate_ids)))
+
+
+def _entry_key(profile: str, cands: str) -> str:
+    return f"{PREFIX}entry:{profile}:{cands}"
+
+
+def _jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def _used_ids(plan: Dict[str, Any]) -> set:
+    return {m.get("recipe_id") for d in plan.get("days", []) for m in d.get("meals", []) if m.get("recipe_id")}
+
+
+def _grounded(plan: Dict[str, Any], candidate_ids: List[str]) -> bool:
+    return _used_ids(plan) <= set(candidate_ids)
+
+
+def _storable(plan: Dict[str, Any], candidate_ids: List[str]) -> bool:
+    # a schedule with hallucinated ids fails validation; caching it would replay the error
+    if not plan.get("days") or plan.get("error") or (plan.get("audit") or {}).get("truncated"):
+        return False
+    return _grounded(plan, candidate_ids)
+
+# ---------- lookup / store ----------
+
+def lookup(profile: str, candidate_ids: List[str]) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """Returns ("hit" | "near_hit" | "miss", entry)."""
+    r = _redis.client()
+    if r is None:
+        return "miss", None
+
+    cands = candidates_key(candidate_ids)
+    try:
+        raw = r.get(_entry_key(profile, cands))
+        status = "hit" if raw else "miss"
+        key = _entry_key(profile, cands)
+
+        if not raw and PLAN_CACHE_NEAR_HIT > 0:
+            # opt-in: one HGETALL per miss over at most MAX_NEAR_CANDIDATES sets
+            current = set(candidate_ids)
+            best = None
+            for other, ids_raw in (r.hgetall(PREFIX + "profile:" + profile) or {}).items():
+                ids = set(json.loads(ids_raw))
+                score = _jaccard(current, ids)
+                if score >= PLAN_CACHE_NEAR_HIT and (best is None or score > best[0]):
+                    best = (score, other)
+            if best:
+                key = _entry_key(profile, best[1])
+                raw = r.get(key)
+                status = "near_hit" if raw else "miss"
+
+        if not raw:
+            return "miss", None
+
+        entry = json.loads(raw)
+        # a reused plan must stay grounded in the recipes retrieved now
+        if not _grounded(entry["plan"], candidate_ids):
+            if status == "hit":
+                r.delete(key)  # stored before this check existed: never valid for these candidates
+            return "miss", None
+
+        pipe = r.pipeline(transaction=False)
+        pipe.zadd(LRU_KEY, {key: time.time()})
+        pipe.expire(key, PLAN_CACHE_TTL)
+        pipe.execute()
+        return status, entry
+    except Exception:
+        _redis.failed()
+        return "miss", None
+
+
+def store(profile: str, candidate_ids: List[str], plan: Dict[str, Any], compute_ms: float) -> None:
+    r = _redis.client()
+    if r is None:
+        return
+
+    cands = candidates_key(candidate_ids)
+    key = _entry_key(profile, cands)
+    profile_hash = PREFIX + "profile:" + profile
+    entry = {"plan": plan, "candidate_ids": sorted(set(candidate_ids)), "compute_ms": round(compute_ms, 1)}
+    try:
+        pipe = r.pipeline(transaction=False)
+        pipe.set(key, json.dumps(entry, separators=(",", ":")), ex=PLAN_CACHE_TTL)
+        pipe.zadd(LRU_KEY, {key: time.time()})
+        pipe.zremrangebyscore(LRU_KEY, "-inf", time.time() - PLAN_CACHE_TTL)
+        pipe.zcard(LRU_KEY)
+        if PLAN_CACHE_NEAR_HIT > 0:
+            pipe.hset(profile_hash, cands, json.dumps(entry["candidate_ids"]))
+            pipe.expire(profile_hash, PLAN_CACHE_TTL)
+            pipe.hlen(profile_hash)
+        res = pipe.execute()
+        size, near = res[3], (res[-1] if PLAN_CACHE_NEAR_HIT > 0 else 0)
+
+        if size > PLAN_CACHE_MAX_ENTRIES:
+            evicted = [k for k, _ in r.zpopmin(LRU_KEY, size - PLAN_CACHE_MAX_ENTRIES)]
+            if evicted:
+                r.delete(*evicted)
+        if near > MAX_NEAR_CANDIDATES:
+            # drop near-hit pointers whose entries were evicted or expired
+            stale = [f for f in r.hkeys(profile_hash) if not r.exists(_entry_key(profile, f))]
+            if stale:
+                r.hdel(profile_hash, *stale)
+    except Exception:
+        _redis.failed()
+
+
+_STAT_FIELDS = {"hit": "hits", "near_hit": "near_hits", "miss": "misses"}
+
+
+def _record(status: str, saved_ms: float) -> Dict[str, Any]:
+    r = _redis.client()
+    if r is None:
+        return {}
+    try:
+        pipe = r.pipeline(transaction=False)
+        pipe.hincrby(STATS_KEY, _STAT_FIELDS[status], 1)
+        if saved_ms > 0:
+            pipe.hincrbyfloat(STATS_KEY, "saved_ms", saved_ms)
+        pipe.hgetall(STATS_KEY)
+        stats = pipe.execute()[-1]
+    except Exception:
+        _redis.failed()
+        return {}
+
+    hits = int(stats.get("hits", 0)) + int(stats.get("near_hits", 0))
+    total = hits + int(stats.get("misses", 0))
+    return {
+        "hit_rate": round(hits / total, 3) if total else 0.0,
+        "total_saved_ms": round(float(stats.get("saved_ms", 0.0))),
+    }
+
+
+def stats() -> Dict[str, Any]:
+    r = _redis.client()
+    if r is None:
+        return {"ok": False, "error": "redis unavailable"}
+    try:
+        s = r.hgetall(STATS_KEY) or {}
+        entries = r.zcard(LRU_KEY)
+    except Exception as e:
+        _redis.failed()
+        return {"ok": False, "error": str(e)}
+    hits, near, misses = int(s.get("hits", 0)), int(s.get("near_hits", 0)), int(s.get("misses", 0))
+    total = hits + near + misses
+    return {
+        "ok": True,
+        "entries": entries,
+        "hits": hits,
+        "near_hits": near,
+        "misses": misses,
+        "hit_rate": round((hits + near) / total, 3) if total else 0.0,
+        "saved_ms": round(float(s.get("saved_ms", 0.0))),
+    }
+
+# ---------- wrappers around the schedule step ----------
+
+def _audit(status: str, profile: str, entry: Optional[Dict[str, Any]], lookup_ms: float, compute_ms: float) -> Dict[str, Any]:
+    saved = max(0.0, float(entry.get("compute_ms", 0.0)) - lookup_ms) if entry else 0.0
+    audit = {
+        "status": status,
+        "profile": profile[:12],
+        "lookup_ms": round(lookup_ms, 1),
+        "compute_ms": round(compute_ms, 1),
+        "saved_ms": round(saved, 1),
+    }
+    audit.update(_record(status, saved))
+    return audit
+
+
+def _with_audit(plan: Dict[str, Any], audit: Dict[str, Any]) -> Dict[str, Any]:
+    plan = json.loads(json.dumps(plan))
+    plan.setdefault("audit", {})["plan_cache"] = audit
+    return plan
+
+
+def cached_plan(
+    prefs: Dict[str, Any],
+    days: int,
+    candidates: List[Dict[str, Any]],
+    memory: List[str],
+    compute: Callable[[], Dict[str, Any]],
+) -> Dict[str, Any]:
+    """Returns compute() or a cached schedule for the same profile and candidates."""
+    if not enabled():
+        return compute()
+
+    profile = profile_key(prefs, days, memory)
+    ids = [r["id"] for r in candidates if r.get("id")]
+
+    t0 = time.perf_counter()
+    status, entry = lookup(profile, ids)
+    lookup_ms = (time.perf_counter() - t0) * 1000
+    if entry:
+        return _with_audit(entry["plan"], _audit(status, profile, entry, lookup_ms, 0.0))
+
+    t0 = time.perf_counter()
+    plan = compute()
+    compute_ms = (time.perf_counter() - t0) * 1000
+    if _storable(plan, ids):
+        store(profile, ids, plan, compute_ms)
+    return _with_audit(plan, _audit("miss", profile, None, lookup_ms, compute_ms))
+
+
+async def acached_plan(
+    prefs: Dict[str, Any],
+    days: int,
+    candidates: List[Dict[str, Any]],
+    memory: List[str],
+    compute: Callable[[], Awaitable[Dict[str, Any]]],
+) -> Dict[str, Any]:
+    """Async cached_plan; Redis calls go through the blocking executor."""
+    if not enabled():
+        return await compute()
+
+    profile = profile_key(prefs, days, memory)
+    ids = [r["id"] for r in candidates if r.get("id")]
+
+    t0 = time.perf_counter()
+    status, entry = await run_blocking(lookup, profile, ids)
+    lookup_ms = (time.perf_counter() - t0) * 1000
+    if entry:
+        audit = await run_blocking(_audit, status, profile, entry, lookup_ms, 0.0)
+        return _with_audit(entry["plan"], audit)
+
+    t0 = time.perf_counter()
+    plan = await compute()
+    compute_ms = (time.perf_counter() - t0) * 1000
+    if _storable(plan, ids):
+        await run_blocking(store, profile, ids, plan, compute_ms)
+    audit = await run_blocking(_audit, "miss", profile, None, lookup_ms, compute_ms)
+    return _with_audit(plan, audit)
@@ -0,0 +1,133 @@
+# app/services/plan_stream.py
+import json, asyncio
+from typing import Dict, Any, List, Callable, Awaitable, AsyncIterator, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from app.services.json_stream import JsonArrayStream
+
+# Server-sent events for the planners. A planner run gets an `emit(event, data)`
+# callback (safe to call from worker threads) and reports:
+#   stage      {"stage": "candidates" | "memory" | "bootstrap" | ..., ...}
+#   day        one day of the plan, as soon as it is known
+#   groceries  {"grocery_list": [...], "kroger_payload": [...]}
+#   done       the same body the non-streaming endpoint returns
+#   pending    {"job_id", "status_url", ...} when the work continues in a background job
+#   error      {"status": int, "detail": ...}
+Emit = Callable[[str, Dict[str, Any]], None]
+
+KEEPALIVE_SECONDS = 10
+
+
+def sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def sse_events(run: Callable[[Emit], Awaitable[Dict[str, Any]]]) -> AsyncIterator[str]:
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    def emit(event: str, data: Dict[str, Any]) -> None:
+        loop.call_soon_threadsafe(queue.put_nowait, (event, data))
+
+    async def producer() -> None:
+        try:
+            result = await run(emit)
+            if isinstance(result, JSONResponse) and result.status_code == 202:
+                # accepted for background work (e.g. corpus bootstrap): the body carries the job handle
+                emit("pending", json.loads(result.body))
+            elif isinstance(result, dict) and result.get("error") and not result.get("days"):
+                emit("error", {"status": 422, "detail": result})
+            else:
+                emit("done", result)
+        except HTTPException as e:
+            emit("error", {"status": e.status_code, "detail": e.detail})
+        except Exception as e:
+            emit("error", {"status": 500, "detail": str(e)})
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+
+    task = asyncio.create_task(producer())
+    try:
+        # first byte goes out immediately; clients time out on TTFB, not total time
+        yield sse("stage", {"stage": "started"})
+        while True:
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if item is None:
+                break
+            yield sse(*item)
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+def sse_response(run: Callable[[Emit], Awaitable[Dict[str, Any]]]) -> StreamingResponse:
+    return StreamingResponse(
+        sse_events(run),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def astream_json_days(aclient, messages: List[Dict[str, str]], on_day: Optional[Callable[[Dict[str, Any]], None]], **kwargs) -> Dict[str, Any]:
+    """
+    Streams a JSON-object completion shaped like {"days": [...], ...}, calling
+    on_day for every day as soon as it is complete. Returns the parsed object.
+    A completion cut off mid-way returns the days that parsed, with
+    audit["truncated"] set; one cut off before any day raises ValueError.
+    """
+    # include_usage: the last chunk carries token usage (no choices), for metrics and the gateway
+    stream = await aclient.chat.completions.create(stream=True, stream_options={"include_usage": True}, **kwargs, messages=messages)
+    parser = JsonArrayStream("days")
+    parts: List[str] = []
+    days: List[Dict[str, Any]] = []
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content or ""
+        parts.append(delta)
+        for day in parser.feed(delta):
+            days.append(day)
+            if on_day:
+                on_day(day)
+
+    try:
+        return json.loads("".join(parts))
+    except ValueError:
+        if not days:
+            raise ValueError("Planner response was truncated before the first day.")
+        # keep the days that parsed, but say the plan is incomplete
+        return {"days": days, "audit": {"truncated": True}}
+
+
+class GroundedDays:
+    """
+    on_day callback that emits "day" events only for days whose recipe_ids
+    are all among the candidates. After the first ungrounded day nothing
+    more is emitted; the planner's final validation reports the error.
+    """
+
+    def __init__(self, emit: Optional[Emit], candidates: List[Dict[str, Any]]):
+        self._emit = emit
+        self._allowed = {r["id"] for r in candidates}
+        self._seen = 0
+        self._broken = False
+
+    def __call__(self, day: Dict[str, Any]) -> None:
+        self._seen += 1
+        if self._broken or not self._emit:
+            return
+        if any(m.get("recipe_id") and m["recipe_id"] not in self._allowed for m in day.get("meals") or []):
+            self._broken = True
+            return
+        self._emit("day", day)
+
+    def finish(self, plan: Dict[str, Any]) -> None:
+        """Emits the plan's days that were not streamed (cache hits, local solver)."""
+        for day in (plan.get("days") or [])[self._seen:]:
+            self(day)
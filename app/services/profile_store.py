@@ -0,0 +1,104 @@
+# app/services/profile_store.py
+import ast, json
+from typing import Dict, Any, List, Optional, Iterable, Tuple
+
+from app.services.redis_client import get_redis
+
+# Per-user profile fields, one JSON value per key:
+#   user:<chat_id>:preferences
+#   user:<chat_id>:location
+# Older values were written with str(dict); they are parsed with
+# ast.literal_eval (never eval) and rewritten as JSON on first read.
+FIELDS = ("preferences", "location")
+MGET_CHUNK = 1000
+
+
+def _key(chat_id: str, field: str) -> str:
+    return f"user:{chat_id}:{field}"
+
+
+def _decode(raw: Optional[str]) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """Returns (value, is_legacy)."""
+    if not raw:
+        return None, False
+    try:
+        return json.loads(raw), False
+    except ValueError:
+        pass
+    try:
+        value = ast.literal_eval(raw)
+    except (ValueError, SyntaxError):
+        return None, False
+    return (value, True) if isinstance(value, dict) else (None, False)
+
+
+def _encode(value: Dict[str, Any]) -> str:
+    return json.dumps(value, separators=(",", ":"), default=str)
+
+
+def _rewrite(items: Dict[str, Dict[str, Any]]) -> None:
+    if not items:
+        return
+    try:
+        get_redis().mset({k: _encode(v) for k, v in items.items()})
+    except Exception as e:
+        print("Profile migration write failed:", e)
+
+# ---------- single user ----------
+
+def _get(chat_id: str, field: str) -> Optional[Dict[str, Any]]:
+    key = _key(chat_id, field)
+    value, legacy = _decode(get_redis().get(key))
+    if legacy:
+        _rewrite({key: value})
+    return value
+
+
+def _save(chat_id: str, field: str, value: Dict[str, Any]) -> None:
+    get_redis().set(_key(chat_id, field), _encode(value))
+
+
+def get_preferences(chat_id: str) -> Optional[Dict[str, Any]]:
+    return _get(chat_id, "preferences")
+
+
+def save_preferences(chat_id: str, preferences: Dict[str, Any]) -> None:
+    _save(chat_id, "preferences", preferences)
+
+
+def get_location(chat_id: str) -> Optional[Dict[str, Any]]:
+    return _get(chat_id, "location")
+
+
+def save_location(chat_id: str, location: Dict[str, Any]) -> None:
+    _save(chat_id, "location", location)
+
+# ---------- bulk ----------
+
+def get_profiles(chat_ids: Iterable[str], fields: Iterable[str] = FIELDS) -> Dict[str, Dict[str, Any]]:
+    """
+    Many users' profiles in one round trip (a pipeline of MGET chunks).
+    Returns {chat_id: {"preferences": {...} | None, "location": {...} | None}}.
+    """
+    ids = list(dict.fromkeys(str(c) for c in chat_ids))
+    fields = [f for f in fields if f in FIELDS]
+    keys = [_key(c, f) for c in ids for f in fields]
+    if not keys:
+        return {}
+
+    pipe = get_redis().pipeline(transaction=False)
+    for i in range(0, len(keys), MGET_CHUNK):
+        pipe.mget(keys[i:i + MGET_CHUNK])
+    raws: List[Optional[str]] = [raw for chunk in pipe.execute() for raw in chunk]
+
+    out: Dict[str, Dict[str, Any]] = {c: {} for c in ids}
+    legacy: Dict[str, Dict[str, Any]] = {}
+    n = len(fields)
+    for i, raw in enumerate(raws):
+        chat_id, field = ids[i // n], fields[i % n]
+        value, is_legacy = _decode(raw)
+        out[chat_id][field] = value
+        if is_legacy:
+            legacy[keys[i]] = value
+    _rewrite(legacy)
+    return out
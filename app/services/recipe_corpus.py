@@ -1,15 +1,20 @@
 # app/services/recipe_corpus.py
-import os, json, time
-from typing import Dict, Any, List, Optional
+import os, json, time, queue, contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Iterator
 from dotenv import load_dotenv
-from openai import OpenAI
 import json
 
-from app.services.pinecone_client import get_pinecone_index
+from app.config import get_openai
+from app.services.json_stream import JsonArrayStream
+from app.services.recipe_filters import ingredient_id, ingredient_tokens, diet_flags, request_filter, exclusion_ids, uses_excluded
+from app.services.recipe_store import hydrate_matches
+from app.services.blocking_executor import run_blocking
+from app.services.pinecone_client import get_pinecone_index, get_async_index
+from app.services.embeddings import embed_texts, aembed_texts
 
 load_dotenv(override=True)
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 RECIPES_NS = "recipes"
 
@@ -25,8 +30,7 @@ def _as_list(x) -> List[str]:
     return []
 
 def _embed_texts(texts: List[str]) -> List[List[float]]:
-    resp = client.embeddings.create(model="text-embedding-3-large", input=texts)
-    return [d.embedding for d in resp.data]
+    return embed_texts(texts)
 
 def _recipe_to_search_text(r: Dict[str, Any]) -> str:
     ings = ", ".join([i.get("name","") for i in r.get("ingredients", []) if i.get("name")])
@@ -39,7 +43,14 @@ def _new_recipe_id(prefix: str = "r") -> str:
 
 # ---------- generation ----------
 
-def generate_recipe_cards(payload: Dict[str, Any], n: int = 20) -> List[Dict[str, Any]]:
+# one streamed completion per shard; shards run concurrently
+SHARD_SIZE = int(os.getenv("RECIPE_SHARD_SIZE", "15"))
+SHARD_CONCURRENCY = int(os.getenv("RECIPE_SHARD_CONCURRENCY", "4"))
+
+# rotated across shards so parallel shards do not converge on the same dishes
+SHARD_FOCUS = ["breakfast", "lunch", "dinner", "one-pot and batch-cook meals"]
+
+def _generation_messages(payload: Dict[str, Any], n: int, focus: Optional[str] = None) -> List[Dict[str, str]]:
     diet = payload.get("diet") or payload.get("food_preference") or "any"
     cuisines = _as_list(payload.get("cuisines") or payload.get("cuisinePreference"))
     pantry = _as_list(payload.get("ingredients_at_home") or payload.get("ingredientsAtHome") or payload.get("available_ingredients"))
@@ -88,19 +99,16 @@ def generate_recipe_cards(payload: Dict[str, Any], n: int = 20) -> List[Dict[str
             ]
         }
     }
+    if focus:
+        user_prompt["focus"] = f"Mostly {focus} recipes; include the meal type in tags."
 
-    resp = client.chat.completions.create(
-        model="gpt-4-turbo",
-        temperature=0.2,
-        response_format={"type": "json_object"},  # <-- important
-        messages=[
-            {"role": "system", "content": "You generate clean JSON for a recipe corpus."},
-            {"role": "user", "content": json.dumps(user_prompt)},
-        ],
-    )
+    return [
+        {"role": "system", "content": "You generate clean JSON for a recipe corpus."},
+        {"role": "user", "content": json.dumps(user_prompt)},
+    ]
 
-    
-    content = resp.choices[0].message.content
+def _parse_recipes(content: str) -> List[Dict[str, Any]]:
+    # Tolerant full-document parse, used when a streamed shard yields nothing
     data = json.loads(content)
 
     
@@ -124,120 +132,218 @@ def generate_recipe_cards(payload: Dict[str, Any], n: int = 20) -> List[Dict[str
     if not isinstance(recipes, list):
         raise ValueError(f"Expected list of recipes, got: {type(recipes)} -> {recipes}")
 
-    
-    cleaned: List[Dict[str, Any]] = []
-    for r in recipes:
-        if not isinstance(r, dict):
-            continue
-        if not r.get("id"):
-            r["id"] = _new_recipe_id("r")
-        cleaned.append(r)
-
-    return cleaned
-
+    return [r for r in recipes if isinstance(r, dict)]
+
+def _num(x) -> Optional[float]:
+    try:
+        return float(x) if x not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+def _validate_card(r: Dict[str, Any], exclusions: List[str]) -> Optional[Dict[str, Any]]:
+    """Returns a cleaned recipe card, or None if it is unusable or uses an excluded ingredient."""
+    title = str(r.get("title") or "").strip()
+    steps = [str(s) for s in (r.get("steps") or []) if str(s).strip()]
+    ingredients = [
+        i for i in (r.get("ingredients") or [])
+        if isinstance(i, dict) and str(i.get("name") or "").strip()
+    ]
+    if not title or not steps or not ingredients:
+        return None
+
+    names = [str(i["name"]).lower() for i in ingredients]
+    if any(ex in name for ex in exclusions for name in names):
+        return None
+
+    r["title"] = title
+    r["steps"] = steps
+    r["ingredients"] = ingredients
+    r["tags"] = [str(t) for t in (r.get("tags") or []) if isinstance(t, str)]
+    r["time_minutes"] = _num(r.get("time_minutes"))
+    r["kcal"] = _num(r.get("kcal"))
+    if not r.get("id"):
+        r["id"] = _new_recipe_id("r")
+    return r
+
+def _title_key(title: str) -> str:
+    return "".join(ch for ch in title.lower() if ch.isalnum())
+
+def _stream_shard(payload: Dict[str, Any], n: int, focus: Optional[str], emit) -> None:
+    stream = get_openai().chat.completions.create(
+        model="gpt-4-turbo",
+        temperature=0.2,
+        response_format={"type": "json_object"},  # <-- important
+        stream=True,
+        stream_options={"include_usage": True},  # usage on the last chunk, for metrics and the gateway
+        messages=_generation_messages(payload, n, focus),
+    )
 
-def upsert_recipe_cards(user_id: str,recipes: List[Dict[str, Any]]) -> Dict[str, Any]:
-    index = get_pinecone_index()
-    if not index:
-        return {"ok": False, "error": "Pinecone not configured"}
-
-    # Optional cleanup
-    cleaned = []
-    for r in recipes:
-        if isinstance(r, dict) and r.get("title") and r.get("ingredients") and r.get("steps"):
-            cleaned.append(r)
-    recipes = cleaned
-
-    texts = [_recipe_to_search_text(r) for r in recipes]
-    embs = _embed_texts(texts)
-
-    vectors = []
-    for r, e in zip(recipes, embs):
-        rid = r["id"]
-
-        ingredient_names = [
-            str(i.get("name", "")).strip()
-            for i in (r.get("ingredients") or [])
-            if isinstance(i, dict) and str(i.get("name", "")).strip()
-        ]
-
-        meta = {
-            "user_id": str(user_id),
-            "title": str(r.get("title", ""))[:500],
-            "tags": [str(t) for t in (r.get("tags") or []) if isinstance(t, str)][:20],  # list of strings OK
-            "time_minutes": float(r.get("time_minutes") or 0) if r.get("time_minutes") is not None else None,
-            "kcal": float(r.get("kcal") or 0) if r.get("kcal") is not None else None,
-
-           
-            "ingredient_names": ingredient_names[:80],  # list of strings OK
-            "steps_text": " | ".join([str(s) for s in (r.get("steps") or [])])[:5000],  # string OK
-
-           
-            "ingredients_json": json.dumps(r.get("ingredients") or [])[:15000],
-            "steps_json": json.dumps(r.get("steps") or [])[:15000],
-        }
+    parser = JsonArrayStream("recipes")
+    text = []
+    emitted = 0
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content or ""
+        text.append(delta)
+        for r in parser.feed(delta):
+            emit(r)
+            emitted += 1
+
+    if not emitted:
+        for r in _parse_recipes("".join(text)):
+            emit(r)
+
+def stream_recipe_cards(payload: Dict[str, Any], n: int = 20) -> Iterator[Dict[str, Any]]:
+    """
+    Generates n recipe cards as concurrent streamed shards and yields each
+    validated, de-duplicated (by title, across shards) card as soon as its
+    JSON object is complete.
+    """
+    exclusions = [e.lower() for e in _as_list(payload.get("exclusions") or payload.get("includeIngredients"))]
+
+    sizes = [SHARD_SIZE] * (n // SHARD_SIZE)
+    if n % SHARD_SIZE:
+        sizes.append(n % SHARD_SIZE)
+
+    q: "queue.Queue" = queue.Queue()
+    done = object()
+
+    def run(i: int, size: int) -> None:
+        try:
+            focus = SHARD_FOCUS[i % len(SHARD_FOCUS)] if len(sizes) > 1 else None
+            _stream_shard(payload, size, focus, q.put)
+        except Exception as e:
+            print(f"Recipe shard {i} failed: {e}")
+        finally:
+            q.put(done)
+
+    pool = ThreadPoolExecutor(max_workers=max(1, min(SHARD_CONCURRENCY, len(sizes))), thread_name_prefix="recipe-shard")
+    for i, size in enumerate(sizes):
+        # shards inherit the caller's context (LLM priority, request trace)
+        pool.submit(contextvars.copy_context().run, run, i, size)
+    pool.shutdown(wait=False)
+
+    seen_titles = set()
+    remaining = len(sizes)
+    produced = 0
+    while remaining:
+        item = q.get()
+        if item is done:
+            remaining -= 1
+            continue
+        if produced >= n:
+            continue
+        card = _validate_card(item, exclusions)
+        if not card:
+            continue
+        key = _title_key(card["title"])
+        if key in seen_titles:
+            continue
+        seen_titles.add(key)
+        produced += 1
+        yield card
 
-        # Remove None values (safer for some Pinecone setups)
-        meta = {k: v for k, v in meta.items() if v is not None}
+def generate_recipe_cards(payload: Dict[str, Any], n: int = 20) -> List[Dict[str, Any]]:
+    return list(stream_recipe_cards(payload, n))
+
+
+def _is_valid_recipe(r: Any) -> bool:
+    return isinstance(r, dict) and bool(r.get("title") and r.get("ingredients") and r.get("steps"))
+
+def _recipe_vector(user_id: str, r: Dict[str, Any], e: List[float]):
+    rid = r["id"]
+
+    ingredient_names = [
+        str(i.get("name", "")).strip()
+        for i in (r.get("ingredients") or [])
+        if isinstance(i, dict) and str(i.get("name", "")).strip()
+    ]
+
+    meta = {
+        "user_id": str(user_id),
+        "title": str(r.get("title", ""))[:500],
+        "tags": [str(t) for t in (r.get("tags") or []) if isinstance(t, str)][:20],  # list of strings OK
+        "time_minutes": _num(r.get("time_minutes")),
+        "kcal": _num(r.get("kcal")),
+
+        # filterable fields for request_filter() ($nin / $in / $lte)
+        "ingredient_ids": sorted({ingredient_id(n) for n in ingredient_names} - {""})[:80],
+        "ingredient_tokens": ingredient_tokens(ingredient_names)[:200],
+        "diet_flags": diet_flags(r),
+        # bodies (ingredients, steps) live in recipe_store; records written
+        # before that still carry ingredients_json/steps_json (body_from_metadata)
+    }
 
-        vectors.append((rid, e, meta))
+    # Remove None values (safer for some Pinecone setups)
+    meta = {k: v for k, v in meta.items() if v is not None}
 
-    index.upsert(vectors=vectors, namespace=RECIPES_NS)
-    return {"ok": True, "count": len(vectors)}
+    return (rid, e, meta)
 
-def retrieve_recipes_for_request(user_id: str, req: Dict[str, Any], top_k: int = 30) -> List[Dict[str, Any]]:
-    index = get_pinecone_index()
-    if not index:
-        return []
+def upsert_recipe_cards(user_id: str,recipes: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # Batched, parallel path (see recipe_ingest.py); invalid recipes are skipped there
+    from app.services.recipe_ingest import ingest_recipes
+    return ingest_recipes(user_id, recipes)
 
+def _request_query(req: Dict[str, Any]) -> str:
     diet = req.get("diet") or req.get("food_preference") or "any"
     cuisines = _as_list(req.get("cuisines") or req.get("cuisinePreference"))
     pantry = _as_list(req.get("ingredients_at_home") or req.get("ingredientsAtHome") or req.get("available_ingredients"))
     exclusions = _as_list(req.get("exclusions") or req.get("includeIngredients"))
     days = int(req.get("days") or 7)
 
-    query = (
+    return (
         f"Recipes for diet={diet}, cuisines={', '.join(cuisines) or 'any'}. "
         f"Pantry: {', '.join(pantry) or 'none'}. Exclude: {', '.join(exclusions) or 'none'}. "
         f"Practical meals for {days} days."
     )
 
-    q_emb = _embed_texts([query])[0]
+def _request_exclusions(req: Dict[str, Any]) -> List[str]:
+    return _as_list(req.get("exclusions") or req.get("includeIngredients"))
+
+def _request_filter(user_id: str, req: Dict[str, Any]) -> Dict[str, Any]:
+    return request_filter(
+        user_id,
+        diet=req.get("diet") or req.get("food_preference"),
+        exclusions=_request_exclusions(req),
+        max_time_minutes=req.get("max_time_minutes"),
+    )
+
+def _drop_excluded(recipes: List[Dict[str, Any]], req: Dict[str, Any]) -> List[Dict[str, Any]]:
+    # recipes stored without ingredient_tokens only get exact-id filtering in the query
+    ex_ids = exclusion_ids(_request_exclusions(req))
+    return [r for r in recipes if not uses_excluded(r, ex_ids)] if ex_ids else recipes
+
+def retrieve_recipes_for_request(user_id: str, req: Dict[str, Any], top_k: int = 30) -> List[Dict[str, Any]]:
+    index = get_pinecone_index()
+    if not index:
+        return []
+
+    q_emb = _embed_texts([_request_query(req)])[0]
     res = index.query(
         vector=q_emb,
         top_k=top_k,
-        include_metadata=True,
+        include_metadata=False,
         namespace=RECIPES_NS,
-        filter={"user_id": str(user_id)}
+        filter=_request_filter(user_id, req)
     )
 
-    matches = res.get("matches") or []
+    # ids + scores only; bodies come from the recipe store in one bulk read
+    return _drop_excluded(hydrate_matches(index, res.get("matches") or [], RECIPES_NS), req)
 
-    out: List[Dict[str, Any]] = []
-    for m in matches:
-        md = m.get("metadata") or {}
+async def aretrieve_recipes_for_request(user_id: str, req: Dict[str, Any], top_k: int = 30) -> List[Dict[str, Any]]:
+    index = get_async_index()
+    if not index:
+        return []
 
-        # Decode full-fidelity fields stored as JSON strings
-        try:
-            ingredients = json.loads(md.get("ingredients_json", "[]"))
-        except Exception:
-            ingredients = []
+    q_emb = (await aembed_texts([_request_query(req)]))[0]
+    res = await index.query(
+        vector=q_emb,
+        top_k=top_k,
+        include_metadata=False,
+        namespace=RECIPES_NS,
+        filter=_request_filter(user_id, req)
+    )
 
-        try:
-            steps = json.loads(md.get("steps_json", "[]"))
-        except Exception:
-            steps = []
-
-        out.append({
-            "id": m.get("id"),
-            "score": m.get("score"),
-            "title": md.get("title"),
-            "tags": md.get("tags", []),
-            "time_minutes": md.get("time_minutes"),
-            "kcal": md.get("kcal"),
-            "ingredients": ingredients,
-            "steps": steps,
-            "ingredient_names": md.get("ingredient_names", []),
-        })
-
-    return out
+    recipes = await run_blocking(hydrate_matches, get_pinecone_index(), res.get("matches") or [], RECIPES_NS)
+    return _drop_excluded(recipes, req)
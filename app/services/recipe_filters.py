@@ -0,0 +1,146 @@
+# app/services/recipe_filters.py
+import re
+from typing import Dict, Any, List, Optional
+
+from app.services.grocery_aggregate import norm_name
+
+# Filterable recipe metadata written at ingest (see recipe_corpus._recipe_vector):
+#   ingredient_ids  canonical ingredient ids, e.g. "cherry tomatoes" -> "cherry_tomato"
+#   ingredient_tokens  every run of consecutive words of those ids, e.g.
+#                   "jumbo shrimp" -> jumbo, shrimp, jumbo_shrimp; exclusions match these
+#   diet_flags      "vegetarian" / "vegan" / "gluten_free"
+#   time_minutes, kcal  numbers
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+# whole words, singular; plurals are matched by the pattern
+_MEAT_FISH = (
+    "chicken", "beef", "pork", "bacon", "ham", "hamburger", "lamb", "turkey", "sausage", "prosciutto",
+    "salami", "pepperoni", "chorizo", "veal", "duck", "fish", "salmon", "tuna", "cod",
+    "shrimp", "prawn", "crab", "crabmeat", "lobster", "anchovy", "anchovies", "sardine", "mussel", "clam",
+    "oyster", "scallop", "gelatin", "gelatine",
+)
+_ANIMAL = ("egg", "milk", "buttermilk", "cheese", "butter", "cream", "yogurt", "yoghurt", "honey", "ghee",
+           "whey", "mayonnaise")
+_GLUTEN = ("wheat", "flour", "bread", "breadcrumb", "flatbread", "pasta", "spaghetti", "noodle", "barley",
+           "rye", "couscous", "tortilla", "pita", "bun", "panko", "seitan", "soy sauce", "cracker")
+# names that contain a keyword above but are fine
+_EXCEPTIONS = ("eggplant", "butternut", "peanut butter", "almond butter", "coconut milk", "almond milk",
+               "oat milk", "soy milk", "coconut cream", "rice noodle", "corn tortilla", "rice flour",
+               "almond flour", "coconut flour", "chickpea flour", "tamari")
+
+_DIET_ALIASES = {
+    "veg": "vegetarian", "vegetarian": "vegetarian", "veggie": "vegetarian", "lacto-ovo": "vegetarian",
+    "vegan": "vegan", "plant-based": "vegan", "plant based": "vegan",
+    "gluten free": "gluten_free", "gluten-free": "gluten_free", "gf": "gluten_free", "celiac": "gluten_free",
+}
+
+
+def _singular(word: str) -> str:
+    if len(word) <= 3 or word.endswith(("ss", "us", "is")):
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith("oes"):
+        return word[:-2]
+    if word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+def ingredient_id(name: str) -> str:
+    words = [w for w in _NON_WORD.split(norm_name(str(name or ""))) if w]
+    if words:
+        words[-1] = _singular(words[-1])
+    return "_".join(words)
+
+
+def ingredient_tokens(names: List[str]) -> List[str]:
+    """
+    Word n-grams of each ingredient id, so an exclusion matches whole words:
+    "shrimp" hits jumbo_shrimp, "peanut" hits peanut_butter, "egg" misses eggplant.
+    """
+    out = set()
+    for n in names:
+        words = [w for w in ingredient_id(n).split("_") if w]
+        for i in range(len(words)):
+            for j in range(i + 1, len(words) + 1):
+                out.add("_".join(words[i:j - 1] + [_singular(words[j - 1])]))
+    return sorted(out)
+
+
+def exclusion_ids(exclusions: List[str]) -> List[str]:
+    return sorted({ingredient_id(e) for e in exclusions} - {""})
+
+
+def uses_excluded(r: Dict[str, Any], ex_ids: List[str]) -> bool:
+    names = [str(i.get("name") or "") for i in (r.get("ingredients") or []) if isinstance(i, dict)]
+    return not set(ex_ids).isdisjoint(ingredient_tokens(names))
+
+
+def _whole_word_re(words) -> "re.Pattern":
+    # whole words plus a plural ending: "bun" hits "buns" but not "bunch", "honey" misses "honeydew"
+    return re.compile(r"\b(?:%s)(?:s|es)?\b" % "|".join(re.escape(w) for w in words))
+
+
+_MEAT_FISH_RE = _whole_word_re(_MEAT_FISH)
+_ANIMAL_RE = _whole_word_re(_ANIMAL)
+_GLUTEN_RE = _whole_word_re(_GLUTEN)
+
+
+def _contains(names: List[str], pattern: "re.Pattern") -> bool:
+    for n in names:
+        if any(ex in n for ex in _EXCEPTIONS):
+            continue
+        if pattern.search(n):
+            return True
+    return False
+
+
+def diet_flags(r: Dict[str, Any]) -> List[str]:
+    # not norm_name: it folds "corn tortillas" into "tortillas" and loses the exception
+    names = [str(i.get("name") or "").strip().lower() for i in (r.get("ingredients") or []) if isinstance(i, dict)]
+    tags = {str(t).strip().lower() for t in (r.get("tags") or [])}
+
+    flags = []
+    meat = _contains(names, _MEAT_FISH_RE)
+    if not meat or "vegetarian" in tags:
+        flags.append("vegetarian")
+        if not _contains(names, _ANIMAL_RE) or "vegan" in tags:
+            flags.append("vegan")
+    if not _contains(names, _GLUTEN_RE) or tags & {"gluten-free", "gluten free", "gluten_free"}:
+        flags.append("gluten_free")
+    return flags
+
+
+def diet_flag(diet: Optional[str]) -> Optional[str]:
+    return _DIET_ALIASES.get(str(diet or "").strip().lower())
+
+
+def request_filter(user_id: str, diet: Optional[str], exclusions: List[str], max_time_minutes: Any = None) -> Dict[str, Any]:
+    """
+    Pinecone metadata filter for a plan request: only the user's recipes, none
+    containing an excluded ingredient, matching the diet and time budget.
+    Recipes ingested before these fields existed still pass the diet/time
+    clauses so old corpora keep working.
+    """
+    clauses: List[Dict[str, Any]] = [{"user_id": {"$eq": str(user_id)}}]
+
+    ex_ids = exclusion_ids(exclusions)
+    if ex_ids:
+        clauses.append({"ingredient_tokens": {"$nin": ex_ids}})
+        # recipes ingested before ingredient_tokens existed: exact ids only (see uses_excluded)
+        clauses.append({"ingredient_ids": {"$nin": ex_ids}})
+
+    flag = diet_flag(diet)
+    if flag:
+        clauses.append({"$or": [{"diet_flags": {"$in": [flag]}}, {"diet_flags": {"$exists": False}}]})
+
+    try:
+        max_t = float(max_time_minutes) if max_time_minutes not in (None, "") else None
+    except (TypeError, ValueError):
+        max_t = None
+    if max_t:
+        clauses.append({"$or": [{"time_minutes": {"$lte": max_t}}, {"time_minutes": {"$exists": False}}]})
+
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
@@ -0,0 +1,205 @@
+# app/services/recipe_ingest.py
+"""
+Bulk recipe ingestion: streams recipes through bounded embedding batches,
+runs several batches concurrently, upserts in request-size-safe chunks and
+retries each batch independently.
+
+CLI:
+    python -m app.services.recipe_ingest --user-id u123 --file recipes.json
+"""
+import sys, json, time, random, argparse, threading
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Any, List, Iterable, Iterator, Callable, Optional
+
+from app.config import INGEST_EMBED_BATCH, INGEST_UPSERT_BATCH, INGEST_CONCURRENCY, INGEST_MAX_RETRIES
+from app.services.pinecone_client import get_pinecone_index
+from app.services.recipe_store import put_recipes
+from app.services.recipe_corpus import (
+    RECIPES_NS,
+    _embed_texts,
+    _recipe_to_search_text,
+    _recipe_vector,
+    _is_valid_recipe,
+)
+
+
+def _batches(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    it = iter(items)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _with_retries(fn: Callable[[], Any], max_retries: int) -> Any:
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except Exception:
+            if attempt >= max_retries:
+                raise
+            # exponential backoff with jitter
+            time.sleep(min(20.0, 0.5 * (2 ** attempt)) * (0.5 + random.random()))
+            attempt += 1
+
+
+class _Progress:
+    def __init__(self, on_progress: Optional[Callable[[Dict[str, Any]], None]]):
+        self._lock = threading.Lock()
+        self._on_progress = on_progress
+        self.state = {"seen": 0, "skipped": 0, "embedded": 0, "upserted": 0, "failed": 0, "batches_done": 0}
+        self.errors: List[str] = []
+
+    def add(self, **deltas: int) -> None:
+        with self._lock:
+            for k, v in deltas.items():
+                self.state[k] += v
+            snapshot = dict(self.state)
+        if self._on_progress:
+            self._on_progress(snapshot)
+
+    def error(self, msg: str) -> None:
+        with self._lock:
+            self.errors.append(msg)
+
+
+def ingest_recipes(
+    user_id: str,
+    recipes: Iterable[Dict[str, Any]],
+    *,
+    embed_batch_size: int = INGEST_EMBED_BATCH,
+    upsert_batch_size: int = INGEST_UPSERT_BATCH,
+    concurrency: int = INGEST_CONCURRENCY,
+    max_retries: int = INGEST_MAX_RETRIES,
+    on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Embeds and upserts recipe cards for user_id. `recipes` may be any iterable
+    (including a generator); at most `concurrency` embedding batches are held
+    in memory at once. A failed batch is reported and does not stop the others.
+    """
+    index = get_pinecone_index()
+    if not index:
+        return {"ok": False, "error": "Pinecone not configured"}
+
+    progress = _Progress(on_progress)
+
+    def valid(stream: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        for r in stream:
+            if _is_valid_recipe(r):
+                progress.add(seen=1)
+                yield r
+            else:
+                progress.add(seen=1, skipped=1)
+
+    def run_batch(batch: List[Dict[str, Any]]) -> None:
+        texts = [_recipe_to_search_text(r) for r in batch]
+        try:
+            embs = _with_retries(lambda: _embed_texts(texts), max_retries)
+        except Exception as e:
+            progress.error(f"embed batch failed ({len(batch)} recipes): {e}")
+            progress.add(failed=len(batch), batches_done=1)
+            return
+        progress.add(embedded=len(batch))
+
+        # bodies live only in the recipe store: without them the vectors could not be hydrated
+        try:
+            _with_retries(lambda: put_recipes(batch), max_retries)
+        except Exception as e:
+            progress.error(f"recipe store write failed ({len(batch)} recipes): {e}")
+            progress.add(failed=len(batch), batches_done=1)
+            return
+
+        vectors = [_recipe_vector(user_id, r, e) for r, e in zip(batch, embs)]
+        for chunk in _batches(vectors, upsert_batch_size):
+            try:
+                _with_retries(lambda: index.upsert(vectors=chunk, namespace=RECIPES_NS), max_retries)
+                progress.add(upserted=len(chunk))
+            except Exception as e:
+                progress.error(f"upsert batch failed ({len(chunk)} vectors): {e}")
+                progress.add(failed=len(chunk))
+        progress.add(batches_done=1)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="ingest") as pool:
+        in_flight = set()
+        for batch in _batches(valid(recipes), embed_batch_size):
+            if len(in_flight) >= concurrency:
+                _, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            in_flight.add(pool.submit(run_batch, batch))
+        wait(in_flight)
+
+    st = progress.state
+    return {
+        "ok": st["failed"] == 0,
+        "count": st["upserted"],
+        "skipped": st["skipped"],
+        "failed": st["failed"],
+        "batches": st["batches_done"],
+        "errors": progress.errors[:10],
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+# ---------- CLI ----------
+
+def _load_recipes(path: str) -> Iterator[Dict[str, Any]]:
+    """Reads a JSON array, a {"recipes": [...]} object, or JSON Lines (streamed)."""
+    if path.endswith(".jsonl"):
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        return
+
+    with open(path) as f:
+        data = json.load(f)
+    yield from (data.get("recipes", []) if isinstance(data, dict) else data)
+
+
+def _with_ids(user_id: str, recipes: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    ts = int(time.time() * 1000)
+    for i, r in enumerate(recipes):
+        if isinstance(r, dict) and not r.get("id"):
+            r["id"] = f"r_{user_id}_{ts}_{i}"
+        yield r
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Bulk-ingest recipe cards into the recipes namespace.")
+    ap.add_argument("--user-id", required=True)
+    ap.add_argument("--file", required=True, help=".json (array or {'recipes': [...]}) or .jsonl")
+    ap.add_argument("--embed-batch", type=int, default=INGEST_EMBED_BATCH)
+    ap.add_argument("--upsert-batch", type=int, default=INGEST_UPSERT_BATCH)
+    ap.add_argument("--concurrency", type=int, default=INGEST_CONCURRENCY)
+    ap.add_argument("--retries", type=int, default=INGEST_MAX_RETRIES)
+    args = ap.parse_args(argv)
+
+    def report(p: Dict[str, Any]) -> None:
+        print(
+            f"\rseen={p['seen']} embedded={p['embedded']} upserted={p['upserted']} "
+            f"failed={p['failed']} skipped={p['skipped']}",
+            end="",
+            file=sys.stderr,
+        )
+
+    result = ingest_recipes(
+        args.user_id,
+        _with_ids(args.user_id, _load_recipes(args.file)),
+        embed_batch_size=args.embed_batch,
+        upsert_batch_size=args.upsert_batch,
+        concurrency=args.concurrency,
+        max_retries=args.retries,
+        on_progress=report,
+    )
+    print(file=sys.stderr)
+    print(json.dumps(result, indent=2))
+    return 0 if result.get("ok") else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,23 +1,24 @@
 # app/services/recipe_rag.py
-import os
 import json
 from typing import Dict, Any, List, Optional, Tuple
-from openai import OpenAI
+import numpy as np
 from dotenv import load_dotenv
 
+from app.config import RAG_PROMPT_MODE, get_openai
 from app.services.pinecone_client import get_pinecone_index
+from app.services.embeddings import embed_texts
+from app.services.recipe_store import put_recipes, hydrate_matches
+from app.services.grocery_aggregate import aggregate_groceries, to_kroger_payload
+from app.services.user_memory import store_memory, retrieve_memory
 
 load_dotenv(override=True)
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 RECIPES_NS = "recipes"
-MEMORY_NS = "user_memory"
 
 
 def _embed(texts: List[str]) -> List[List[float]]:
-    resp = client.embeddings.create(model="text-embedding-3-large", input=texts)
-    return [d.embedding for d in resp.data]
+    return embed_texts(texts)
 
 
 def recipe_to_search_text(r: Dict[str, Any]) -> str:
@@ -39,54 +40,30 @@ def upsert_recipes(recipes: List[Dict[str, Any]]) -> Dict[str, Any]:
     texts = [recipe_to_search_text(r) for r in recipes]
     embs = _embed(texts)
 
+    # bodies first: a vector is only queryable once its body can be hydrated
+    put_recipes(recipes)
+
     vectors = []
     for r, e in zip(recipes, embs):
         rid = r["id"]
         meta = {
             "title": r.get("title"),
-            "ingredients": r.get("ingredients", []),
-            "steps": r.get("steps", []),
             "tags": r.get("tags", []),
             "time_minutes": r.get("time_minutes"),
             "kcal": r.get("kcal"),
         }
-        vectors.append((rid, e, meta))
+        vectors.append((rid, e, {k: v for k, v in meta.items() if v is not None}))
 
     index.upsert(vectors=vectors, namespace=RECIPES_NS)
     return {"ok": True, "count": len(vectors)}
 
 
 def store_user_memory(user_id: str, text: str, mtype: str = "preference") -> Dict[str, Any]:
-    index = get_pinecone_index()
-    if not index:
-        return {"ok": False, "error": "Pinecone not configured"}
-
-    emb = _embed([text])[0]
-    mid = f"{user_id}:{mtype}:{abs(hash(text))}"
-
-    index.upsert(
-        vectors=[(mid, emb, {"user_id": user_id, "type": mtype, "text": text})],
-        namespace=MEMORY_NS,
-    )
-    return {"ok": True, "id": mid}
+    return store_memory(user_id, text, mtype)
 
 
 def retrieve_user_memory(user_id: str, k: int = 5) -> List[str]:
-    index = get_pinecone_index()
-    if not index:
-        return []
-
-    q = f"User food preferences, dislikes, constraints for user_id={user_id}"
-    q_emb = _embed([q])[0]
-
-    res = index.query(vector=q_emb, top_k=k, include_metadata=True, namespace=MEMORY_NS)
-    matches = res.get("matches") or []
-    out = []
-    for m in matches:
-        md = m.get("metadata") or {}
-        if md.get("user_id") == user_id and md.get("text"):
-            out.append(md["text"])
-    return out
+    return retrieve_memory(user_id, query="User food preferences, dislikes, constraints", top_k=k)
 
 
 def retrieve_recipes(query: str, k: int = 25) -> List[Dict[str, Any]]:
@@ -95,23 +72,8 @@ def retrieve_recipes(query: str, k: int = 25) -> List[Dict[str, Any]]:
         return []
 
     q_emb = _embed([query])[0]
-    res = index.query(vector=q_emb, top_k=k, include_metadata=True, namespace=RECIPES_NS)
-    matches = res.get("matches") or []
-
-    recipes = []
-    for m in matches:
-        md = m.get("metadata") or {}
-        recipes.append({
-            "id": m.get("id"),
-            "score": m.get("score"),
-            "title": md.get("title"),
-            "ingredients": md.get("ingredients", []),
-            "steps": md.get("steps", []),
-            "tags": md.get("tags", []),
-            "time_minutes": md.get("time_minutes"),
-            "kcal": md.get("kcal"),
-        })
-    return recipes
+    res = index.query(vector=q_emb, top_k=k, include_metadata=False, namespace=RECIPES_NS)
+    return hydrate_matches(index, res.get("matches") or [], RECIPES_NS)
 
 
 def _normalize_list(x) -> List[str]:
@@ -138,32 +100,71 @@ def build_recipe_query(data: Dict[str, Any]) -> str:
     )
 
 
+def _ingredient_index(candidates: List[Dict[str, Any]]) -> Tuple[List[str], List[List[int]]]:
+    """Interns lower-cased ingredient names: (unique names, per-candidate name ids)."""
+    name_id: Dict[str, int] = {}
+    names: List[str] = []
+    per_candidate: List[List[int]] = []
+    for r in candidates:
+        ids = []
+        for i in r.get("ingredients", []):
+            name = (i.get("name") or "").lower()
+            nid = name_id.get(name)
+            if nid is None:
+                nid = name_id[name] = len(names)
+                names.append(name)
+            ids.append(nid)
+        per_candidate.append(ids)
+    return names, per_candidate
+
+
+def score_candidates(candidates: List[Dict[str, Any]], pantry: set, exclude: set) -> np.ndarray:
+    """
+    score = retrieval score + 1.5 * pantry overlap - 0.02 * minutes over 25,
+    or -999 if any ingredient contains an excluded term.
+    Substring checks run once per unique ingredient name, not per recipe.
+    """
+    names, per_candidate = _ingredient_index(candidates)
+
+    pantry_terms = [p for p in pantry if p]
+    hits = [sum(1 for p in pantry_terms if p in name) for name in names]
+    banned = [any(ex in name for ex in exclude) for name in names]
+
+    n = len(candidates)
+    overlap = np.fromiter((sum(hits[i] for i in ids) for ids in per_candidate), dtype=np.float64, count=n)
+    excluded = np.fromiter((any(banned[i] for i in ids) for ids in per_candidate), dtype=bool, count=n)
+    base = np.fromiter((float(r.get("score") or 0) for r in candidates), dtype=np.float64, count=n)
+    minutes = np.fromiter((float(r.get("time_minutes") or 30) for r in candidates), dtype=np.float64, count=n)
+
+    scores = base + 1.5 * overlap - 0.02 * np.maximum(0.0, minutes - 25)
+    scores[excluded] = -999
+    return scores
+
+
 def select_recipes(candidates: List[Dict[str, Any]], target_meals: int, data: Dict[str, Any]) -> List[Dict[str, Any]]:
     """
     Simple heuristic selection:
       - prefer pantry overlap
       - prefer variety in titles/tags
     """
+    if not candidates or target_meals <= 0:
+        return []
+
     pantry = set([p.lower() for p in _normalize_list(data.get("ingredients_at_home"))])
     exclude = set([e.lower() for e in _normalize_list(data.get("exclusions"))])
 
-    def score(r: Dict[str, Any]) -> float:
-        ings = [i.get("name","").lower() for i in r.get("ingredients", [])]
-        if any(ex in ing for ex in exclude for ing in ings):
-            return -999
-        overlap = sum(1 for ing in ings for p in pantry if p and p in ing)
-        base = float(r.get("score") or 0)
-        time_minutes = r.get("time_minutes") or 30
-        time_penalty = 0.02 * max(0, time_minutes - 25)
-        return base + 1.5 * overlap - time_penalty
-
-    # sort by score
-    ranked = sorted(candidates, key=score, reverse=True)
+    # stable descending sort == sorted(..., reverse=True)
+    scores = score_candidates(candidates, pantry, exclude)
+    ranked = [candidates[i] for i in np.argsort(-scores, kind="stable")]
 
     chosen = []
+    chosen_ids = set()
     seen_titles = set()
     seen_main_tags = set()
 
+    def key(r: Dict[str, Any]):
+        return r.get("id") or id(r)
+
     for r in ranked:
         if len(chosen) >= target_meals:
             break
@@ -178,6 +179,7 @@ def select_recipes(candidates: List[Dict[str, Any]], target_meals: int, data: Di
             continue
 
         chosen.append(r)
+        chosen_ids.add(key(r))
         if title:
             seen_titles.add(title)
         if key_tag:
@@ -188,23 +190,17 @@ def select_recipes(candidates: List[Dict[str, Any]], target_meals: int, data: Di
         for r in ranked:
             if len(chosen) >= target_meals:
                 break
-            if r not in chosen:
+            if key(r) not in chosen_ids:
                 chosen.append(r)
+                chosen_ids.add(key(r))
 
     return chosen[:target_meals]
 
 
-def compile_grounded_plan(data: Dict[str, Any], recipes: List[Dict[str, Any]], memory: List[str]) -> Dict[str, Any]:
-    """
-    LLM is ONLY allowed to schedule and format using provided recipes.
-    Returns JSON with:
-      - days -> meals -> {type, recipe_id, title, steps, ingredients}
-      - grocery_list aggregated
-      - kroger_payload (names + quantities)
-      - audit: used_recipe_ids, retrieval_summary
-    """
-    days = int(data.get("days") or 7)
+MEAL_SLOTS = ["breakfast", "lunch", "dinner"]
+
 
+def _full_messages(data: Dict[str, Any], recipes: List[Dict[str, Any]], memory: List[str], days: int) -> List[Dict[str, str]]:
     # compact recipes for prompt
     compact = []
     for r in recipes:
@@ -269,14 +265,152 @@ def compile_grounded_plan(data: Dict[str, Any], recipes: List[Dict[str, Any]], m
         ],
     }
 
-    resp = client.chat.completions.create(
-        model="gpt-4-turbo",
-        messages=[
-            {"role": "system", "content": system},
-            {"role": "user", "content": json.dumps(user)},
-        ],
-        temperature=0.2,
-    )
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": json.dumps(user)},
+    ]
+
+
+def _cell(v: Any) -> str:
+    if v is None or v == "":
+        return "-"
+    if isinstance(v, float) and v.is_integer():
+        v = int(v)
+    return str(v).replace("|", "/").replace("\n", " ")
+
+
+def _compact_messages(data: Dict[str, Any], recipes: List[Dict[str, Any]], memory: List[str], days: int) -> List[Dict[str, str]]:
+    """
+    Recipes go in as one table row each, keyed by a short integer alias
+    instead of the long recipe id; the model only returns the slot assignment.
+    """
+    rows = ["#|title|tags|kcal|min"]
+    for n, r in enumerate(recipes, start=1):
+        rows.append("|".join([
+            str(n),
+            _cell(r.get("title")),
+            _cell(",".join(r.get("tags", [])[:4])),
+            _cell(r.get("kcal")),
+            _cell(r.get("time_minutes")),
+        ]))
+
+    prefs = {
+        k: v for k, v in {
+            "goal": data.get("goal"),
+            "diet": data.get("diet"),
+            "cuisines": data.get("cuisines"),
+            "exclusions": data.get("exclusions"),
+            "budget": data.get("budget"),
+            "at_home": data.get("ingredients_at_home"),
+        }.items() if v not in (None, "", [])
+    }
+
+    user = "\n".join([
+        f"Plan {days} days, 3 meals/day (breakfast, lunch, dinner) using ONLY recipes # below.",
+        f"Preferences: {json.dumps(prefs, separators=(',', ':'))}",
+        f"Memory: {json.dumps(memory or [], separators=(',', ':'))}",
+        "Recipes:",
+        *rows,
+        'Return JSON only: {"days":[[b,l,d],...]} with one [breakfast#,lunch#,dinner#] per day.',
+    ])
+    return [
+        {"role": "system", "content": "You schedule meals from a fixed recipe list. Answer with recipe numbers only."},
+        {"role": "user", "content": user},
+    ]
+
+
+def _hydrate_slots(slots: Any, recipes: List[Dict[str, Any]], days: int) -> Dict[str, Any]:
+    """
+    Turns [[b,l,d], ...] aliases back into the full plan shape, server-side.
+    Rows that are not a list of 3 aliases and days the model left out are
+    reported in the audit (malformed_rows, missing_days, truncated).
+    """
+    rows = slots if isinstance(slots, list) else []
+    plan_days = []
+    dropped = []
+    malformed = []
+    for d, row in enumerate(rows[:days], start=1):
+        if not isinstance(row, list) or len(row) != len(MEAL_SLOTS):
+            malformed.append(d)
+        meals = []
+        for mt, alias in zip(MEAL_SLOTS, row if isinstance(row, list) else []):
+            try:
+                r = recipes[int(alias) - 1] if int(alias) >= 1 else None
+            except (TypeError, ValueError, IndexError):
+                r = None
+            if r is None:
+                dropped.append(alias)
+                continue
+            meals.append({
+                "type": mt,
+                "recipe_id": r["id"],
+                "title": r.get("title"),
+                "kcal": r.get("kcal"),
+                "time_minutes": r.get("time_minutes"),
+                "steps": r.get("steps", []),
+                "ingredients": r.get("ingredients", []),
+            })
+        plan_days.append({"day": d, "meals": meals})
+
+    used = sorted({m["recipe_id"] for d in plan_days for m in d["meals"]})
+    grocery_list = aggregate_groceries(used, {r["id"]: r for r in recipes})
+    audit: Dict[str, Any] = {"used_recipe_ids": used, "retrieval_note": f"{len(recipes)} candidates, compact prompt"}
+    if dropped:
+        audit["dropped_aliases"] = dropped
+    if not isinstance(slots, list):
+        audit["malformed_days"] = type(slots).__name__
+    if malformed:
+        audit["malformed_rows"] = malformed
+    if len(plan_days) < days:
+        audit["missing_days"] = days - len(plan_days)
+        audit["truncated"] = True
+    return {
+        "days": plan_days,
+        "grocery_list": grocery_list,
+        "kroger_payload": to_kroger_payload(grocery_list),
+        "audit": audit,
+    }
+
+
+def _token_usage(resp: Any, mode: str) -> Dict[str, Any]:
+    usage = getattr(resp, "usage", None)
+    return {
+        "mode": mode,
+        "prompt": getattr(usage, "prompt_tokens", None),
+        "completion": getattr(usage, "completion_tokens", None),
+        "total": getattr(usage, "total_tokens", None),
+    }
+
+
+def compile_grounded_plan(data: Dict[str, Any], recipes: List[Dict[str, Any]], memory: List[str]) -> Dict[str, Any]:
+    """
+    LLM is ONLY allowed to schedule (and, in full mode, format) using provided recipes.
+    Returns JSON with:
+      - days -> meals -> {type, recipe_id, title, steps, ingredients}
+      - grocery_list aggregated
+      - kroger_payload (names + quantities)
+      - audit: used_recipe_ids, retrieval_summary, tokens
+    RAG_PROMPT_MODE=compact (default) asks only for the slot assignment and
+    fills in everything else from the candidates; "full" is the original prompt.
+    """
+    days = int(data.get("days") or 7)
 
-    text = resp.choices[0].message.content
-    return json.loads(text)
+    if RAG_PROMPT_MODE == "full":
+        resp = get_openai().chat.completions.create(
+            model="gpt-4-turbo",
+            messages=_full_messages(data, recipes, memory, days),
+            temperature=0.2,
+        )
+        plan = json.loads(resp.choices[0].message.content)
+    else:
+        resp = get_openai().chat.completions.create(
+            model="gpt-4-turbo",
+            messages=_compact_messages(data, recipes, memory, days),
+            temperature=0.2,
+            response_format={"type": "json_object"},
+        )
+        slots = json.loads(resp.choices[0].message.content).get("days")
+        plan = _hydrate_slots(slots, recipes, days)
+
+    plan.setdefault("audit", {})["tokens"] = _token_usage(resp, RAG_PROMPT_MODE)
+    return plan
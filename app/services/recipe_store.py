@@ -0,0 +1,223 @@
+# app/services/recipe_store.py
+import os, json, zlib, threading
+from typing import Dict, Any, List, Iterable
+
+from app.services.lru import LRUCache
+from app.services.redis_client import RedisBackoff
+
+try:
+    import msgpack
+    import zstandard
+    _zc = zstandard.ZstdCompressor(level=3)
+    _zd = zstandard.ZstdDecompressor()
+except ImportError:  # optional: fall back to JSON + zlib
+    msgpack = None
+
+# Recipe bodies (ingredients, steps, ...) keyed by recipe id, so vector queries
+# can skip include_metadata and hydrate candidates in one bulk read.
+#   RECIPE_STORE=redis  one compact value per recipe, read with MGET (default)
+#   RECIPE_STORE=file   local dbm file at RECIPE_STORE_PATH
+BACKEND = os.getenv("RECIPE_STORE", "redis").lower()
+FILE_PATH = os.getenv("RECIPE_STORE_PATH", ".recipe_store")
+REDIS_PREFIX = "recipe:"
+
+_lru = LRUCache(int(os.getenv("RECIPE_CACHE_SIZE", "2048")))
+
+BODY_FIELDS = ("title", "tags", "time_minutes", "kcal", "ingredients", "steps")
+
+# ---------- encoding ----------
+
+def encode(body: Dict[str, Any]) -> bytes:
+    # first byte records the codec so both encodings can coexist
+    if msgpack is not None:
+        return b"m" + _zc.compress(msgpack.packb(body, use_bin_type=True))
+    return b"j" + zlib.compress(json.dumps(body, separators=(",", ":")).encode("utf-8"))
+
+
+def decode(raw: bytes) -> Dict[str, Any]:
+    codec, payload = raw[:1], raw[1:]
+    if codec == b"m":
+        return msgpack.unpackb(_zd.decompress(payload), raw=False)
+    return json.loads(zlib.decompress(payload))
+
+# ---------- backends ----------
+
+class _RedisBackend:
+    def __init__(self):
+        self._redis = RedisBackoff(decode_responses=False)
+
+    def get_many(self, ids: List[str]) -> Dict[str, bytes]:
+        r = self._redis.client()
+        if r is None:
+            return {}
+        try:
+            raws = r.mget([REDIS_PREFIX + i for i in ids])
+        except Exception:
+            self._redis.failed()
+            return {}
+        return {i: raw for i, raw in zip(ids, raws) if raw}
+
+    def put_many(self, items: Dict[str, bytes]) -> None:
+        # raises: new recipes have no copy of their body in the index to fall back on
+        r = self._redis.client()
+        if r is None:
+            raise ConnectionError("recipe store unavailable")
+        try:
+            pipe = r.pipeline(transaction=False)
+            for i, raw in items.items():
+                pipe.set(REDIS_PREFIX + i, raw)
+            pipe.execute()
+        except Exception:
+            self._redis.failed()
+            raise
+
+
+class _FileBackend:
+    def __init__(self, path: str):
+        import dbm
+        self._db = dbm.open(path, "c")
+        self._lock = threading.Lock()
+
+    def get_many(self, ids: List[str]) -> Dict[str, bytes]:
+        out = {}
+        with self._lock:
+            for i in ids:
+                raw = self._db.get(i.encode("utf-8"))
+                if raw:
+                    out[i] = raw
+        return out
+
+    def put_many(self, items: Dict[str, bytes]) -> None:
+        with self._lock:
+            for i, raw in items.items():
+                self._db[i.encode("utf-8")] = raw
+            if hasattr(self._db, "sync"):
+                self._db.sync()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def _store():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = _FileBackend(FILE_PATH) if BACKEND == "file" else _RedisBackend()
+    return _backend
+
+# ---------- public API ----------
+
+def recipe_body(r: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: r.get(k) for k in BODY_FIELDS}
+
+
+def put_recipes(recipes: Iterable[Dict[str, Any]]) -> None:
+    items = {}
+    for r in recipes:
+        if not r.get("id"):
+            continue
+        body = recipe_body(r)
+        _lru.put(r["id"], body)
+        items[r["id"]] = encode(body)
+    if items:
+        _store().put_many(items)
+
+
+def get_recipes(ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Bulk read: LRU first, then one MGET (or file lookup) for the rest."""
+    found: Dict[str, Dict[str, Any]] = {}
+    missing = []
+    for i in dict.fromkeys(ids):
+        body = _lru.get(i)
+        if body is not None:
+            found[i] = body
+        else:
+            missing.append(i)
+
+    if missing:
+        for i, raw in _store().get_many(missing).items():
+            try:
+                body = decode(raw)
+            except Exception:
+                continue
+            _lru.put(i, body)
+            found[i] = body
+    return found
+
+# ---------- hydration of metadata-free query matches ----------
+
+def _field(obj: Any, name: str, default=None):
+    if isinstance(obj, dict):
+        return obj.get(name, default)
+    return getattr(obj, name, default)
+
+
+def body_from_metadata(md: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Legacy records only (new vectors carry no body): reads both old layouts,
+    *_json strings (recipe_corpus) and raw lists (recipe_rag).
+    """
+    def load(key_json: str, key_raw: str):
+        if key_json in md:
+            try:
+                return json.loads(md.get(key_json) or "[]")
+            except Exception:
+                return []
+        return md.get(key_raw) or []
+
+    return {
+        "title": md.get("title"),
+        "tags": md.get("tags", []),
+        "time_minutes": md.get("time_minutes"),
+        "kcal": md.get("kcal"),
+        "ingredients": load("ingredients_json", "ingredients"),
+        "steps": load("steps_json", "steps"),
+    }
+
+
+def hydrate_matches(index, matches: List[Any], namespace: str) -> List[Dict[str, Any]]:
+    """
+    Turns id/score-only query matches into full recipes. Bodies come from the
+    store; anything missing (e.g. ingested before the store existed) is fetched
+    from the index metadata once and written back to the store.
+    """
+    ids = [_field(m, "id") for m in matches]
+    bodies = get_recipes(ids)
+
+    missing = [i for i in ids if i not in bodies]
+    if missing and index is not None:
+        res = index.fetch(ids=missing, namespace=namespace)
+        vectors = _field(res, "vectors") or {}
+        backfill = []
+        for i in missing:
+            v = vectors.get(i)
+            if v is None:
+                continue
+            body = body_from_metadata(_field(v, "metadata") or {})
+            bodies[i] = body
+            backfill.append({"id": i, **body})
+        try:
+            put_recipes(backfill)
+        except Exception as e:
+            # still served from the index metadata; the backfill is retried next time
+            print("Recipe store backfill failed:", e)
+
+    out = []
+    for m in matches:
+        rid = _field(m, "id")
+        body = bodies.get(rid)
+        if body is None:
+            continue
+        ingredients = body.get("ingredients") or []
+        out.append({
+            "id": rid,
+            "score": _field(m, "score"),
+            **body,
+            "tags": body.get("tags") or [],
+            "ingredients": ingredients,
+            "steps": body.get("steps") or [],
+            "ingredient_names": [i.get("name") for i in ingredients if isinstance(i, dict) and i.get("name")],
+        })
+    return out
@@ -0,0 +1,63 @@
+# app/services/redis_client.py
+import os, time, threading
+from typing import Dict, Optional
+
+import redis
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+_pools: Dict[bool, redis.ConnectionPool] = {}
+_lock = threading.Lock()
+
+
+def get_redis(decode_responses: bool = True) -> redis.Redis:
+    """
+    Shared, pooled Redis client. Use decode_responses=False for binary values
+    (e.g. cached embeddings).
+    """
+    pool = _pools.get(decode_responses)
+    if pool is None:
+        with _lock:
+            pool = _pools.get(decode_responses)
+            if pool is None:
+                pool = redis.ConnectionPool(
+                    host=os.getenv("REDIS_HOST", "localhost"),
+                    port=int(os.getenv("REDIS_PORT", 6379)),
+                    decode_responses=decode_responses,
+                    max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", "50")),
+                    socket_connect_timeout=float(os.getenv("REDIS_CONNECT_TIMEOUT", "0.5")),
+                )
+                _pools[decode_responses] = pool
+    return redis.Redis(connection_pool=pool)
+
+
+def close_pools() -> None:
+    with _lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.disconnect()
+
+
+class RedisBackoff:
+    """
+    For callers that can work without Redis (caches, coalescing): after a
+    failure, skip Redis for REDIS_BACKOFF_SECONDS instead of paying a
+    connect timeout on every call. One instance per caller.
+    """
+
+    def __init__(self, decode_responses: bool = True):
+        self._decode = decode_responses
+        self._seconds = float(os.getenv("REDIS_BACKOFF_SECONDS", "30"))
+        self._down_until = 0.0
+
+    def usable(self) -> bool:
+        return time.time() >= self._down_until
+
+    def client(self) -> Optional[redis.Redis]:
+        """The shared client, or None while backing off."""
+        return get_redis(self._decode) if self.usable() else None
+
+    def failed(self) -> None:
+        self._down_until = time.time() + self._seconds
@@ -0,0 +1,155 @@
+# app/services/singleflight.py
+import json, time, copy, asyncio, hashlib
+from typing import Dict, Any, Awaitable, Callable
+from fastapi.responses import Response
+
+from app.config import SINGLEFLIGHT, SINGLEFLIGHT_REDIS, SINGLEFLIGHT_LOCK_SECONDS, SINGLEFLIGHT_RESULT_TTL
+from app.services.redis_client import RedisBackoff
+from app.services.blocking_executor import run_blocking
+from app.services.jobs import Lock
+from app.services.metrics import registry
+
+# Identical plan requests (same kind, same canonical payload, which includes
+# the user) that arrive while one is already running share its result.
+#
+# In process: the first caller starts the work as a task; followers await the
+# same task. The task is not tied to any one caller, so a client that
+# disconnects (and retries) does not cancel the work for the others.
+#
+# Across workers (SINGLEFLIGHT_REDIS=1): one worker per key takes
+#   lock:singleflight:<key>    jobs.Lock, held while the leader plans
+# and publishes
+#   singleflight:result:<key>  JSON result, kept SINGLEFLIGHT_RESULT_TTL seconds
+# which the other workers poll for. If the leader fails or dies without a
+# result, waiting workers plan on their own.
+RESULT_PREFIX = "singleflight:result:"
+POLL_SECONDS = 0.1
+
+registry.describe("mealplan_singleflight_total", "counter",
+                  "Plan requests by coalescing role (leader | follower | remote).")
+
+_inflight: Dict[str, asyncio.Task] = {}
+
+# coalescing across workers is optional: after a failure, coalesce per process for a while
+_redis = RedisBackoff()
+
+
+def _canon(v: Any) -> Any:
+    if isinstance(v, dict):
+        return {str(k): _canon(x) for k, x in v.items() if x not in (None, "", [], {})}
+    if isinstance(v, (list, tuple, set)):
+        items = [_canon(x) for x in v]
+        # order of plain values (cuisines, exclusions, ...) carries no meaning
+        if all(isinstance(x, (str, int, float, bool)) for x in items):
+            return sorted(items, key=lambda x: (type(x).__name__, x))
+        return items
+    if isinstance(v, str):
+        return v.strip()
+    if isinstance(v, float) and v.is_integer():
+        return int(v)
+    return v
+
+
+def request_key(kind: str, payload: Dict[str, Any]) -> str:
+    raw = json.dumps(_canon(payload), sort_keys=True, separators=(",", ":"), default=str)
+    return f"{kind}:{hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]}"
+
+
+def _count(kind: str, role: str) -> None:
+    registry.inc("mealplan_singleflight_total", {"kind": kind, "role": role})
+
+
+def _follower_copy(result: Any, role: str) -> Any:
+    if isinstance(result, Response):
+        # e.g. a 202 bootstrap handle: immutable once rendered, shared as is
+        return result
+    result = copy.deepcopy(result)
+    if isinstance(result, dict) and isinstance(result.get("audit"), dict):
+        result["audit"]["coalesced"] = role
+    return result
+
+# ---------- across workers ----------
+
+def _publish(key: str, result: Any) -> None:
+    # only finished plans: errors are retried, a 202 handle is per-moment
+    r = _redis.client()
+    if r is None or not isinstance(result, dict) or result.get("error"):
+        return
+    r.set(RESULT_PREFIX + key, json.dumps(result, default=str), ex=SINGLEFLIGHT_RESULT_TTL)
+
+
+async def _remote(kind: str, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+    """Leads across workers, or waits for the worker that does."""
+    r = _redis.client()
+    if r is None:
+        return await fn()
+    lock = Lock(f"singleflight:{key}", SINGLEFLIGHT_LOCK_SECONDS)
+    try:
+        raw = await run_blocking(r.get, RESULT_PREFIX + key)
+        if raw:
+            _count(kind, "remote")
+            return _follower_copy(json.loads(raw), "remote")
+        leading = await run_blocking(lock.acquire)
+    except Exception:
+        _redis.failed()
+        return await fn()
+
+    if leading:
+        try:
+            result = await fn()
+            try:
+                await run_blocking(_publish, key, result)
+            except Exception:
+                _redis.failed()
+            return result
+        finally:
+            try:
+                await run_blocking(lock.release)
+            except Exception:
+                _redis.failed()
+
+    deadline = time.monotonic() + SINGLEFLIGHT_LOCK_SECONDS
+    try:
+        while time.monotonic() < deadline:
+            await asyncio.sleep(POLL_SECONDS)
+            raw, held = await run_blocking(r.mget, [RESULT_PREFIX + key, lock.key])
+            if raw:
+                _count(kind, "remote")
+                return _follower_copy(json.loads(raw), "remote")
+            if not held:
+                break  # the leader finished without a shareable result, or died
+    except Exception:
+        _redis.failed()
+    return await fn()
+
+# ---------- public ----------
+
+async def coalesce(kind: str, payload: Dict[str, Any], fn: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Returns fn()'s result, shared with every identical request (kind +
+    canonical payload) in flight at the same time. Followers get a copy with
+    audit["coalesced"] set. Exceptions and responses (e.g. the 202 bootstrap
+    handle) are shared too.
+    """
+    if not SINGLEFLIGHT:
+        return await fn()
+
+    key = request_key(kind, payload)
+    task = _inflight.get(key)
+    if task is not None and not task.done():
+        _count(kind, "follower")
+        return _follower_copy(await asyncio.shield(task), "follower")
+
+    work: Callable[[], Awaitable[Any]] = (lambda: _remote(kind, key, fn)) if SINGLEFLIGHT_REDIS and _redis.usable() else fn
+    task = asyncio.ensure_future(work())
+    _inflight[key] = task
+
+    def done(t: asyncio.Task) -> None:
+        if _inflight.get(key) is t:
+            del _inflight[key]
+        if not t.cancelled():
+            t.exception()  # retrieved here so an unawaited failure is not logged as lost
+
+    task.add_done_callback(done)
+    _count(kind, "leader")
+    return await asyncio.shield(task)
@@ -1,37 +1,205 @@
 # app/services/user_memory.py
-import os, json, time
+import time, asyncio, hashlib
 from typing import List, Dict, Any
 from dotenv import load_dotenv
-from openai import OpenAI
 
-from app.services.pinecone_client import get_pinecone_index
+from app.services.pinecone_client import get_pinecone_index, get_async_index
+from app.services.embeddings import embed_text, aembed_text
+from app.services.redis_client import get_redis
+from app.services.blocking_executor import run_blocking
 
 load_dotenv(override=True)
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
+# Two kinds of memory per user:
+#   memory:facts:<user>   hash field -> text: structured preference facts
+#                         ("diet", "cuisines", "exclusions", or "note:<hash>"
+#                         for preferences added through /memory/add). No
+#                         embeddings; always returned, first.
+#   memory:notes:<user>   zset note field -> added time; only the newest
+#                         MAX_NOTES notes are kept.
+#   user_memory namespace free-text memory (feedback), one vector per distinct
+#                         text: id mem_<user>_<content hash>, searched with a
+#                         user_id filter.
+#   memory:seen:<user>    set of content hashes already stored, so a repeated
+#                         text costs one SISMEMBER instead of an embed + upsert.
+#                         Added only after the upsert succeeds.
 MEMORY_NS = "user_memory"
+FACTS_PREFIX = "memory:facts:"
+NOTES_PREFIX = "memory:notes:"
+SEEN_PREFIX = "memory:seen:"
+MAX_NOTES = 20
+
+# fixed probe the planners use to pull a user's memory
+MEMORY_PROBE = "Food preferences, dislikes, time constraints, favorite cuisines, and feedback"
+
+# field order in which facts are returned
+FACT_FIELDS = ("diet", "cuisines", "exclusions")
+
+# texts of the facts above; older releases stored them as "preference" vectors
+_FACT_TEXT_PREFIXES = ("Diet preference: ", "Preferred cuisines: ", "Avoid ingredients: ")
 
 def _embed(text: str) -> List[float]:
-    return client.embeddings.create(model="text-embedding-3-large", input=text).data[0].embedding
+    return embed_text(text)
+
+def _content_hash(text: str) -> str:
+    normalized = " ".join(str(text).lower().split())
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:16]
+
+def _memory_meta(user_id: str, text: str, mtype: str) -> Dict[str, Any]:
+    return {
+        "user_id": str(user_id),
+        "type": str(mtype),
+        "text": str(text)[:5000],
+        "ts": int(time.time())
+    }
+
+def _memory_texts(res, top_k: int) -> List[str]:
+    out = []
+    for m in (res.get("matches") or []):
+        md = m.get("metadata") or {}
+        text = md.get("text")
+        # preference facts live in Redis now; their old vector copies may be stale.
+        # Notes stored as "preference" vectors before that are still returned.
+        if not text or (md.get("type") == "preference" and text.startswith(_FACT_TEXT_PREFIXES)):
+            continue
+        out.append(text)
+    return out[:top_k]
+
+def _search_filter(user_id: str) -> Dict[str, Any]:
+    return {"user_id": {"$eq": str(user_id)}}
+
+def _search_top_k(top_k: int) -> int:
+    # room for the old fact vectors dropped in _memory_texts
+    return top_k + len(FACT_FIELDS)
+
+# ---------- structured preference facts ----------
+
+def preference_facts(prefs: Dict[str, Any]) -> Dict[str, str]:
+    exclusions = prefs.get("exclusions") or []
+    cuisines = prefs.get("cuisines") or []
+    diet = prefs.get("diet")
+    facts = {}
+    if diet:
+        facts["diet"] = f"Diet preference: {diet}"
+    if cuisines:
+        facts["cuisines"] = f"Preferred cuisines: {', '.join(cuisines)}"
+    if exclusions:
+        facts["exclusions"] = f"Avoid ingredients: {', '.join(exclusions)}"
+    return facts
+
+def remember_preferences(user_id: str, prefs: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Keeps the request's diet / cuisines / exclusions as the user's current
+    facts. Fields not sent are kept; fields sent empty are cleared.
+    """
+    facts = preference_facts(prefs)
+    cleared = [f for f in FACT_FIELDS if f in prefs and f not in facts]
+    if not facts and not cleared:
+        return {"ok": True, "facts": 0}
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        if facts:
+            pipe.hset(FACTS_PREFIX + str(user_id), mapping=facts)
+        if cleared:
+            pipe.hdel(FACTS_PREFIX + str(user_id), *cleared)
+        pipe.execute()
+    except Exception as e:
+        return {"ok": False, "error": str(e)}
+    return {"ok": True, "facts": len(facts), "cleared": len(cleared)}
+
+async def aremember_preferences(user_id: str, prefs: Dict[str, Any]) -> Dict[str, Any]:
+    return await run_blocking(remember_preferences, user_id, prefs)
+
+def _facts(user_id: str) -> List[str]:
+    try:
+        facts = get_redis().hgetall(FACTS_PREFIX + str(user_id)) or {}
+    except Exception as e:
+        print("Memory facts unavailable:", e)
+        return []
+    ordered = [facts[f] for f in FACT_FIELDS if f in facts]
+    return ordered + [facts[f] for f in sorted(facts) if f not in FACT_FIELDS]
+
+# ---------- free-text memory ----------
+
+def _seen(user_id: str, digest: str) -> bool:
+    """True when this text is already stored. Without Redis, stores anyway (the id makes it idempotent)."""
+    try:
+        return bool(get_redis().sismember(SEEN_PREFIX + str(user_id), digest))
+    except Exception:
+        return False
+
+def _mark_seen(user_id: str, digest: str) -> None:
+    # after the upsert: a crash before it leaves the text unmarked, so it is stored on retry
+    try:
+        get_redis().sadd(SEEN_PREFIX + str(user_id), digest)
+    except Exception:
+        pass
+
+def _store_note(user_id: str, text: str, digest: str) -> Dict[str, Any]:
+    """Adds a note fact; past MAX_NOTES the oldest notes are dropped."""
+    field = f"note:{digest}"
+    facts_key, notes_key = FACTS_PREFIX + str(user_id), NOTES_PREFIX + str(user_id)
+    try:
+        r = get_redis()
+        pipe = r.pipeline(transaction=False)
+        pipe.hset(facts_key, field, str(text)[:5000])
+        pipe.zadd(notes_key, {field: time.time()})
+        pipe.zcard(notes_key)
+        *_, count = pipe.execute()
+        if count > MAX_NOTES:
+            dropped = [f for f, _ in r.zpopmin(notes_key, count - MAX_NOTES)]
+            if dropped:
+                r.hdel(facts_key, *dropped)
+    except Exception as e:
+        return {"ok": False, "error": str(e)}
+    return {"ok": True, "id": field}
 
 def store_memory(user_id: str, text: str, mtype: str = "feedback") -> Dict[str, Any]:
+    digest = _content_hash(text)
+    if mtype == "preference":
+        return _store_note(user_id, text, digest)
+
     index = get_pinecone_index()
     if not index:
         return {"ok": False, "error": "Pinecone not configured"}
 
-    mid = f"mem_{user_id}_{int(time.time()*1000)}"
+    mid = f"mem_{user_id}_{digest}"
+    if _seen(user_id, digest):
+        return {"ok": True, "id": mid, "duplicate": True}
     vec = _embed(text)
+    index.upsert(vectors=[(mid, vec, _memory_meta(user_id, text, mtype))], namespace=MEMORY_NS)
+    _mark_seen(user_id, digest)
+    return {"ok": True, "id": mid}
 
-    meta = {
-        "user_id": str(user_id),
-        "type": str(mtype),
-        "text": str(text)[:5000],
-        "ts": int(time.time())
-    }
-    index.upsert(vectors=[(mid, vec, meta)], namespace=MEMORY_NS)
+async def astore_memory(user_id: str, text: str, mtype: str = "feedback") -> Dict[str, Any]:
+    digest = _content_hash(text)
+    if mtype == "preference":
+        return await run_blocking(_store_note, user_id, text, digest)
+
+    index = get_async_index()
+    if not index:
+        return {"ok": False, "error": "Pinecone not configured"}
+
+    mid = f"mem_{user_id}_{digest}"
+    if await run_blocking(_seen, user_id, digest):
+        return {"ok": True, "id": mid, "duplicate": True}
+    vec = await aembed_text(text)
+    await index.upsert(vectors=[(mid, vec, _memory_meta(user_id, text, mtype))], namespace=MEMORY_NS)
+    await run_blocking(_mark_seen, user_id, digest)
     return {"ok": True, "id": mid}
 
-def retrieve_memory(user_id: str, query: str, top_k: int = 5) -> List[str]:
+# ---------- retrieval ----------
+
+def _merge(facts: List[str], found: List[str]) -> List[str]:
+    seen = set(facts)
+    out = list(facts)
+    for text in found:
+        if text not in seen:
+            seen.add(text)
+            out.append(text)
+    return out
+
+def _search(user_id: str, query: str, top_k: int) -> List[str]:
     index = get_pinecone_index()
     if not index:
         return []
@@ -39,15 +207,32 @@ def retrieve_memory(user_id: str, query: str, top_k: int = 5) -> List[str]:
     qvec = _embed(query)
     res = index.query(
         vector=qvec,
-        top_k=top_k,
+        top_k=_search_top_k(top_k),
         include_metadata=True,
         namespace=MEMORY_NS,
-        filter={"user_id": str(user_id)}
+        filter=_search_filter(user_id)
     )
+    return _memory_texts(res, top_k)
 
-    out = []
-    for m in (res.get("matches") or []):
-        md = m.get("metadata") or {}
-        if md.get("text"):
-            out.append(md["text"])
-    return out
+async def _asearch(user_id: str, query: str, top_k: int) -> List[str]:
+    index = get_async_index()
+    if not index:
+        return []
+
+    qvec = await aembed_text(query)
+    res = await index.query(
+        vector=qvec,
+        top_k=_search_top_k(top_k),
+        include_metadata=True,
+        namespace=MEMORY_NS,
+        filter=_search_filter(user_id)
+    )
+    return _memory_texts(res, top_k)
+
+def retrieve_memory(user_id: str, query: str, top_k: int = 5) -> List[str]:
+    """The user's preference facts, then up to top_k free-text memories most similar to query."""
+    return _merge(_facts(user_id), _search(user_id, query, top_k))
+
+async def aretrieve_memory(user_id: str, query: str, top_k: int = 5) -> List[str]:
+    facts, found = await asyncio.gather(run_blocking(_facts, user_id), _asearch(user_id, query, top_k))
+    return _merge(facts, found)
@@ -0,0 +1,388 @@
+# app/services/vector_store.py
+import os, json, threading
+from typing import Dict, Any, List, Optional, Protocol, Iterable
+
+import numpy as np
+
+
+class VectorIndex(Protocol):
+    """
+    The subset of the Pinecone Index API the services rely on.
+    Any backend returned by get_pinecone_index() must support it.
+    """
+
+    def upsert(self, vectors: Iterable[Any], namespace: str = "") -> Any: ...
+
+    def query(
+        self,
+        vector: List[float],
+        top_k: int = 10,
+        include_metadata: bool = False,
+        namespace: str = "",
+        filter: Optional[Dict[str, Any]] = None,
+    ) -> Any: ...
+
+
+# ---------- metadata filters (Pinecone semantics) ----------
+
+def _cmp(value: Any, op: str, arg: Any) -> bool:
+    # list-valued metadata matches $eq/$in when ANY element matches,
+    # and $ne/$nin only when NO element matches (same as Pinecone)
+    if isinstance(value, list):
+        if op in ("$eq", "$in"):
+            return any(_cmp(v, op, arg) for v in value)
+        if op in ("$ne", "$nin"):
+            return all(_cmp(v, op, arg) for v in value)
+        return False
+
+    if op == "$eq":
+        return value == arg
+    if op == "$ne":
+        return value != arg
+    if op == "$in":
+        return value in arg
+    if op == "$nin":
+        return value not in arg
+    try:
+        if op == "$gt":
+            return value > arg
+        if op == "$gte":
+            return value >= arg
+        if op == "$lt":
+            return value < arg
+        if op == "$lte":
+            return value <= arg
+    except TypeError:
+        return False
+    raise ValueError(f"Unsupported filter operator: {op}")
+
+
+def matches_filter(meta: Dict[str, Any], flt: Optional[Dict[str, Any]]) -> bool:
+    if not flt:
+        return True
+
+    for key, cond in flt.items():
+        if key == "$and":
+            if not all(matches_filter(meta, c) for c in cond):
+                return False
+            continue
+        if key == "$or":
+            if not any(matches_filter(meta, c) for c in cond):
+                return False
+            continue
+
+        ops = cond if isinstance(cond, dict) else {"$eq": cond}
+        for op, arg in ops.items():
+            if op == "$exists":
+                if (key in meta) != bool(arg):
+                    return False
+                continue
+            if key not in meta:
+                # a missing field can only satisfy negative operators
+                if op not in ("$ne", "$nin"):
+                    return False
+                continue
+            if not _cmp(meta[key], op, arg):
+                return False
+    return True
+
+
+# ---------- local backend ----------
+
+def _unit(values: Any, dim: int) -> np.ndarray:
+    v = np.asarray(values, dtype=np.float32).reshape(-1)
+    if v.shape[0] != dim:
+        raise ValueError(f"Vector dimension {v.shape[0]} does not match index dimension {dim}")
+    n = float(np.linalg.norm(v))
+    return v / n if n > 0 else v
+
+
+def _as_record(v: Any):
+    if isinstance(v, dict):
+        return v["id"], v["values"], v.get("metadata") or {}
+    if len(v) == 2:
+        return v[0], v[1], {}
+    return v[0], v[1], v[2] or {}
+
+
+# rows.json is rewritten once the journal holds more lines than this and than the
+# snapshot has rows, so rewrites stay amortized O(1) per upserted record
+_COMPACT_MIN = 1024
+
+
+class _Namespace:
+    """
+    One namespace on disk:
+      vectors.npy  - memory-mapped float32 matrix (capacity x dim), rows are unit-normalized
+      rows.json    - snapshot of ids and metadata per row (None for free rows)
+      rows.log     - JSON lines [row, id, metadata] written since the snapshot
+    """
+
+    def __init__(self, path: str, dim: int):
+        self.path = path
+        self.ids: List[Optional[str]] = []
+        self.meta: List[Optional[Dict[str, Any]]] = []
+        self.row_of: Dict[str, int] = {}
+        self.free: List[int] = []
+
+        os.makedirs(path, exist_ok=True)
+        self._vec_file = os.path.join(path, "vectors.npy")
+        self._rows_file = os.path.join(path, "rows.json")
+        self._log_file = os.path.join(path, "rows.log")
+        self._log_lines = 0
+        self._snapshot_rows = 0
+
+        if os.path.exists(self._vec_file) and os.path.exists(self._rows_file):
+            self.mat = np.lib.format.open_memmap(self._vec_file, mode="r+")
+            # each namespace keeps the dimension it was created with
+            dim = self.mat.shape[1]
+            with open(self._rows_file) as f:
+                rows = json.load(f)
+            self.ids = rows["ids"]
+            self.meta = rows["meta"]
+            self._snapshot_rows = len(self.ids)
+            self._replay()
+            for i, rid in enumerate(self.ids):
+                if rid is None:
+                    self.free.append(i)
+                else:
+                    self.row_of[rid] = i
+        else:
+            self.mat = np.lib.format.open_memmap(
+                self._vec_file, mode="w+", dtype=np.float32, shape=(256, dim)
+            )
+        self.dim = dim
+        if not os.path.exists(self._rows_file):
+            self._persist()
+
+    @property
+    def count(self) -> int:
+        return len(self.ids)
+
+    def _grow(self, needed: int) -> None:
+        cap = self.mat.shape[0]
+        if needed <= cap:
+            return
+        new_cap = max(needed, cap * 2)
+        tmp = self._vec_file + ".tmp"
+        bigger = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=(new_cap, self.dim))
+        bigger[: self.count] = self.mat[: self.count]
+        bigger.flush()
+        del bigger
+        del self.mat
+        os.replace(tmp, self._vec_file)
+        self.mat = np.lib.format.open_memmap(self._vec_file, mode="r+")
+
+    def _replay(self) -> None:
+        if not os.path.exists(self._log_file):
+            return
+        with open(self._log_file) as f:
+            for line in f:
+                try:
+                    row, rid, md = json.loads(line)
+                except ValueError:
+                    break  # torn last line: its upsert never returned
+                if row >= len(self.ids):
+                    pad = row + 1 - len(self.ids)
+                    self.ids.extend([None] * pad)
+                    self.meta.extend([None] * pad)
+                self.ids[row] = rid
+                self.meta[row] = md
+                self._log_lines += 1
+
+    def _persist(self) -> None:
+        """Rewrites the rows.json snapshot and clears the journal."""
+        self.mat.flush()
+        tmp = self._rows_file + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"ids": self.ids, "meta": self.meta}, f)
+        os.replace(tmp, self._rows_file)
+        if os.path.exists(self._log_file):
+            os.remove(self._log_file)
+        self._log_lines = 0
+        self._snapshot_rows = len(self.ids)
+
+    def _journal(self, rows: List[int]) -> None:
+        """Appends the new state of `rows`; compacts once the journal outgrows the snapshot."""
+        self.mat.flush()
+        with open(self._log_file, "a") as f:
+            f.writelines(json.dumps([row, self.ids[row], self.meta[row]]) + "\n" for row in rows)
+        self._log_lines += len(rows)
+        if self._log_lines > max(_COMPACT_MIN, self._snapshot_rows):
+            self._persist()
+
+    def upsert(self, records: List[Any]) -> int:
+        touched = []
+        for rec in records:
+            rid, values, md = _as_record(rec)
+            vec = _unit(values, self.dim)
+            row = self.row_of.get(rid)
+            if row is None:
+                if self.free:
+                    row = self.free.pop()
+                    self.ids[row] = rid
+                    self.meta[row] = dict(md)
+                else:
+                    row = self.count
+                    self._grow(row + 1)
+                    self.ids.append(rid)
+                    self.meta.append(dict(md))
+                self.row_of[rid] = row
+            else:
+                self.meta[row] = dict(md)
+            self.mat[row] = vec
+            touched.append(row)
+        self._journal(touched)
+        return len(records)
+
+    def delete(self, ids: List[str]) -> None:
+        touched = []
+        for rid in ids:
+            row = self.row_of.pop(rid, None)
+            if row is None:
+                continue
+            self.ids[row] = None
+            self.meta[row] = None
+            self.mat[row] = 0.0
+            self.free.append(row)
+            touched.append(row)
+        if touched:
+            self._journal(touched)
+
+    def query(self, vector: Any, top_k: int, flt: Optional[Dict[str, Any]]) -> List[tuple]:
+        n = self.count
+        if n == 0 or top_k <= 0:
+            return []
+
+        q = _unit(vector, self.dim)
+        sims = self.mat[:n] @ q
+
+        live = np.fromiter(
+            (rid is not None and matches_filter(self.meta[i], flt) for i, rid in enumerate(self.ids)),
+            dtype=bool,
+            count=n,
+        )
+        rows = np.flatnonzero(live)
+        if rows.size == 0:
+            return []
+
+        scores = sims[rows]
+        k = min(top_k, rows.size)
+        if k < rows.size:
+            part = np.argpartition(-scores, k - 1)[:k]
+        else:
+            part = np.arange(rows.size)
+        order = part[np.argsort(-scores[part], kind="stable")]
+        return [(int(rows[i]), float(scores[i])) for i in order]
+
+
+class LocalVectorIndex:
+    """
+    In-process replacement for a Pinecone Index: exact cosine top-k over
+    memory-mapped NumPy matrices, with Pinecone-style metadata filters.
+    """
+
+    def __init__(self, root: str, dimension: int = 3072):
+        self.root = root
+        self.dimension = dimension
+        self._namespaces: Dict[str, _Namespace] = {}
+        self._lock = threading.RLock()
+
+    def _ns(self, namespace: str, dim: Optional[int] = None) -> _Namespace:
+        """dim: dimension for a namespace that does not exist yet (default: the index dimension)."""
+        name = namespace or "__default__"
+        ns = self._namespaces.get(name)
+        if ns is None:
+            ns = _Namespace(os.path.join(self.root, name), dim or self.dimension)
+            self._namespaces[name] = ns
+        return ns
+
+    def upsert(self, vectors: Iterable[Any], namespace: str = "", **kwargs) -> Dict[str, Any]:
+        records = list(vectors)
+        if not records:
+            return {"upserted_count": 0}
+        with self._lock:
+            count = self._ns(namespace, len(_as_record(records[0])[1])).upsert(records)
+        return {"upserted_count": count}
+
+    def query(
+        self,
+        vector: List[float],
+        top_k: int = 10,
+        include_metadata: bool = False,
+        include_values: bool = False,
+        namespace: str = "",
+        filter: Optional[Dict[str, Any]] = None,
+        **kwargs,
+    ) -> Dict[str, Any]:
+        with self._lock:
+            ns = self._ns(namespace, len(vector))
+            hits = ns.query(vector, top_k, filter)
+            matches = []
+            for row, score in hits:
+                m: Dict[str, Any] = {"id": ns.ids[row], "score": score}
+                if include_metadata:
+                    m["metadata"] = dict(ns.meta[row] or {})
+                if include_values:
+                    m["values"] = ns.mat[row].tolist()
+                matches.append(m)
+        return {"matches": matches, "namespace": namespace}
+
+    def fetch(self, ids: List[str], namespace: str = "", **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            ns = self._ns(namespace)
+            out = {}
+            for rid in ids:
+                row = ns.row_of.get(rid)
+                if row is not None:
+                    out[rid] = {"id": rid, "values": ns.mat[row].tolist(), "metadata": dict(ns.meta[row] or {})}
+        return {"vectors": out, "namespace": namespace}
+
+    def delete(
+        self,
+        ids: Optional[List[str]] = None,
+        namespace: str = "",
+        delete_all: bool = False,
+        filter: Optional[Dict[str, Any]] = None,
+        **kwargs,
+    ) -> Dict[str, Any]:
+        with self._lock:
+            ns = self._ns(namespace)
+            if delete_all:
+                targets = list(ns.row_of)
+            elif filter:
+                targets = [rid for rid, row in ns.row_of.items() if matches_filter(ns.meta[row], filter)]
+            else:
+                targets = list(ids or [])
+            ns.delete(targets)
+        return {}
+
+    def describe_index_stats(self, **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            if os.path.isdir(self.root):
+                for name in os.listdir(self.root):
+                    if os.path.isdir(os.path.join(self.root, name)):
+                        self._ns(name)
+            namespaces = {
+                name: {"vector_count": len(ns.row_of), "dimension": ns.dim} for name, ns in self._namespaces.items()
+            }
+        return {
+            "dimension": self.dimension,
+            "namespaces": namespaces,
+            "total_vector_count": sum(n["vector_count"] for n in namespaces.values()),
+        }
+
+
+_local_indexes: Dict[str, LocalVectorIndex] = {}
+_local_lock = threading.Lock()
+
+
+def get_local_index() -> LocalVectorIndex:
+    root = os.getenv("LOCAL_VECTOR_DIR", ".vector_index")
+    dim = int(os.getenv("LOCAL_VECTOR_DIM", "3072"))
+    with _local_lock:
+        idx = _local_indexes.get(root)
+        if idx is None:
+            idx = LocalVectorIndex(root, dimension=dim)
+            _local_indexes[root] = idx
+        return idx
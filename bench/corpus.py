@@ -0,0 +1,109 @@
+# bench/corpus.py
+import random
+from typing import Dict, Any, List
+
+import numpy as np
+
+from bench.fakes import FakeIndex, hash_vector
+
+# Synthetic recipes shaped like recipe_corpus cards, plus the request mix the
+# benchmarks replay. Everything is derived from the seed.
+USER_ID = "bench-user"
+
+CUISINES = ["italian", "mexican", "indian", "thai", "japanese", "greek", "american", "korean", "french", "moroccan"]
+PROTEINS = ["chicken breast", "salmon", "tofu", "chickpeas", "beef mince", "eggs", "shrimp", "black beans",
+            "lentils", "turkey", "paneer", "tempeh"]
+VEGETABLES = ["spinach", "bell pepper", "onion", "garlic", "tomato", "zucchini", "broccoli", "carrot",
+              "mushroom", "kale", "cauliflower", "sweet potato", "eggplant", "peas", "cucumber"]
+STAPLES = ["olive oil", "rice", "pasta", "quinoa", "tortilla", "bread", "oats", "coconut milk",
+           "soy sauce", "greek yogurt", "cheddar", "butter", "lemon", "cumin", "paprika"]
+DISHES = ["bowl", "stir fry", "salad", "curry", "tacos", "bake", "soup", "skillet", "wrap", "pasta"]
+STYLES = ["quick", "smoky", "herby", "spicy", "creamy", "zesty", "rustic", "crispy"]
+MEALS = ["breakfast", "lunch", "dinner"]
+UNITS = ["g", "ml", "cup", "tbsp", "tsp", "piece"]
+
+# structured facts (Redis) and free-text feedback (vectors), as user_memory keeps them
+FACTS = {"exclusions": "Avoid ingredients: shrimp"}
+MEMORY = [
+    "Prefers meals under 40 minutes on weekdays",
+    "Liked the thai curry last week",
+    "Does not like olives",
+]
+
+
+def _ingredient(rng: random.Random, name: str) -> Dict[str, Any]:
+    return {"name": name, "qty": rng.choice([0.5, 1, 2, 100, 150, 200, 250]), "unit": rng.choice(UNITS)}
+
+
+def synthetic_recipes(n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        cuisine = rng.choice(CUISINES)
+        protein = rng.choice(PROTEINS)
+        dish = rng.choice(DISHES)
+        names = [protein] + rng.sample(VEGETABLES, rng.randint(2, 5)) + rng.sample(STAPLES, rng.randint(2, 4))
+        tags = [rng.choice(MEALS), cuisine] + rng.sample(["high-protein", "quick", "budget", "comfort"], rng.randint(0, 2))
+        out.append({
+            "id": f"bench-{i:06d}",
+            "title": f"{rng.choice(STYLES).title()} {cuisine.title()} {protein.title()} {dish.title()}",
+            "tags": tags,
+            "time_minutes": rng.choice([10, 15, 20, 25, 30, 40, 50, 60]),
+            "kcal": rng.randrange(250, 900, 10),
+            "ingredients": [_ingredient(rng, name) for name in names],
+            "steps": [f"Step {s}: prepare the {names[s % len(names)]}." for s in range(1, rng.randint(3, 6))],
+        })
+    return out
+
+
+def load_corpus(index: FakeIndex, recipes: List[Dict[str, Any]], dim: int) -> None:
+    """
+    Loads recipes the way recipe_ingest writes them (filterable metadata in
+    the index, bodies in the recipe store), plus memory and a past plan.
+    """
+    from app.services.recipe_corpus import RECIPES_NS, _recipe_vector, _recipe_to_search_text
+    from app.services.recipe_store import put_recipes
+    from app.services.user_memory import MEMORY_NS, FACTS_PREFIX, _content_hash
+    from app.services.redis_client import get_redis
+
+    mat = np.stack([hash_vector(_recipe_to_search_text(r), dim) for r in recipes])
+    meta = []
+    for r in recipes:
+        meta.append(_recipe_vector(USER_ID, r, [])[2])
+    index.load(RECIPES_NS, [r["id"] for r in recipes], mat, meta)
+    put_recipes(recipes)
+
+    index.load(
+        MEMORY_NS,
+        [f"mem_{USER_ID}_{_content_hash(t)}" for t in MEMORY],
+        np.stack([hash_vector(t, dim) for t in MEMORY]),
+        [{"user_id": USER_ID, "type": "feedback", "text": t, "ts": 0} for t in MEMORY],
+    )
+    get_redis().hset(FACTS_PREFIX + USER_ID, mapping=FACTS)
+    index.load(
+        "meal-plans",
+        [USER_ID],
+        hash_vector("past plan", dim)[None, :],
+        [{"meal_plan": "Day 1:\nBreakfast: Oats\nLunch: Thai Tofu Bowl\nDinner: Lentil Soup"}],
+    )
+
+
+def request_mix(n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Distinct preference sets, so each run misses the query embedding cache."""
+    rng = random.Random(seed + 1)
+    out = []
+    for _ in range(n):
+        out.append({
+            "user_id": USER_ID,
+            "chat_id": USER_ID,
+            "preferences": {
+                "days": rng.choice([3, 5, 7]),
+                "goal": rng.choice(["maintain", "cut", "bulk"]),
+                "diet": rng.choice([None, None, None, "vegetarian"]),
+                "cuisines": rng.sample(CUISINES, rng.randint(1, 3)),
+                "exclusions": rng.sample(["shrimp", "mushroom", "cucumber", "paneer"], rng.randint(0, 2)),
+                "ingredients_at_home": rng.sample(VEGETABLES + STAPLES, rng.randint(0, 6)),
+                "budget": rng.choice([None, 50, 100]),
+            },
+        })
+    return out
@@ -0,0 +1,535 @@
+# bench/fakes.py
+"""
+Offline stand-ins for OpenAI, the vector index and Redis. Every remote call
+sleeps for a configurable latency and returns deterministic output, and
+records how long it spent in the shared Recorder.
+"""
+import re, json, time, random, asyncio, fnmatch, hashlib, threading, importlib, contextlib
+from types import SimpleNamespace
+from typing import Dict, Any, List, Optional, Iterator
+
+import numpy as np
+
+from bench.stats import Recorder
+
+
+class Latency:
+    """mean_ms +/- jitter_ms, drawn from a seeded RNG so runs are repeatable."""
+
+    def __init__(self, mean_ms: float = 0.0, jitter_ms: float = 0.0, seed: int = 0):
+        self.mean_ms = mean_ms
+        self.jitter_ms = jitter_ms
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def seconds(self) -> float:
+        with self._lock:
+            j = self._rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        return max(0.0, self.mean_ms + j) / 1000.0
+
+# ---------- embeddings ----------
+
+def hash_vector(text: str, dim: int) -> np.ndarray:
+    """Deterministic unit vector for a text (same text -> same vector, across runs)."""
+    seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+    v = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return v / np.linalg.norm(v)
+
+# ---------- chat completions ----------
+
+_PLAN_DAYS_RE = re.compile(r"^Plan (\d+) days", re.M)
+_ALIAS_ROW_RE = re.compile(r"^(\d+)\|", re.M)
+
+
+def _cycle_days(days: int, ids: List[Any]) -> List[List[Any]]:
+    return [[ids[(d * 3 + s) % len(ids)] for s in range(3)] for d in range(days)] if ids else []
+
+
+def canned_reply(messages: List[Dict[str, str]]) -> str:
+    """
+    A valid answer for each planner prompt in app/services, built from the
+    prompt itself: slots are filled by cycling through the offered recipes.
+    """
+    user = messages[-1]["content"]
+    try:
+        obj = json.loads(user)
+    except ValueError:
+        obj = None
+
+    if isinstance(obj, dict):
+        if "draft_plan" in obj:  # build_plan_adapter polish pass
+            return json.dumps(obj["draft_plan"])
+        if "allowed_recipe_ids" in obj:  # grounded_planner / build_plan_adapter
+            slots = _cycle_days(int(obj.get("days") or 7), obj["allowed_recipe_ids"])
+            return json.dumps({"days": [
+                {"day": d, "meals": [{"type": t, "recipe_id": rid, "title": rid}
+                                     for t, rid in zip(("breakfast", "lunch", "dinner"), row)]}
+                for d, row in enumerate(slots, start=1)
+            ]})
+        if "provided_recipes" in obj:  # recipe_rag full prompt
+            recipes = obj["provided_recipes"]
+            slots = _cycle_days(int(obj["preferences"].get("days") or 7), list(range(len(recipes))))
+            return json.dumps({"days": [
+                {"day": d, "meals": [{"type": t, **recipes[i]} for t, i in zip(("breakfast", "lunch", "dinner"), row)]}
+                for d, row in enumerate(slots, start=1)
+            ], "grocery_list": [], "kroger_payload": []})
+
+    m = _PLAN_DAYS_RE.search(user)
+    if m:  # recipe_rag compact prompt: numbered table
+        aliases = [int(a) for a in _ALIAS_ROW_RE.findall(user)]
+        return json.dumps({"days": _cycle_days(int(m.group(1)), aliases)})
+
+    if "Day 1:" in user:  # meal_agent plain-text plan
+        return "\n\n".join(
+            f"Day {d}:\n" + "\n\n".join(f"{slot}: Bench meal {d}.{i} - 500 kcal\nRecipe: Cook. Serve."
+                                        for i, slot in enumerate(("Breakfast", "Lunch", "Dinner"), start=1))
+            for d in range(1, 8)
+        )
+    return "{}"
+
+
+def _usage(messages: List[Dict[str, str]], content: str) -> SimpleNamespace:
+    # ~4 characters per token, enough for the token audit fields
+    prompt = sum(len(m["content"]) for m in messages) // 4
+    completion = len(content) // 4
+    return SimpleNamespace(prompt_tokens=prompt, completion_tokens=completion, total_tokens=prompt + completion)
+
+
+def _completion(messages: List[Dict[str, str]]) -> SimpleNamespace:
+    content = canned_reply(messages)
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason="stop")],
+        usage=_usage(messages, content),
+    )
+
+
+def _chunks(content: str, size: int = 40) -> List[SimpleNamespace]:
+    return [SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content[i:i + size]))], usage=None)
+            for i in range(0, len(content), size)]
+
+
+def _stream_chunks(messages: List[Dict[str, str]], include_usage: bool) -> List[SimpleNamespace]:
+    content = canned_reply(messages)
+    chunks = _chunks(content)
+    if include_usage:
+        # like the API: one last chunk with no choices and the usage of the whole call
+        chunks.append(SimpleNamespace(choices=[], usage=_usage(messages, content)))
+    return chunks
+
+
+class _AsyncStream:
+    def __init__(self, chunks: List[SimpleNamespace], per_chunk: float):
+        self._chunks = chunks
+        self._per_chunk = per_chunk
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        for c in self._chunks:
+            await asyncio.sleep(self._per_chunk)
+            yield c
+
+
+class FakeOpenAI:
+    """
+    Sync or async OpenAI client: chat.completions.create (plain and stream=True)
+    and embeddings.create. Streams spread the latency over the chunks.
+    """
+
+    def __init__(self, recorder: Recorder, chat: Latency, embed: Latency, dim: int = 256, is_async: bool = False):
+        self._recorder = recorder
+        self._chat = chat
+        self._embed = embed
+        self._dim = dim
+        self._async = is_async
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._chat_create))
+        self.embeddings = SimpleNamespace(create=self._embed_create)
+
+    def _chat_result(self, messages, stream: bool, include_usage: bool = False):
+        if stream:
+            chunks = _stream_chunks(messages, include_usage)
+            return chunks, self._chat.seconds() / max(1, len(chunks))
+        return _completion(messages), self._chat.seconds()
+
+    def _embed_result(self, input):
+        texts = [input] if isinstance(input, str) else list(input)
+        data = [SimpleNamespace(embedding=hash_vector(t, self._dim).tolist(), index=i) for i, t in enumerate(texts)]
+        return SimpleNamespace(data=data), self._embed.seconds()
+
+    def _chat_create(self, *, messages, stream: bool = False, stream_options=None, **kwargs):
+        include_usage = bool((stream_options or {}).get("include_usage"))
+        if self._async:
+            return self._achat_create(messages, stream, include_usage)
+        with self._recorder.stage("openai.chat"):
+            result, delay = self._chat_result(messages, stream, include_usage)
+            time.sleep(delay * (len(result) if stream else 1))
+        return iter(result) if stream else result
+
+    async def _achat_create(self, messages, stream: bool, include_usage: bool = False):
+        if stream:
+            chunks, per_chunk = self._chat_result(messages, True, include_usage)
+            return _AsyncStream(chunks, per_chunk)
+        with self._recorder.stage("openai.chat"):
+            result, delay = self._chat_result(messages, False)
+            await asyncio.sleep(delay)
+        return result
+
+    def _embed_create(self, *, model: str, input, **kwargs):
+        if self._async:
+            return self._aembed_create(input)
+        with self._recorder.stage("openai.embed"):
+            result, delay = self._embed_result(input)
+            time.sleep(delay)
+        return result
+
+    async def _aembed_create(self, input):
+        with self._recorder.stage("openai.embed"):
+            result, delay = self._embed_result(input)
+            await asyncio.sleep(delay)
+        return result
+
+    def close(self):
+        pass
+
+# ---------- vector index ----------
+
+class _Space:
+    def __init__(self, dim: int):
+        self.mat = np.zeros((0, dim), dtype=np.float32)
+        self.ids: List[str] = []
+        self.meta: List[Dict[str, Any]] = []
+        self.row_of: Dict[str, int] = {}
+
+
+class FakeIndex:
+    """
+    In-memory stand-in for a Pinecone Index: exact cosine top-k (NumPy),
+    Pinecone-style metadata filters, fixed latency per call.
+    """
+
+    def __init__(self, recorder: Recorder, latency: Latency):
+        self._recorder = recorder
+        self._latency = latency
+        self._spaces: Dict[str, _Space] = {}
+        self._lock = threading.Lock()
+
+    def _space(self, namespace: str, dim: int) -> _Space:
+        sp = self._spaces.get(namespace)
+        if sp is None:
+            sp = self._spaces[namespace] = _Space(dim)
+        return sp
+
+    def load(self, namespace: str, ids: List[str], mat: np.ndarray, meta: List[Dict[str, Any]]) -> None:
+        """Bulk load for corpus setup (no latency, no per-record overhead)."""
+        sp = self._space(namespace, mat.shape[1])
+        start = len(sp.ids)
+        sp.mat = np.vstack([sp.mat, mat.astype(np.float32)])
+        sp.ids.extend(ids)
+        sp.meta.extend(meta)
+        sp.row_of.update({rid: start + i for i, rid in enumerate(ids)})
+
+    def upsert(self, vectors, namespace: str = "", **kwargs):
+        with self._recorder.stage("vector.upsert"):
+            time.sleep(self._latency.seconds())
+            with self._lock:
+                for rec in vectors:
+                    rid, values, md = (rec["id"], rec["values"], rec.get("metadata")) if isinstance(rec, dict) else (tuple(rec) + (None,))[:3]
+                    v = np.asarray(values, dtype=np.float32)
+                    sp = self._space(namespace, v.shape[0])
+                    row = sp.row_of.get(rid)
+                    if row is None:
+                        sp.row_of[rid] = len(sp.ids)
+                        sp.ids.append(rid)
+                        sp.meta.append(dict(md or {}))
+                        sp.mat = np.vstack([sp.mat, v[None, :]])
+                    else:
+                        sp.meta[row] = dict(md or {})
+                        sp.mat[row] = v
+        return {"upserted_count": len(vectors)}
+
+    def query(self, vector, top_k: int = 10, include_metadata: bool = False, namespace: str = "",
+              filter: Optional[Dict[str, Any]] = None, **kwargs):
+        from app.services.vector_store import matches_filter
+
+        with self._recorder.stage("vector.query"):
+            time.sleep(self._latency.seconds())
+            sp = self._spaces.get(namespace)
+            if sp is None or not sp.ids:
+                return {"matches": [], "namespace": namespace}
+            q = np.asarray(vector, dtype=np.float32)
+            sims = sp.mat @ (q / (np.linalg.norm(q) or 1.0))
+            order = np.argsort(-sims, kind="stable")
+            matches = []
+            for row in order:
+                if filter and not matches_filter(sp.meta[row], filter):
+                    continue
+                m = {"id": sp.ids[row], "score": float(sims[row])}
+                if include_metadata:
+                    m["metadata"] = dict(sp.meta[row])
+                matches.append(m)
+                if len(matches) >= top_k:
+                    break
+        return {"matches": matches, "namespace": namespace}
+
+    def fetch(self, ids: List[str], namespace: str = "", **kwargs):
+        with self._recorder.stage("vector.fetch"):
+            time.sleep(self._latency.seconds())
+            sp = self._spaces.get(namespace)
+            out = {}
+            for rid in ids:
+                row = sp.row_of.get(rid) if sp else None
+                if row is not None:
+                    out[rid] = {"id": rid, "values": sp.mat[row].tolist(), "metadata": dict(sp.meta[row])}
+        return {"vectors": out, "namespace": namespace}
+
+    def delete(self, ids: Optional[List[str]] = None, namespace: str = "", **kwargs):
+        return {}
+
+    def describe_index_stats(self, **kwargs):
+        return {"namespaces": {ns: {"vector_count": len(sp.ids)} for ns, sp in self._spaces.items()}}
+
+# ---------- redis ----------
+
+class _Pipeline:
+    def __init__(self, r: "FakeRedis"):
+        self._r = r
+        self._ops: List[Any] = []
+
+    def __getattr__(self, name: str):
+        def op(*args, **kwargs):
+            self._ops.append((name, args, kwargs))
+            return self
+        return op
+
+    def execute(self):
+        ops, self._ops = self._ops, []
+        # one round trip for the whole pipeline
+        with self._r._recorder.stage("redis"):
+            self._r._rt()
+            self._r._local.pipelined = True
+            try:
+                return [getattr(self._r, name)(*args, **kwargs) for name, args, kwargs in ops]
+            finally:
+                self._r._local.pipelined = False
+
+
+class FakeRedis:
+    """The Redis commands the services use, in process memory. TTLs are ignored."""
+
+    def __init__(self, recorder: Recorder, latency: Latency):
+        self._recorder = recorder
+        self._latency = latency
+        self._kv: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+        self._local = threading.local()
+
+    def _rt(self):
+        time.sleep(self._latency.seconds())
+
+    def _call(self, fn, *args):
+        if getattr(self._local, "pipelined", False):
+            with self._lock:
+                return fn(*args)
+        with self._recorder.stage("redis"):
+            self._rt()
+            with self._lock:
+                return fn(*args)
+
+    def pipeline(self, transaction: bool = True):
+        return _Pipeline(self)
+
+    def get(self, key):
+        return self._call(self._kv.get, key)
+
+    def mget(self, keys):
+        return self._call(lambda: [self._kv.get(k) for k in keys])
+
+    def set(self, key, value, ex=None, px=None, nx=False, xx=False, **kwargs):
+        def do():
+            if (nx and key in self._kv) or (xx and key not in self._kv):
+                return None
+            self._kv[key] = value
+            return True
+        return self._call(do)
+
+    def mset(self, mapping):
+        return self._call(lambda: self._kv.update(mapping) or True)
+
+    def delete(self, *keys):
+        return self._call(lambda: sum(self._kv.pop(k, None) is not None for k in keys))
+
+    def exists(self, *keys):
+        return self._call(lambda: sum(k in self._kv for k in keys))
+
+    def expire(self, key, seconds):
+        return True
+
+    def keys(self, pattern="*"):
+        return self._call(lambda: [k for k in self._kv if fnmatch.fnmatchcase(k, pattern)])
+
+    def hget(self, key, field):
+        return self._call(lambda: self._kv.get(key, {}).get(field))
+
+    def hgetall(self, key):
+        return self._call(lambda: dict(self._kv.get(key, {})))
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        def do():
+            h = self._kv.setdefault(key, {})
+            h.update(mapping or {})
+            if field is not None:
+                h[field] = value
+            return 1
+        return self._call(do)
+
+    def hsetnx(self, key, field, value):
+        def do():
+            h = self._kv.setdefault(key, {})
+            if field in h:
+                return 0
+            h[field] = value
+            return 1
+        return self._call(do)
+
+    def hincrby(self, key, field, amount=1):
+        def do():
+            h = self._kv.setdefault(key, {})
+            h[field] = str(int(h.get(field, 0)) + amount)
+            return int(h[field])
+        return self._call(do)
+
+    def hincrbyfloat(self, key, field, amount=1.0):
+        def do():
+            h = self._kv.setdefault(key, {})
+            h[field] = str(float(h.get(field, 0)) + amount)
+            return float(h[field])
+        return self._call(do)
+
+    def hdel(self, key, *fields):
+        return self._call(lambda: sum(self._kv.get(key, {}).pop(f, None) is not None for f in fields))
+
+    def zadd(self, key, mapping, nx=False, xx=False, ch=False):
+        def do():
+            z = self._kv.setdefault(key, {})
+            changed = 0
+            for m, s in mapping.items():
+                if (nx and m in z) or (xx and m not in z):
+                    continue
+                changed += z.get(m) != s
+                z[m] = s
+            return changed
+        return self._call(do)
+
+    def zrem(self, key, *members):
+        return self._call(lambda: sum(self._kv.get(key, {}).pop(m, None) is not None for m in members))
+
+    def zcard(self, key):
+        return self._call(lambda: len(self._kv.get(key, {})))
+
+    def sadd(self, key, *members):
+        def do():
+            s = self._kv.setdefault(key, set())
+            added = len(set(members) - s)
+            s.update(members)
+            return added
+        return self._call(do)
+
+    def sismember(self, key, member):
+        return self._call(lambda: int(member in self._kv.get(key, set())))
+
+    def srem(self, key, *members):
+        def do():
+            s = self._kv.get(key, set())
+            removed = len(set(members) & s)
+            s.difference_update(members)
+            return removed
+        return self._call(do)
+
+    def lpush(self, key, *values):
+        def do():
+            items = self._kv.setdefault(key, [])
+            items[:0] = reversed(values)
+            return len(items)
+        return self._call(do)
+
+    def eval(self, script, numkeys, *args):
+        # only the token-checked delete (jobs.Lock, dedupe keys) is used
+        key, token = args[0], args[1]
+        return self._call(lambda: 1 if self._kv.get(key) == token and self._kv.pop(key) else 0)
+
+# ---------- wiring ----------
+
+def cold_caches(redis: FakeRedis) -> None:
+    """
+    Empties the embedding caches (both tiers) and the in-process recipe cache,
+    so one pipeline's run does not warm the next. Recipe bodies stay in the
+    fake Redis: they are part of the corpus, not a cache.
+    """
+    from app.services import embeddings, recipe_store
+    from app.services.lru import LRUCache
+
+    embeddings._lru = LRUCache(embeddings.CACHE_SIZE)
+    recipe_store._lru = LRUCache(recipe_store._lru.maxsize)
+    for key in redis.keys(embeddings.REDIS_PREFIX + "*"):
+        redis.delete(key)
+
+
+# modules that bind get_redis at import time (RedisBackoff goes through redis_client's)
+_REDIS_USERS = (
+    "app.services.redis_client",
+    "app.services.profile_store",
+    "app.services.jobs",
+    "app.services.corpus_warmup",
+    "app.services.user_memory",
+)
+
+
+@contextlib.contextmanager
+def stand_ins(recorder: Recorder, chat_ms: float = 800, embed_ms: float = 60, vector_ms: float = 25,
+              redis_ms: float = 0.3, jitter: float = 0.1, dim: int = 256, seed: int = 0) -> Iterator[SimpleNamespace]:
+    """
+    Installs the fakes behind app.config's client registry and the vector /
+    Redis accessors; everything is restored on exit. jitter is a fraction of
+    each mean latency.
+    """
+    from app import config
+    from app.services import pinecone_client, embeddings, recipe_store
+
+    def lat(ms: float, k: int) -> Latency:
+        return Latency(ms, ms * jitter, seed + k)
+
+    fakes = SimpleNamespace(
+        openai=FakeOpenAI(recorder, lat(chat_ms, 1), lat(embed_ms, 2), dim),
+        async_openai=FakeOpenAI(recorder, lat(chat_ms, 3), lat(embed_ms, 4), dim, is_async=True),
+        index=FakeIndex(recorder, lat(vector_ms, 5)),
+        redis=FakeRedis(recorder, lat(redis_ms, 6)),
+    )
+
+    saved_clients = dict(config._clients)
+    patches = [
+        (pinecone_client, "_raw_index", lambda: fakes.index),
+        (embeddings, "_lru", embeddings._lru),
+        (recipe_store, "_lru", recipe_store._lru),
+    ]
+    for name in _REDIS_USERS:
+        patches.append((importlib.import_module(name), "get_redis", lambda decode_responses=True: fakes.redis))
+    originals = [(mod, attr, getattr(mod, attr)) for mod, attr, _ in patches]
+
+    with config._clients_lock:
+        config._clients.clear()
+        config._clients["openai"] = fakes.openai
+        config._clients["async_openai"] = fakes.async_openai
+    pinecone_client._registered.clear()
+    for mod, attr, value in patches:
+        setattr(mod, attr, value)
+    cold_caches(fakes.redis)
+    try:
+        yield fakes
+    finally:
+        for mod, attr, value in originals:
+            setattr(mod, attr, value)
+        with config._clients_lock:
+            config._clients.clear()
+            config._clients.update(saved_clients)
+        pinecone_client._registered.clear()
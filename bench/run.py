@@ -0,0 +1,216 @@
+# bench/run.py
+"""
+Offline benchmarks for the planning pipelines: OpenAI, the vector index and
+Redis are replaced by the stand-ins in bench/fakes.py.
+
+    python -m bench                                   # all pipelines, 1k recipes
+    python -m bench --sizes 100,10000,100000 --runs 50 --chat-ms 800
+    python -m bench --pipelines grounded,smart --planner llm --json out.json
+    python -m bench --compare baseline.json --max-regression 0.15
+
+Reports per-stage timings and end-to-end p50/p95/p99 per corpus size, and
+tracemalloc allocation figures for the CPU-bound steps.
+"""
+import os, sys, json, argparse, importlib
+from typing import Dict, Any, List, Callable, Tuple
+
+from bench.stats import Recorder, allocations
+
+# pipeline -> (module, function, [(module, attribute, stage), ...])
+# Stage wrappers are installed on the name the pipeline module actually calls.
+PIPELINES: Dict[str, Tuple[str, str, List[Tuple[str, str, str]]]] = {
+    "rag": ("app.services.meal_agent", "generate_rag_meal_plan", [
+        ("app.services.meal_agent", "get_past_meals", "past_meals"),
+    ]),
+    "grounded": ("app.services.grounded_planner", "build_grounded_meal_plan", [
+        ("app.services.grounded_planner", "retrieve_recipes_for_request", "retrieve"),
+        ("app.services.grounded_planner", "retrieve_memory", "memory"),
+        ("app.services.grounded_planner", "plan_with_optional_polish", "schedule"),
+        ("app.services.grounded_planner", "_finalize_plan", "finalize"),
+    ]),
+    "grounded_rag": ("app.services.meal_rag_agent", "generate_grounded_meal_plan", [
+        ("app.services.meal_rag_agent", "retrieve_recipes", "retrieve"),
+        ("app.services.meal_rag_agent", "retrieve_user_memory", "memory"),
+        ("app.services.meal_rag_agent", "select_recipes", "select"),
+        ("app.services.meal_rag_agent", "compile_grounded_plan", "compile"),
+        ("app.services.recipe_rag", "_compact_messages", "compile.prompt"),
+        ("app.services.recipe_rag", "_full_messages", "compile.prompt"),
+        ("app.services.recipe_rag", "_hydrate_slots", "compile.hydrate"),
+    ]),
+    "smart": ("app.services.meal_agent_smart", "generate_smart_meal_plan", [
+        ("app.services.meal_agent_smart", "remember_preferences", "store_memory"),
+        ("app.services.meal_agent_smart", "retrieve_recipes_for_request", "retrieve"),
+        ("app.services.meal_agent_smart", "retrieve_memory", "memory"),
+        ("app.services.meal_agent_smart", "_assemble_response", "assemble"),
+    ]),
+}
+
+
+def _smart_plan_fn(recorder: Recorder) -> Callable:
+    from app.config import PLANNER_BACKEND
+    from app.services.build_plan_adapter import build_plan_fn
+    from app.services.local_planner import plan_with_optional_polish
+    # same choice as meal_controller, sync flavour
+    return recorder.wrap(build_plan_fn if PLANNER_BACKEND == "llm" else plan_with_optional_polish, "plan")
+
+
+def run_pipeline(name: str, requests: List[Dict[str, Any]], recorder: Recorder) -> Dict[str, Any]:
+    from fastapi import HTTPException
+
+    module, fn_name, stages = PIPELINES[name]
+    fn = getattr(importlib.import_module(module), fn_name)
+    if name == "smart":
+        plan_fn = _smart_plan_fn(recorder)
+        call = lambda body: fn(body, plan_fn)
+    else:
+        call = fn
+
+    originals = []
+    for mod_name, attr, stage in stages:
+        mod = importlib.import_module(mod_name)
+        originals.append((mod, attr, getattr(mod, attr)))
+        setattr(mod, attr, recorder.wrap(getattr(mod, attr), stage))
+
+    outcomes: Dict[str, int] = {}
+    try:
+        for body in requests:
+            with recorder.run():
+                try:
+                    result = call(body)
+                    outcome = "error" if isinstance(result, dict) and result.get("error") else "ok"
+                except HTTPException as e:
+                    outcome = f"http_{e.status_code}"
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    finally:
+        for mod, attr, value in originals:
+            setattr(mod, attr, value)
+    return {**recorder.report(), "outcomes": outcomes}
+
+
+def cpu_steps(recipes: List[Dict[str, Any]], candidates: int, repeat: int) -> Dict[str, Dict[str, float]]:
+    """Allocation figures for the CPU-bound steps on one realistic candidate set."""
+    from bench.fakes import canned_reply
+    from app.services import recipe_rag, grounded_planner, recipe_store
+    from app.services.grocery_aggregate import aggregate_groceries, to_kroger_payload
+    from app.services.local_planner import local_build_plan_fn
+
+    cands = [{**r, "score": 0.5, "ingredient_names": [i["name"] for i in r["ingredients"]]} for r in recipes[:candidates]]
+    by_id = {r["id"]: r for r in cands}
+    used = [r["id"] for r in cands[:21]]
+    data = {"days": 7, "goal": "maintain", "cuisines": ["thai"], "exclusions": ["shrimp"],
+            "ingredients_at_home": ["rice", "garlic", "onion"]}
+    memory = ["Avoid ingredients: shrimp"]
+    raw_bodies = [recipe_store.encode({k: r[k] for k in recipe_store.BODY_FIELDS}) for r in cands]
+    plan_json = canned_reply(grounded_planner._schedule_messages(7, cands, memory))
+
+    steps: Dict[str, Callable[[], Any]] = {
+        "select.recipe_rag": lambda: recipe_rag.select_recipes(cands, 21, data),
+        "select.local_planner": lambda: local_build_plan_fn(user_id="u", prefs=data, candidates=cands, memory=memory),
+        "aggregate.groceries": lambda: to_kroger_payload(aggregate_groceries(used, by_id)),
+        "json.recipe_bodies": lambda: [recipe_store.decode(raw) for raw in raw_bodies],
+        "json.plan": lambda: json.loads(plan_json),
+        "prompt.compact": lambda: recipe_rag._compact_messages(data, cands, memory, 7),
+        "prompt.full": lambda: recipe_rag._full_messages(data, cands, memory, 7),
+        "prompt.schedule": lambda: grounded_planner._schedule_messages(7, cands, memory),
+    }
+    return {name: allocations(fn, repeat=repeat) for name, fn in steps.items()}
+
+# ---------- output ----------
+
+def _print_report(size: int, results: Dict[str, Any]) -> None:
+    print(f"\n== corpus {size} recipes ==")
+    for name, r in results["pipelines"].items():
+        e = r["end_to_end"]
+        print(f"{name:<13} p50 {e['p50']:8.1f} ms  p95 {e['p95']:8.1f}  p99 {e['p99']:8.1f}  (n={e['n']}, {r['outcomes']})")
+        for stage, s in r["stages"].items():
+            print(f"    {stage:<22} mean {s['mean']:8.2f} ms  p95 {s['p95']:8.2f}")
+    print("cpu steps                 ms/call   peak KiB   retained blocks")
+    for name, a in results["cpu"].items():
+        print(f"    {name:<22} {a['ms_per_call']:7.3f}  {a['peak_kib']:9.1f}  {a['retained_blocks']:8.1f}")
+
+
+def regressions(current: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """End-to-end p95 and CPU-step peak memory that got worse than baseline by more than max_regression."""
+    out = []
+    for size, res in current.items():
+        base = baseline.get(size)
+        if not base:
+            continue
+        for name, r in res["pipelines"].items():
+            old = base["pipelines"].get(name, {}).get("end_to_end", {}).get("p95")
+            new = r["end_to_end"]["p95"]
+            if old and new > old * (1 + max_regression):
+                out.append(f"{size} {name}: p95 {old:.1f} -> {new:.1f} ms")
+        for name, a in res["cpu"].items():
+            old = base["cpu"].get(name, {}).get("peak_kib")
+            if old and a["peak_kib"] > old * (1 + max_regression):
+                out.append(f"{size} {name}: peak {old:.1f} -> {a['peak_kib']:.1f} KiB")
+    return out
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Offline benchmarks for the meal planning pipelines.")
+    ap.add_argument("--pipelines", default=",".join(PIPELINES))
+    ap.add_argument("--sizes", default="1000", help="comma-separated corpus sizes, e.g. 100,1000,10000,100000")
+    ap.add_argument("--runs", type=int, default=30)
+    ap.add_argument("--chat-ms", type=float, default=800)
+    ap.add_argument("--embed-ms", type=float, default=60)
+    ap.add_argument("--vector-ms", type=float, default=25)
+    ap.add_argument("--redis-ms", type=float, default=0.3)
+    ap.add_argument("--jitter", type=float, default=0.1, help="latency jitter as a fraction of the mean")
+    ap.add_argument("--dim", type=int, default=256)
+    ap.add_argument("--candidates", type=int, default=35, help="candidate set size for the CPU steps")
+    ap.add_argument("--planner", choices=["local", "llm"], default="local")
+    ap.add_argument("--prompt-mode", choices=["compact", "full"], default="compact")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", help="write results here")
+    ap.add_argument("--compare", help="baseline results (--json output) to check against")
+    ap.add_argument("--max-regression", type=float, default=0.15)
+    args = ap.parse_args(argv)
+
+    # read by app.config at import time, so set before any app module loads
+    os.environ["PLANNER_BACKEND"] = args.planner
+    os.environ["RAG_PROMPT_MODE"] = args.prompt_mode
+    os.environ["PLAN_CACHE"] = "off"
+    os.environ["EMBED_PROVIDER"] = "openai"
+    os.environ["JOBS_INPROCESS_WORKERS"] = "0"
+
+    from bench.fakes import stand_ins, cold_caches
+    from bench.corpus import synthetic_recipes, load_corpus, request_mix
+
+    names = [p for p in args.pipelines.split(",") if p]
+    unknown = set(names) - set(PIPELINES)
+    if unknown:
+        ap.error(f"unknown pipelines: {', '.join(sorted(unknown))}")
+
+    results: Dict[str, Any] = {}
+    for size in [int(s) for s in args.sizes.split(",")]:
+        recipes = synthetic_recipes(size, seed=args.seed)
+        res: Dict[str, Any] = {"pipelines": {}}
+        recorder = Recorder()
+        with stand_ins(recorder, args.chat_ms, args.embed_ms, args.vector_ms, args.redis_ms,
+                       args.jitter, args.dim, args.seed) as fakes:
+            load_corpus(fakes.index, recipes, args.dim)
+            for name in names:
+                cold_caches(fakes.redis)
+                recorder.runs.clear()
+                res["pipelines"][name] = run_pipeline(name, request_mix(args.runs, args.seed), recorder)
+        res["cpu"] = cpu_steps(recipes, args.candidates, repeat=20)
+        results[str(size)] = res
+        _print_report(size, res)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            worse = regressions(results, json.load(f), args.max_regression)
+        if worse:
+            print("\nregressions:\n  " + "\n  ".join(worse))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
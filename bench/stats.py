@@ -0,0 +1,108 @@
+# bench/stats.py
+import time, threading, tracemalloc, contextlib
+from collections import defaultdict
+from typing import Dict, Any, List, Callable, Iterator, Tuple
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Linear interpolation between closest ranks (numpy's default method)."""
+    if not values:
+        return 0.0
+    xs = sorted(values)
+    k = (len(xs) - 1) * p / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(xs) - 1)
+    return xs[lo] + (xs[hi] - xs[lo]) * (k - lo)
+
+
+def summarize(values_ms: List[float]) -> Dict[str, float]:
+    return {
+        "n": len(values_ms),
+        "mean": sum(values_ms) / len(values_ms) if values_ms else 0.0,
+        "p50": percentile(values_ms, 50),
+        "p95": percentile(values_ms, 95),
+        "p99": percentile(values_ms, 99),
+        "max": max(values_ms) if values_ms else 0.0,
+    }
+
+
+class Recorder:
+    """
+    Collects wall time per named stage for each run. Stages may nest (e.g.
+    "retrieve" contains "openai.embed" and "vector.query"), so stage totals
+    are not meant to add up to the end-to-end time.
+    """
+
+    def __init__(self):
+        self.runs: List[Tuple[float, Dict[str, float]]] = []
+        self._current: Dict[str, float] = None
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t0
+            with self._lock:
+                if self._current is not None:
+                    self._current[name] += elapsed
+
+    @contextlib.contextmanager
+    def run(self) -> Iterator[None]:
+        self._current = defaultdict(float)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.runs.append((time.perf_counter() - t0, dict(self._current)))
+            self._current = None
+
+    def wrap(self, fn: Callable, name: str) -> Callable:
+        def timed(*args, **kwargs):
+            with self.stage(name):
+                return fn(*args, **kwargs)
+        return timed
+
+    def report(self) -> Dict[str, Any]:
+        """{"end_to_end": summary, "stages": {name: summary}} in milliseconds."""
+        stages: Dict[str, List[float]] = defaultdict(list)
+        for _, per_stage in self.runs:
+            for name, s in per_stage.items():
+                stages[name].append(s * 1000)
+        return {
+            "end_to_end": summarize([total * 1000 for total, _ in self.runs]),
+            "stages": {name: summarize(v) for name, v in sorted(stages.items())},
+        }
+
+
+def allocations(fn: Callable[[], Any], repeat: int = 20) -> Dict[str, float]:
+    """
+    Per call of fn, under tracemalloc: mean time, peak traced memory above the
+    starting point, and blocks still allocated afterwards (leaks / caches).
+    Times are inflated by tracing; compare them only with each other.
+    """
+    fn()  # warm caches and lazy imports outside the measurement
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        base, _ = tracemalloc.get_traced_memory()
+        peak = 0
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            tracemalloc.reset_peak()
+            fn()
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - base)
+        elapsed = time.perf_counter() - t0
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    diff = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), "filename")
+    return {
+        "ms_per_call": elapsed * 1000 / repeat,
+        "peak_kib": peak / 1024,
+        "retained_blocks": sum(d.count_diff for d in diff) / repeat,
+    }
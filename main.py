@@ -1,18 +1,46 @@
 
-
+import os, threading
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from app.routes import meal_routes, grocery_routes, location_routes, user_routes
 from app.routes.recipe_routes import router as recipe_router
 from app.routes.debug_routes import router as debug_router
 from app.routes.grounded_meal_routes import router as grounded_meal_router
 from app.routes.memory_routes import router as memory_router
+from app.routes.job_routes import router as job_router
+from app.routes.metrics_routes import router as metrics_router
+from app.services.pinecone_client import warm_up_vector_index, ensure_index
+from app.services.blocking_executor import ExecutorSaturated, run_blocking
+from app.services.jobs import start_workers
+from app.config import JOBS_INPROCESS_WORKERS, close_clients
 
 
-import redis
-redis_client = redis.Redis(host="localhost", port=6379, decode_responses=True)
-
 from fastapi.middleware.cors import CORSMiddleware
-app = FastAPI()
+from fastapi.responses import JSONResponse
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup does no network I/O unless asked to: clients are created lazily
+    # on first use (app/config.py), so a worker is ready as soon as it imports.
+    if os.getenv("PINECONE_ENSURE_INDEX", "0") == "1":
+        print("Vector index:", await run_blocking(ensure_index))
+    if os.getenv("PINECONE_WARMUP", "0") == "1":
+        # Opt-in: opens the pooled Pinecone connection before the first request
+        print("Vector index warm-up:", await run_blocking(warm_up_vector_index))
+
+    stop_workers = threading.Event()
+    if JOBS_INPROCESS_WORKERS > 0:
+        # background jobs; set JOBS_INPROCESS_WORKERS=0 when running dedicated workers
+        start_workers(JOBS_INPROCESS_WORKERS, stop_workers)
+
+    yield
+
+    stop_workers.set()
+    await close_clients()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -22,10 +50,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Test connection
-redis_client.set("test_key", "Hello, Redis!")
-print(redis_client.get("test_key"))  
 
+@app.exception_handler(ExecutorSaturated)
+def executor_saturated(request, exc: ExecutorSaturated):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
 
 
 # Include Routers
@@ -37,6 +65,8 @@ app.include_router(recipe_router, prefix="/recipes", tags=["Recipes"])
 app.include_router(debug_router, tags=["Debug"])
 app.include_router(grounded_meal_router, prefix="/meals", tags=["Meals (RAG)"])
 app.include_router(memory_router, prefix="/memory", tags=["Memory"])
+app.include_router(job_router, prefix="/jobs", tags=["Jobs"])
+app.include_router(metrics_router, tags=["Metrics"])
 
 @app.get("/")
 def read_root():
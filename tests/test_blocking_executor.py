@@ -0,0 +1,44 @@
+# tests/test_blocking_executor.py
+import asyncio, threading
+
+import pytest
+
+from app.services.blocking_executor import BlockingExecutor, ExecutorSaturated
+
+
+def test_cancelled_queued_calls_leave_the_queue():
+    ex = BlockingExecutor(workers=1, max_queue=3)
+    release = threading.Event()
+
+    async def main():
+        busy = asyncio.ensure_future(ex.run(release.wait))
+        await asyncio.sleep(0.05)
+        # more cancelled waiters than the queue holds: each must give its place back
+        for _ in range(10):
+            waiter = asyncio.ensure_future(ex.run(lambda: None))
+            await asyncio.sleep(0)
+            waiter.cancel()
+            await asyncio.gather(waiter, return_exceptions=True)
+        assert ex.metrics()["queue_depth"] == 0
+        release.set()
+        await busy
+        assert await ex.run(lambda: 42) == 42
+
+    try:
+        asyncio.run(main())
+    finally:
+        release.set()
+    m = ex.metrics()
+    assert m["queue_depth"] == 0 and m["running"] == 0 and m["rejected"] == 0
+
+
+def test_full_queue_still_rejects():
+    ex = BlockingExecutor(workers=1, max_queue=1)
+    release = threading.Event()
+    try:
+        ex.submit(release.wait)
+        ex.submit(lambda: None)
+        with pytest.raises(ExecutorSaturated):
+            ex.submit(lambda: None)
+    finally:
+        release.set()
@@ -0,0 +1,45 @@
+# tests/test_embedding_providers.py
+import time, asyncio
+
+from app.services.embedding_providers import _MicroBatcher
+
+
+def _encode(texts):
+    time.sleep(0.02)
+    return [[float(len(t))] for t in texts]
+
+
+def test_batcher_survives_cancelled_callers():
+    batcher = _MicroBatcher(_encode, 20, 64)
+
+    async def main():
+        queued = asyncio.ensure_future(asyncio.wrap_future(batcher.submit(["aa"])))
+        await asyncio.sleep(0)
+        queued.cancel()
+        running = asyncio.ensure_future(asyncio.wrap_future(batcher.submit(["bbb"])))
+        await asyncio.sleep(0.03)
+        running.cancel()
+        await asyncio.gather(queued, running, return_exceptions=True)
+        return await asyncio.wait_for(asyncio.wrap_future(batcher.submit(["cccc", "d"])), 2)
+
+    assert asyncio.run(main()) == [[4.0], [1.0]]
+    assert batcher._thread.is_alive()
+
+
+def test_batcher_survives_encode_errors():
+    calls = []
+
+    def flaky(texts):
+        calls.append(texts)
+        if len(calls) == 1:
+            raise RuntimeError("model failed")
+        return [[1.0] for _ in texts]
+
+    batcher = _MicroBatcher(flaky, 1, 64)
+    first = batcher.submit(["x"])
+    try:
+        first.result(timeout=2)
+        assert False, "expected the encode error"
+    except RuntimeError:
+        pass
+    assert batcher.submit(["y"]).result(timeout=2) == [[1.0]]
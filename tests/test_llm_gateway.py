@@ -0,0 +1,78 @@
+# tests/test_llm_gateway.py
+import asyncio
+from types import SimpleNamespace
+
+from app.services import llm_gateway
+
+
+def _client(create):
+    return SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=create)),
+        embeddings=SimpleNamespace(create=create),
+    )
+
+
+def test_cancelled_calls_release_their_slots(monkeypatch):
+    gw = llm_gateway.Gateway(0, 0, 2)
+    monkeypatch.setattr(llm_gateway, "gateway", gw)
+
+    async def hang(**kwargs):
+        await asyncio.sleep(60)
+
+    client = llm_gateway.GatedOpenAI(_client(hang), is_async=True)
+
+    async def main():
+        tasks = [asyncio.ensure_future(client.chat.completions.create(messages=[])) for _ in range(5)]
+        await asyncio.sleep(0.05)
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    asyncio.run(main())
+    stats = gw.stats()
+    assert stats["in_flight"] == 0
+    assert stats["queued"] == {}
+
+
+def test_slot_is_reused_after_cancellation(monkeypatch):
+    gw = llm_gateway.Gateway(0, 0, 1)
+    monkeypatch.setattr(llm_gateway, "gateway", gw)
+    started = []
+
+    async def create(**kwargs):
+        started.append(kwargs["tag"])
+        if kwargs["tag"] == "slow":
+            await asyncio.sleep(60)
+        return SimpleNamespace(usage=None)
+
+    client = llm_gateway.GatedOpenAI(_client(create), is_async=True)
+
+    async def main():
+        slow = asyncio.ensure_future(client.chat.completions.create(messages=[], tag="slow"))
+        await asyncio.sleep(0.05)
+        slow.cancel()
+        await asyncio.gather(slow, return_exceptions=True)
+        await asyncio.wait_for(client.chat.completions.create(messages=[], tag="next"), 2)
+
+    asyncio.run(main())
+    assert started == ["slow", "next"]
+    assert gw.stats()["in_flight"] == 0
+
+
+def test_stream_closed_early_releases_its_slot(monkeypatch):
+    gw = llm_gateway.Gateway(0, 0, 1)
+    monkeypatch.setattr(llm_gateway, "gateway", gw)
+    closed = []
+
+    class _Chunks:
+        def __iter__(self):
+            return iter([SimpleNamespace(usage=None)] * 3)
+
+        def close(self):
+            closed.append(True)
+
+    client = llm_gateway.GatedOpenAI(_client(lambda **kw: _Chunks()))
+    stream = client.chat.completions.create(messages=[], stream=True)
+    assert gw.stats()["in_flight"] == 1
+    stream.close()
+    assert gw.stats()["in_flight"] == 0 and closed == [True]
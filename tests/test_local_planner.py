@@ -0,0 +1,48 @@
+# tests/test_local_planner.py
+import pytest
+from fastapi import HTTPException
+
+from app.services.local_planner import memory_exclusions, local_build_plan_fn, solve_schedule
+from app.services.recipe_filters import exclusion_ids, uses_excluded
+
+
+def _recipe(rid, title, *ingredients):
+    return {"id": rid, "title": title, "ingredients": [{"name": n} for n in ingredients]}
+
+
+def _used(candidates, exclusions):
+    days = solve_schedule(candidates, 1, exclusions=set(exclusions))
+    return {m["recipe_id"] for d in days for m in d["meals"]}
+
+
+@pytest.mark.parametrize("exclusion, recipe, excluded", [
+    ("egg", _recipe("a", "Egg-Free Muffins", "flour", "banana"), False),
+    ("peanut", _recipe("a", "Peanut-Free Noodles", "rice noodles", "sesame oil"), False),
+    ("egg", _recipe("a", "Ratatouille", "eggplant", "zucchini"), False),
+    ("egg", _recipe("a", "Omelette", "eggs", "chives"), True),
+    ("shrimp", _recipe("a", "Scampi", "jumbo shrimp", "garlic"), True),
+    ("peanut", _recipe("a", "Satay", "peanut butter", "chicken"), True),
+])
+def test_exclusions_match_ingredient_words_not_titles(exclusion, recipe, excluded):
+    other = _recipe("b", "Rice", "rice")
+    assert ("a" not in _used([recipe, other], [exclusion])) == excluded
+    # the retrieval path applies the same rule
+    assert uses_excluded(recipe, exclusion_ids([exclusion])) == excluded
+
+
+def test_memory_exclusions_need_whole_keywords():
+    found = memory_exclusions([
+        "whatever works",
+        "I hate olives",
+        "Avoid ingredients: peanuts, shrimp",
+        "Allergy: eggs",
+        "avoidance is not a preference",
+    ])
+    assert found == {"olives", "peanuts", "shrimp", "eggs"}
+
+
+def test_all_candidates_excluded_is_an_error():
+    with pytest.raises(HTTPException) as e:
+        local_build_plan_fn(user_id="u", prefs={"days": 2, "exclusions": ["shrimp"]},
+                            candidates=[_recipe("a", "Scampi", "shrimp")], memory=[])
+    assert e.value.status_code == 422
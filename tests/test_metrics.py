@@ -0,0 +1,128 @@
+# tests/test_metrics.py
+import asyncio
+import gc
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import metrics
+from app.services.metrics import TracedOpenAI
+
+
+def _chunks(n):
+    return [SimpleNamespace(usage=None, choices=[]) for _ in range(n)]
+
+
+class _AsyncChunks:
+    def __init__(self, chunks, gate=None):
+        self._chunks = list(chunks)
+        self._gate = gate
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._chunks:
+            raise StopAsyncIteration
+        if self._gate is not None and len(self._chunks) == 1:
+            await self._gate.wait()
+        return self._chunks.pop(0)
+
+
+def _client(create):
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+def _observed(model: str, suffix: str = "_count") -> int:
+    name = "mealplan_external_seconds" + suffix
+    for line in metrics.render().splitlines():
+        if line.startswith(name + "{") and f'model="{model}"' in line:
+            return int(float(line.rsplit(" ", 1)[1]))
+    return 0
+
+
+def _errors(model: str) -> int:
+    for line in metrics.render().splitlines():
+        if line.startswith("mealplan_external_errors_total{") and f'model="{model}"' in line:
+            return int(float(line.rsplit(" ", 1)[1]))
+    return 0
+
+
+def test_sync_stream_recorded_when_exhausted():
+    client = TracedOpenAI(_client(lambda **kw: iter(_chunks(3))))
+    assert len(list(client.chat.completions.create(model="t-sync-full", messages=[], stream=True))) == 3
+    assert _observed("t-sync-full") == 1
+
+
+def test_sync_stream_recorded_when_consumer_stops_early():
+    client = TracedOpenAI(_client(lambda **kw: iter(_chunks(5))))
+    stream = client.chat.completions.create(model="t-sync-break", messages=[], stream=True)
+    it = iter(stream)
+    next(it)
+    it.close()
+    assert _observed("t-sync-break") == 1
+    del stream, it
+    gc.collect()
+    assert _observed("t-sync-break") == 1
+
+
+def test_sync_stream_recorded_when_closed_or_dropped_unread():
+    client = TracedOpenAI(_client(lambda **kw: iter(_chunks(2))))
+    client.chat.completions.create(model="t-sync-close", messages=[], stream=True).close()
+    assert _observed("t-sync-close") == 1
+
+    client.chat.completions.create(model="t-sync-drop", messages=[], stream=True)
+    gc.collect()
+    assert _observed("t-sync-drop") == 1
+
+
+def test_sync_stream_error_counted_once():
+    def broken():
+        yield _chunks(1)[0]
+        raise RuntimeError("connection reset")
+
+    client = TracedOpenAI(_client(lambda **kw: broken()))
+    with pytest.raises(RuntimeError):
+        list(client.chat.completions.create(model="t-sync-err", messages=[], stream=True))
+    assert _observed("t-sync-err") == 1
+    assert _errors("t-sync-err") == 1
+
+
+def test_async_stream_recorded_when_consumer_is_cancelled():
+    async def run():
+        gate = asyncio.Event()
+
+        async def create(**kw):
+            return _AsyncChunks(_chunks(3), gate)
+
+        client = TracedOpenAI(_client(create), is_async=True)
+        stream = await client.chat.completions.create(model="t-async-cancel", messages=[], stream=True)
+
+        async def consume():
+            async for _ in stream:
+                pass
+
+        task = asyncio.ensure_future(consume())
+        await asyncio.sleep(0.01)  # parked on the last chunk
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert _observed("t-async-cancel") == 1
+    assert _errors("t-async-cancel") == 0
+
+
+def test_async_stream_recorded_on_aclose():
+    async def run():
+        async def create(**kw):
+            return _AsyncChunks(_chunks(4))
+
+        client = TracedOpenAI(_client(create), is_async=True)
+        stream = await client.chat.completions.create(model="t-async-aclose", messages=[], stream=True)
+        it = stream.__aiter__()
+        await it.__anext__()
+        await it.aclose()
+
+    asyncio.run(run())
+    assert _observed("t-async-aclose") == 1
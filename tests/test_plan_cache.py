@@ -0,0 +1,226 @@
+# tests/test_plan_cache.py
+import itertools
+
+import pytest
+
+from app.services import plan_cache, redis_client
+
+
+class _Pipe:
+    def __init__(self, r):
+        self._r = r
+        self._calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self._calls.append((name, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        return [getattr(self._r, n)(*a, **kw) for n, a, kw in self._calls]
+
+
+class _Redis:
+    """The subset of redis-py (decode_responses=True) plan_cache uses; TTLs are ignored."""
+
+    def __init__(self):
+        self.kv, self.hashes, self.zsets = {}, {}, {}
+        self.commands = []
+        self._clock = itertools.count(1)
+
+    def pipeline(self, transaction=False):
+        return _Pipe(self)
+
+    def get(self, k):
+        self.commands.append(("get", k))
+        return self.kv.get(k)
+
+    def set(self, k, v, ex=None):
+        self.kv[k] = v
+
+    def exists(self, k):
+        return int(k in self.kv)
+
+    def delete(self, *keys):
+        for k in keys:
+            self.kv.pop(k, None)
+
+    def expire(self, k, ttl):
+        return True
+
+    def zadd(self, k, mapping):
+        # a logical clock instead of time.time(): accesses in one test tick stay ordered
+        self.zsets.setdefault(k, {}).update({m: next(self._clock) for m in mapping})
+
+    def zremrangebyscore(self, k, lo, hi):
+        return 0
+
+    def zcard(self, k):
+        return len(self.zsets.get(k, {}))
+
+    def zpopmin(self, k, n):
+        z = self.zsets.get(k, {})
+        out = sorted(z.items(), key=lambda kv: kv[1])[:n]
+        for m, _ in out:
+            del z[m]
+        return out
+
+    def hset(self, k, f, v):
+        self.hashes.setdefault(k, {})[f] = v
+
+    def hgetall(self, k):
+        self.commands.append(("hgetall", k))
+        return dict(self.hashes.get(k, {}))
+
+    def hlen(self, k):
+        return len(self.hashes.get(k, {}))
+
+    def hkeys(self, k):
+        return list(self.hashes.get(k, {}))
+
+    def hdel(self, k, *fields):
+        for f in fields:
+            self.hashes.get(k, {}).pop(f, None)
+
+    def hincrby(self, k, f, n):
+        h = self.hashes.setdefault(k, {})
+        h[f] = str(int(h.get(f, 0)) + n)
+
+    def hincrbyfloat(self, k, f, n):
+        h = self.hashes.setdefault(k, {})
+        h[f] = str(float(h.get(f, 0.0)) + n)
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    r = _Redis()
+    monkeypatch.setattr(redis_client, "get_redis", lambda decode_responses=True: r)
+    monkeypatch.setattr(plan_cache, "_redis", redis_client.RedisBackoff())
+    monkeypatch.setattr(plan_cache, "PLAN_CACHE", "on")
+    monkeypatch.setattr(plan_cache, "PLAN_CACHE_NEAR_HIT", 0.0)
+    return r
+
+
+PREFS = {"diet": "Vegetarian", "cuisines": ["Thai", "indian"], "exclusions": ["peanut"]}
+
+
+def _candidates(n, start=0):
+    return [{"id": f"r_u1_{i}"} for i in range(start, start + n)]
+
+
+def _plan(ids):
+    return {"days": [{"day": 1, "meals": [{"recipe_id": i} for i in ids]}], "audit": {}}
+
+
+def _computer(plan):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return plan
+    return compute, calls
+
+# ---------- hits ----------
+
+def test_second_request_is_a_hit(redis):
+    cands = _candidates(10)
+    compute, calls = _computer(_plan(["r_u1_0", "r_u1_1", "r_u1_2"]))
+
+    first = plan_cache.cached_plan(PREFS, 1, cands, [], compute)
+    # same preferences, spelled differently
+    prefs = {"diet": " vegetarian", "cuisines": ["Indian", "thai"], "exclusions": ["Peanut"]}
+    second = plan_cache.cached_plan(prefs, 1, list(reversed(cands)), [], compute)
+
+    assert len(calls) == 1
+    assert first["audit"]["plan_cache"]["status"] == "miss"
+    assert second["audit"]["plan_cache"]["status"] == "hit"
+    assert second["days"] == first["days"]
+    assert plan_cache.stats()["hits"] == 1
+
+
+@pytest.mark.parametrize("change", [
+    {"days": 2},
+    {"memory": ["no mushrooms"]},
+    {"prefs": {**PREFS, "exclusions": ["peanut", "shrimp"]}},
+    {"candidates": _candidates(10, start=1)},
+])
+def test_any_key_component_change_is_a_miss(redis, change):
+    compute, calls = _computer(_plan(["r_u1_1"]))
+    plan_cache.cached_plan(PREFS, 1, _candidates(10), [], compute)
+    plan_cache.cached_plan(
+        change.get("prefs", PREFS), change.get("days", 1),
+        change.get("candidates", _candidates(10)), change.get("memory", []), compute,
+    )
+    assert len(calls) == 2
+
+
+def test_near_hit_is_opt_in(redis, monkeypatch):
+    compute, calls = _computer(_plan(["r_u1_1", "r_u1_2"]))
+    plan_cache.cached_plan(PREFS, 1, _candidates(10), [], compute)
+    grown = _candidates(11)  # one new recipe: Jaccard 10/11
+
+    out = plan_cache.cached_plan(PREFS, 1, grown, [], compute)
+    assert out["audit"]["plan_cache"]["status"] == "miss"
+    assert not [k for cmd, k in redis.commands if k.startswith(plan_cache.PREFIX + "profile:")]
+
+    monkeypatch.setattr(plan_cache, "PLAN_CACHE_NEAR_HIT", 0.8)
+    compute, calls = _computer(_plan(["r_u1_21", "r_u1_22"]))
+    plan_cache.cached_plan(PREFS, 1, _candidates(10, start=20), [], compute)  # seeds the profile hash
+    out = plan_cache.cached_plan(PREFS, 1, _candidates(11, start=20), [], compute)
+    assert out["audit"]["plan_cache"]["status"] == "near_hit"
+    assert len(calls) == 1
+
+# ---------- grounding ----------
+
+def test_near_hit_not_grounded_in_current_candidates_is_a_miss(redis, monkeypatch):
+    monkeypatch.setattr(plan_cache, "PLAN_CACHE_NEAR_HIT", 0.5)
+    compute, calls = _computer(_plan(["r_u1_0"]))
+    plan_cache.cached_plan(PREFS, 1, _candidates(10), [], compute)
+
+    # overlaps enough, but r_u1_0 (used by the cached plan) is gone
+    out = plan_cache.cached_plan(PREFS, 1, _candidates(10, start=1), [], compute)
+    assert out["audit"]["plan_cache"]["status"] == "miss"
+    assert len(calls) == 2
+
+
+@pytest.mark.parametrize("plan", [
+    _plan(["r_u1_0", "r_other_9"]),  # hallucinated id
+    {"days": [], "audit": {}},
+    {**_plan(["r_u1_0"]), "audit": {"truncated": True}},
+    {**_plan(["r_u1_0"]), "error": "bad json"},
+])
+def test_unusable_plans_are_not_stored(redis, plan):
+    compute, calls = _computer(plan)
+    plan_cache.cached_plan(PREFS, 1, _candidates(5), [], compute)
+    plan_cache.cached_plan(PREFS, 1, _candidates(5), [], compute)
+    assert len(calls) == 2
+    assert redis.kv == {}
+
+# ---------- eviction ----------
+
+def test_least_recently_used_entries_are_evicted(redis, monkeypatch):
+    monkeypatch.setattr(plan_cache, "PLAN_CACHE_MAX_ENTRIES", 2)
+    sets = [_candidates(3, start=10 * i) for i in range(3)]
+    plans = [_plan([c[0]["id"]]) for c in sets]
+
+    for cands, plan in zip(sets[:2], plans):
+        plan_cache.cached_plan(PREFS, 1, cands, [], _computer(plan)[0])
+    # touch the first entry so the second is least recently used
+    assert plan_cache.cached_plan(PREFS, 1, sets[0], [], _computer(plans[0])[0])["audit"]["plan_cache"]["status"] == "hit"
+    plan_cache.cached_plan(PREFS, 1, sets[2], [], _computer(plans[2])[0])
+
+    assert plan_cache.stats()["entries"] == 2
+    statuses = [
+        plan_cache.cached_plan(PREFS, 1, sets[i], [], _computer(plans[i])[0])["audit"]["plan_cache"]["status"]
+        for i in (0, 2, 1)
+    ]
+    assert statuses == ["hit", "hit", "miss"]
+
+
+def test_cache_off_calls_compute_without_redis(redis, monkeypatch):
+    monkeypatch.setattr(plan_cache, "PLAN_CACHE", "off")
+    compute, calls = _computer(_plan(["r_u1_0"]))
+    out = plan_cache.cached_plan(PREFS, 1, _candidates(3), [], compute)
+    assert len(calls) == 1 and "plan_cache" not in out["audit"]
+    assert redis.kv == {}
@@ -0,0 +1,90 @@
+# tests/test_recipe_filters.py
+import pytest
+
+from app.services.recipe_filters import diet_flags, exclusion_ids, ingredient_tokens, request_filter, uses_excluded
+
+
+def _recipe(*names, tags=()):
+    return {"ingredients": [{"name": n} for n in names], "tags": list(tags)}
+
+# ---------- diet_flags ----------
+
+@pytest.mark.parametrize("names, tags, expected", [
+    (["tofu", "broccoli", "rice"], (), ["vegetarian", "vegan", "gluten_free"]),
+    # word boundaries: no keyword hidden inside another word
+    (["a bunch of cilantro", "lime"], (), ["vegetarian", "vegan", "gluten_free"]),
+    (["honeydew melon", "mint"], (), ["vegetarian", "vegan", "gluten_free"]),
+    (["champignons", "scallions"], (), ["vegetarian", "vegan", "gluten_free"]),
+    (["beefsteak tomato", "basil"], (), ["vegetarian", "vegan", "gluten_free"]),
+    (["dragon fruit", "pitaya"], (), ["vegetarian", "vegan", "gluten_free"]),
+    # plurals still match
+    (["burger buns", "lettuce"], (), ["vegetarian", "vegan"]),
+    (["eggs", "spinach"], (), ["vegetarian", "gluten_free"]),
+    (["anchovies", "capers"], (), ["gluten_free"]),
+    (["hamburger patties"], (), ["gluten_free"]),
+    (["honey", "oats"], (), ["vegetarian", "gluten_free"]),
+    (["buttermilk", "cornmeal"], (), ["vegetarian", "gluten_free"]),
+    # exceptions
+    (["eggplant", "butternut squash", "peanut butter", "coconut milk"], (), ["vegetarian", "vegan", "gluten_free"]),
+    (["corn tortillas", "black beans"], (), ["vegetarian", "vegan", "gluten_free"]),
+    (["rice noodles", "tamari"], (), ["vegetarian", "vegan", "gluten_free"]),
+    (["soy sauce", "tofu"], (), ["vegetarian", "vegan"]),
+    (["chicken thighs", "spaghetti"], (), []),
+    # tags vouch for the recipe
+    (["vegan cheese", "spinach"], ("Vegan",), ["vegetarian", "vegan", "gluten_free"]),
+    (["pasta", "tomato"], ("gluten-free",), ["vegetarian", "vegan", "gluten_free"]),
+])
+def test_diet_flags(names, tags, expected):
+    assert diet_flags(_recipe(*names, tags=tags)) == expected
+
+# ---------- ingredient_tokens ----------
+
+@pytest.mark.parametrize("names, expected", [
+    (["Jumbo Shrimp"], ["jumbo", "jumbo_shrimp", "shrimp"]),
+    (["cherry tomatoes"], ["cherry", "cherry_tomato", "tomato"]),
+    (["peanut butter"], ["butter", "peanut", "peanut_butter"]),
+    (["eggplant"], ["eggplant"]),
+    (["extra virgin olive oil"], ["extra", "extra_virgin", "extra_virgin_olive", "extra_virgin_olive_oil",
+                                  "oil", "olive", "olive_oil", "virgin", "virgin_olive", "virgin_olive_oil"]),
+    (["", "  "], []),
+])
+def test_ingredient_tokens(names, expected):
+    assert ingredient_tokens(names) == expected
+
+
+@pytest.mark.parametrize("names, exclusions, excluded", [
+    (["jumbo shrimp"], ["shrimp"], True),
+    (["Peanut Butter"], ["peanuts"], True),
+    (["eggplant"], ["egg"], False),
+    (["cashews"], ["nuts"], False),
+    (["cherry tomatoes"], ["cherry tomato"], True),
+])
+def test_uses_excluded(names, exclusions, excluded):
+    assert uses_excluded(_recipe(*names), exclusion_ids(exclusions)) is excluded
+
+# ---------- request_filter ----------
+
+_USER = {"user_id": {"$eq": "u1"}}
+
+
+@pytest.mark.parametrize("diet, exclusions, max_time, expected", [
+    (None, [], None, _USER),
+    ("", [], "", _USER),
+    ("keto", [], "not a number", _USER),
+    (None, ["Shrimp", "peanuts", " "], None, {"$and": [
+        _USER,
+        {"ingredient_tokens": {"$nin": ["peanut", "shrimp"]}},
+        {"ingredient_ids": {"$nin": ["peanut", "shrimp"]}},
+    ]}),
+    ("Plant-Based", [], None, {"$and": [
+        _USER,
+        {"$or": [{"diet_flags": {"$in": ["vegan"]}}, {"diet_flags": {"$exists": False}}]},
+    ]}),
+    ("gf", [], "45", {"$and": [
+        _USER,
+        {"$or": [{"diet_flags": {"$in": ["gluten_free"]}}, {"diet_flags": {"$exists": False}}]},
+        {"$or": [{"time_minutes": {"$lte": 45.0}}, {"time_minutes": {"$exists": False}}]},
+    ]}),
+])
+def test_request_filter(diet, exclusions, max_time, expected):
+    assert request_filter("u1", diet, exclusions, max_time) == expected
@@ -0,0 +1,69 @@
+# tests/test_recipe_ingest.py
+import threading
+
+import pytest
+
+from app.services import recipe_ingest
+
+
+class _Index:
+    """Fails every upsert of a chunk containing a poisoned id."""
+
+    def __init__(self, poisoned):
+        self.poisoned = poisoned
+        self.ids = []
+        self._lock = threading.Lock()
+
+    def upsert(self, vectors, namespace):
+        ids = [v[0] for v in vectors]
+        if self.poisoned in ids:
+            raise ConnectionError("upsert rejected")
+        with self._lock:
+            self.ids.extend(ids)
+
+
+def _recipe(i):
+    return {"id": f"r{i}", "title": f"Dish {i}", "ingredients": [{"name": "rice"}], "steps": ["Cook."]}
+
+
+@pytest.fixture
+def index(monkeypatch):
+    idx = _Index("r13")
+    monkeypatch.setattr(recipe_ingest, "get_pinecone_index", lambda: idx)
+    monkeypatch.setattr(recipe_ingest, "_embed_texts", lambda texts: [[0.0, 1.0] for _ in texts])
+    monkeypatch.setattr(recipe_ingest, "put_recipes", lambda batch: None)
+    return idx
+
+
+def test_failed_batch_is_counted_and_others_go_through(index):
+    # 40 valid recipes plus 8 invalid, interleaved
+    stream = (r for i in range(48) for r in [_recipe(i) if i % 6 else {"title": "no steps"}])
+    snapshots = []
+
+    out = recipe_ingest.ingest_recipes(
+        "u1", stream, embed_batch_size=10, upsert_batch_size=5, concurrency=4, max_retries=0,
+        on_progress=snapshots.append,
+    )
+
+    assert out["skipped"] == 8
+    assert out["failed"] == 5  # the chunk holding r13
+    assert out["count"] == 35 and len(index.ids) == 35
+    assert "r13" not in index.ids
+    assert out["batches"] == 4 and out["ok"] is False
+    assert len(out["errors"]) == 1
+    final = max(snapshots, key=lambda s: s["seen"])
+    assert final["seen"] == 48 and final["skipped"] == 8
+
+
+def test_store_failure_fails_the_batch_without_upserting(index, monkeypatch):
+    def put_recipes(batch):
+        if any(r["id"] == "r3" for r in batch):
+            raise ConnectionError("recipe store unavailable")
+
+    monkeypatch.setattr(recipe_ingest, "put_recipes", put_recipes)
+    index.poisoned = None
+    out = recipe_ingest.ingest_recipes(
+        "u1", [_recipe(i) for i in range(1, 21)], embed_batch_size=10, concurrency=2, max_retries=0,
+    )
+    assert out["failed"] == 10 and out["count"] == 10
+    assert sorted(index.ids) == sorted(f"r{i}" for i in range(11, 21))
@@ -0,0 +1,152 @@
+# tests/test_recipe_rag.py
+import random
+from typing import Any, Dict, List
+
+import pytest
+
+from app.services.recipe_rag import select_recipes, score_candidates, _hydrate_slots
+
+
+# ---------- the implementation before the vectorised rewrite, kept as the reference ----------
+
+def _old_score(r: Dict[str, Any], pantry: set, exclude: set) -> float:
+    ings = [i.get("name", "").lower() for i in r.get("ingredients", [])]
+    if any(ex in ing for ex in exclude for ing in ings):
+        return -999
+    overlap = sum(1 for ing in ings for p in pantry if p and p in ing)
+    base = float(r.get("score") or 0)
+    time_minutes = r.get("time_minutes") or 30
+    time_penalty = 0.02 * max(0, time_minutes - 25)
+    return base + 1.5 * overlap - time_penalty
+
+
+def _old_select(candidates: List[Dict[str, Any]], target_meals: int, data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    pantry = set([p.lower() for p in data.get("ingredients_at_home") or []])
+    exclude = set([e.lower() for e in data.get("exclusions") or []])
+    ranked = sorted(candidates, key=lambda r: _old_score(r, pantry, exclude), reverse=True)
+
+    chosen = []
+    seen_titles = set()
+    seen_main_tags = set()
+    for r in ranked:
+        if len(chosen) >= target_meals:
+            break
+        title = (r.get("title") or "").strip().lower()
+        tags = [t.lower() for t in (r.get("tags") or [])]
+        key_tag = tags[0] if tags else ""
+        if title in seen_titles:
+            continue
+        if key_tag and key_tag in seen_main_tags and len(chosen) < target_meals * 0.7:
+            continue
+        chosen.append(r)
+        if title:
+            seen_titles.add(title)
+        if key_tag:
+            seen_main_tags.add(key_tag)
+
+    if len(chosen) < target_meals:
+        for r in ranked:
+            if len(chosen) >= target_meals:
+                break
+            if r not in chosen:
+                chosen.append(r)
+    return chosen[:target_meals]
+
+# ---------- fixtures ----------
+
+def _recipe(rid, title, ingredients, score=0.5, minutes=30, tags=()):
+    return {"id": rid, "title": title, "score": score, "time_minutes": minutes,
+            "tags": list(tags), "ingredients": [{"name": n} for n in ingredients]}
+
+
+FIXED = [
+    # equal scores: ties must keep candidate order
+    _recipe("r1", "Tofu Stir Fry", ["Tofu", "Broccoli"], 0.5, 30, ["asian"]),
+    _recipe("r2", "Veg Curry", ["Chickpeas", "Spinach"], 0.5, 30, ["indian"]),
+    _recipe("r3", "Tofu Bowl", ["tofu", "rice"], 0.5, 30, ["asian"]),
+    # excluded: -999, whatever the pantry overlap
+    _recipe("r4", "Shrimp Tacos", ["Jumbo Shrimp", "Tortilla", "Spinach"], 0.9, 10, ["mexican"]),
+    _recipe("r5", "Peanut Noodles", ["peanut butter", "noodles"], 0.8, 15, ["asian"]),
+    # pantry overlap and time penalty
+    _recipe("r6", "Spinach Omelette", ["eggs", "baby spinach"], 0.4, 10, ["breakfast"]),
+    _recipe("r7", "Slow Chili", ["beans", "tomato"], 0.7, 240, ["mexican"]),
+    # duplicate title: skipped in the variety pass, used by the fill pass
+    _recipe("r8", "veg curry ", ["lentils", "spinach"], 0.6, 25, ["indian"]),
+    _recipe("r9", "Plain Rice", ["rice"], None, None, []),
+]
+FIXED_DATA = {"ingredients_at_home": ["Spinach", "rice"], "exclusions": ["shrimp", "peanut"]}
+
+
+def _random_candidates(rng: random.Random, n: int) -> List[Dict[str, Any]]:
+    words = ["tofu", "rice", "spinach", "egg", "shrimp", "beans", "tomato", "peanut butter", "oats", "kale"]
+    titles = ["Bowl", "Curry", "Salad", "Soup", "Wrap", "Bake"]
+    tags = ["asian", "indian", "mexican", "breakfast", "italian"]
+    return [
+        _recipe(
+            f"r{i}",
+            f"{rng.choice(words).title()} {rng.choice(titles)}",
+            rng.sample(words, rng.randint(1, 4)),
+            # coarse values so ties are common
+            rng.choice([None, 0.25, 0.5, 0.75]),
+            rng.choice([None, 10, 25, 30, 60]),
+            rng.sample(tags, rng.randint(0, 2)),
+        )
+        for i in range(n)
+    ]
+
+# ---------- tests ----------
+
+def test_scores_match_reference_including_exclusions():
+    pantry = {p.lower() for p in FIXED_DATA["ingredients_at_home"]}
+    exclude = {e.lower() for e in FIXED_DATA["exclusions"]}
+    scores = score_candidates(FIXED, pantry, exclude)
+    assert list(scores) == [_old_score(r, pantry, exclude) for r in FIXED]
+    assert scores[3] == -999 and scores[4] == -999
+
+
+@pytest.mark.parametrize("target", [0, 1, 3, 5, 9, 12])
+def test_selection_matches_reference_on_fixed_set(target):
+    new = [r["id"] for r in select_recipes(FIXED, target, FIXED_DATA)]
+    old = [r["id"] for r in _old_select(FIXED, target, FIXED_DATA)]
+    assert new == old
+
+
+def test_selection_matches_reference_on_random_sets():
+    rng = random.Random(7)
+    for _ in range(300):
+        candidates = _random_candidates(rng, rng.randint(1, 40))
+        data = {
+            "ingredients_at_home": rng.sample(["spinach", "rice", "tomato", "oats"], rng.randint(0, 3)),
+            "exclusions": rng.sample(["shrimp", "peanut", "egg"], rng.randint(0, 2)),
+        }
+        target = rng.randint(1, 25)
+        new = [r["id"] for r in select_recipes(candidates, target, data)]
+        old = [r["id"] for r in _old_select(candidates, target, data)]
+        assert new == old, (candidates, data, target)
+
+# ---------- compact-prompt slot hydration ----------
+
+SLOT_RECIPES = [_recipe(f"s{i}", f"Dish {i}", ["rice"]) for i in range(1, 4)]
+
+
+def test_hydrate_slots_well_formed():
+    plan = _hydrate_slots([[1, 2, 3], [3, 2, 1]], SLOT_RECIPES, 2)
+    assert [m["recipe_id"] for m in plan["days"][1]["meals"]] == ["s3", "s2", "s1"]
+    assert not {"malformed_rows", "missing_days", "truncated", "dropped_aliases"} & set(plan["audit"])
+
+
+@pytest.mark.parametrize("slots", [{"1": [1, 2, 3]}, "1,2,3", None, 7])
+def test_hydrate_slots_days_not_a_list(slots):
+    plan = _hydrate_slots(slots, SLOT_RECIPES, 2)
+    assert plan["days"] == []
+    assert plan["audit"]["malformed_days"] == type(slots).__name__
+    assert plan["audit"]["missing_days"] == 2 and plan["audit"]["truncated"] is True
+
+
+def test_hydrate_slots_reports_malformed_rows_and_short_plans():
+    plan = _hydrate_slots([[1, 2, 3], {"b": 1}, [1, 2], [1, 2, 9]], SLOT_RECIPES, 5)
+    audit = plan["audit"]
+    assert audit["malformed_rows"] == [2, 3]
+    assert audit["dropped_aliases"] == [9]
+    assert audit["missing_days"] == 1 and audit["truncated"] is True
+    assert [len(d["meals"]) for d in plan["days"]] == [3, 0, 2, 2]
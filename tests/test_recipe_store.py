@@ -0,0 +1,111 @@
+# tests/test_recipe_store.py
+import json, zlib
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import recipe_store
+from app.services.lru import LRUCache
+from app.services.recipe_corpus import _recipe_vector
+
+BODY = {
+    "title": "Veg Curry",
+    "tags": ["indian"],
+    "time_minutes": 30,
+    "kcal": 520,
+    "ingredients": [{"name": "chickpeas", "qty": 1, "unit": "can"}],
+    "steps": ["Simmer.", "Serve."],
+}
+
+
+class _MemoryBackend:
+    def __init__(self):
+        self.data = {}
+        self.reads = 0
+
+    def get_many(self, ids):
+        self.reads += 1
+        return {i: self.data[i] for i in ids if i in self.data}
+
+    def put_many(self, items):
+        self.data.update(items)
+
+
+class _Index:
+    """fetch() only, like the Pinecone client: legacy records carry the body in metadata."""
+
+    def __init__(self, metadata):
+        self.metadata = metadata
+        self.fetched = []
+
+    def fetch(self, ids, namespace):
+        self.fetched.append(list(ids))
+        return {"vectors": {i: {"id": i, "metadata": self.metadata[i]} for i in ids if i in self.metadata}}
+
+
+@pytest.fixture
+def store(monkeypatch):
+    backend = _MemoryBackend()
+    monkeypatch.setattr(recipe_store, "_backend", backend)
+    monkeypatch.setattr(recipe_store, "_lru", LRUCache(16))
+    return backend
+
+# ---------- codec ----------
+
+def test_encode_round_trips_with_codec_header():
+    raw = recipe_store.encode(BODY)
+    assert raw[:1] in (b"m", b"j")
+    assert recipe_store.decode(raw) == BODY
+
+
+def test_json_encoding_stays_readable():
+    # written by a process without msgpack/zstandard
+    raw = b"j" + zlib.compress(json.dumps(BODY).encode("utf-8"))
+    assert recipe_store.decode(raw) == BODY
+
+# ---------- hydration ----------
+
+def test_hydrates_from_store_without_touching_the_index(store):
+    recipe_store.put_recipes([{"id": "r1", **BODY}])
+    index = _Index({})
+
+    out = recipe_store.hydrate_matches(index, [{"id": "r1", "score": 0.9}], "recipes")
+
+    assert index.fetched == []
+    assert out[0]["id"] == "r1" and out[0]["score"] == 0.9
+    assert out[0]["ingredients"] == BODY["ingredients"]
+    assert out[0]["ingredient_names"] == ["chickpeas"]
+
+
+@pytest.mark.parametrize("metadata", [
+    # recipe_corpus layout before bodies moved to the store
+    {"title": "Veg Curry", "tags": ["indian"], "time_minutes": 30, "kcal": 520,
+     "ingredients_json": json.dumps(BODY["ingredients"]), "steps_json": json.dumps(BODY["steps"])},
+    # recipe_rag layout
+    {"title": "Veg Curry", "tags": ["indian"], "time_minutes": 30, "kcal": 520,
+     "ingredients": BODY["ingredients"], "steps": BODY["steps"]},
+])
+def test_legacy_records_are_backfilled_once(store, metadata):
+    index = _Index({"old": metadata})
+    matches = [SimpleNamespace(id="old", score=0.5)]
+
+    first = recipe_store.hydrate_matches(index, matches, "recipes")
+    assert first[0]["steps"] == BODY["steps"]
+    assert index.fetched == [["old"]]
+    assert recipe_store.decode(store.data["old"]) == BODY
+
+    recipe_store._lru = LRUCache(16)  # force a store read
+    second = recipe_store.hydrate_matches(index, matches, "recipes")
+    assert second == first
+    assert index.fetched == [["old"]]
+
+
+def test_matches_without_a_body_anywhere_are_dropped(store):
+    out = recipe_store.hydrate_matches(_Index({}), [{"id": "gone", "score": 0.1}], "recipes")
+    assert out == []
+
+
+def test_new_vectors_carry_no_body():
+    md = _recipe_vector("u1", {"id": "r1", **BODY}, [0.0])[2]
+    assert not {"ingredients_json", "steps_json", "ingredients", "steps"} & set(md)
+    assert md["ingredient_ids"] == ["chickpea"]
@@ -0,0 +1,27 @@
+# tests/test_redis_client.py
+from app.services import redis_client
+
+
+def test_backoff_skips_redis_after_a_failure(monkeypatch):
+    clients = []
+    now = [1000.0]
+    monkeypatch.setattr(redis_client, "get_redis", lambda decode_responses=True: clients.append(decode_responses) or "r")
+    monkeypatch.setattr(redis_client.time, "time", lambda: now[0])
+    monkeypatch.setenv("REDIS_BACKOFF_SECONDS", "5")
+
+    backoff = redis_client.RedisBackoff(decode_responses=False)
+    assert backoff.client() == "r" and clients == [False]
+
+    backoff.failed()
+    now[0] += 4.9
+    assert not backoff.usable() and backoff.client() is None
+    assert clients == [False]
+
+    now[0] += 0.2
+    assert backoff.usable() and backoff.client() == "r"
+
+
+def test_backoff_instances_are_independent():
+    a, b = redis_client.RedisBackoff(), redis_client.RedisBackoff()
+    a.failed()
+    assert not a.usable() and b.usable()
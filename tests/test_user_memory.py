@@ -0,0 +1,59 @@
+# tests/test_user_memory.py
+import pytest
+
+from app.services import user_memory
+
+
+class _Redis:
+    def __init__(self):
+        self.sets = {}
+
+    def sismember(self, key, member):
+        return member in self.sets.get(key, set())
+
+    def sadd(self, key, *members):
+        self.sets.setdefault(key, set()).update(members)
+
+
+class _Index:
+    def __init__(self, fail=0):
+        self.fail = fail
+        self.upserts = []
+
+    def upsert(self, vectors, namespace):
+        if self.fail:
+            self.fail -= 1
+            raise ConnectionError("pinecone unavailable")
+        self.upserts.extend(v[0] for v in vectors)
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    r = _Redis()
+    monkeypatch.setattr(user_memory, "get_redis", lambda: r)
+    monkeypatch.setattr(user_memory, "_embed", lambda text: [0.0, 1.0])
+    return r
+
+
+def test_repeated_text_is_stored_once(redis, monkeypatch):
+    index = _Index()
+    monkeypatch.setattr(user_memory, "get_pinecone_index", lambda: index)
+
+    first = user_memory.store_memory("u1", "Too spicy for me")
+    again = user_memory.store_memory("u1", "  too SPICY for me ")
+
+    assert index.upserts == [first["id"]]
+    assert again == {"ok": True, "id": first["id"], "duplicate": True}
+
+
+def test_failed_upsert_does_not_mark_the_text_seen(redis, monkeypatch):
+    index = _Index(fail=1)
+    monkeypatch.setattr(user_memory, "get_pinecone_index", lambda: index)
+
+    with pytest.raises(ConnectionError):
+        user_memory.store_memory("u1", "Loved the lentil soup")
+    assert redis.sets == {}
+
+    out = user_memory.store_memory("u1", "Loved the lentil soup")
+    assert "duplicate" not in out
+    assert index.upserts == [out["id"]]
@@ -0,0 +1,118 @@
+# tests/test_vector_store.py
+import json
+import os
+
+import pytest
+
+from app.services import vector_store
+from app.services.vector_store import LocalVectorIndex, matches_filter
+
+META = {"user_id": "u1", "tags": ["thai", "quick"], "time_minutes": 20, "ingredient_tokens": ["rice", "tofu"]}
+
+# ---------- matches_filter ----------
+
+@pytest.mark.parametrize("flt, expected", [
+    (None, True),
+    ({}, True),
+    ({"user_id": "u1"}, True),
+    ({"user_id": {"$eq": "u2"}}, False),
+    ({"user_id": {"$ne": "u2"}}, True),
+    # $in / $nin against scalars and lists (any element / no element)
+    ({"user_id": {"$in": ["u1", "u3"]}}, True),
+    ({"user_id": {"$nin": ["u1"]}}, False),
+    ({"tags": {"$in": ["italian", "quick"]}}, True),
+    ({"tags": {"$in": ["italian"]}}, False),
+    ({"ingredient_tokens": {"$nin": ["shrimp", "peanut"]}}, True),
+    ({"ingredient_tokens": {"$nin": ["shrimp", "tofu"]}}, False),
+    # missing fields satisfy only negative operators
+    ({"kcal": {"$lte": 600}}, False),
+    ({"kcal": {"$nin": [500]}}, True),
+    ({"kcal": {"$ne": 500}}, True),
+    ({"kcal": {"$exists": False}}, True),
+    ({"kcal": {"$exists": True}}, False),
+    ({"time_minutes": {"$exists": True, "$lte": 30}}, True),
+    ({"time_minutes": {"$gt": 20}}, False),
+    ({"time_minutes": {"$gte": "20"}}, False),  # mismatched types never match
+    # $and / $or, nested
+    ({"$and": [{"user_id": "u1"}, {"time_minutes": {"$lt": 30}}]}, True),
+    ({"$and": [{"user_id": "u1"}, {"time_minutes": {"$lt": 10}}]}, False),
+    ({"$or": [{"time_minutes": {"$lte": 10}}, {"time_minutes": {"$exists": False}}]}, False),
+    ({"$or": [{"kcal": {"$lte": 10}}, {"kcal": {"$exists": False}}]}, True),
+    ({"$and": [
+        {"user_id": {"$eq": "u1"}},
+        {"ingredient_tokens": {"$nin": ["peanut"]}},
+        {"$or": [{"tags": {"$in": ["thai"]}}, {"tags": {"$exists": False}}]},
+    ]}, True),
+])
+def test_matches_filter(flt, expected):
+    assert matches_filter(META, flt) is expected
+
+
+def test_unknown_operator_is_rejected():
+    with pytest.raises(ValueError):
+        matches_filter(META, {"time_minutes": {"$near": 5}})
+
+# ---------- local index persistence ----------
+
+def _vec(i, dim=4):
+    return [float(i + 1)] + [float((i * k) % 3) for k in range(1, dim)]
+
+
+def _reopen(root):
+    return LocalVectorIndex(str(root), dimension=4)
+
+
+def test_upserts_append_to_the_journal_instead_of_rewriting_rows(tmp_path):
+    idx = _reopen(tmp_path)
+    for i in range(50):
+        idx.upsert([(f"v{i}", _vec(i), {"n": i})], namespace="ns")
+
+    ns_dir = tmp_path / "ns"
+    snapshot = json.loads((ns_dir / "rows.json").read_text())
+    assert snapshot == {"ids": [], "meta": []}
+    assert len((ns_dir / "rows.log").read_text().splitlines()) == 50
+
+    again = _reopen(tmp_path)
+    assert again.describe_index_stats()["namespaces"]["ns"]["vector_count"] == 50
+    got = again.fetch(["v7", "v49"], namespace="ns")["vectors"]
+    assert got["v7"]["metadata"] == {"n": 7} and got["v49"]["metadata"] == {"n": 49}
+    top = again.query(_vec(7), top_k=1, include_metadata=True, namespace="ns", filter={"n": {"$eq": 7}})
+    assert top["matches"][0]["id"] == "v7"
+
+
+def test_updates_and_deletes_survive_a_reopen(tmp_path):
+    idx = _reopen(tmp_path)
+    idx.upsert([(f"v{i}", _vec(i), {"n": i}) for i in range(5)], namespace="ns")
+    idx.upsert([("v1", _vec(1), {"n": 100})], namespace="ns")
+    idx.delete(ids=["v2", "missing"], namespace="ns")
+    idx.upsert([("v9", _vec(9), {"n": 9})], namespace="ns")  # reuses v2's row
+
+    again = _reopen(tmp_path)
+    ns = again._ns("ns")
+    assert sorted(ns.row_of) == ["v0", "v1", "v3", "v4", "v9"]
+    assert ns.row_of["v9"] == 2 and ns.free == []
+    assert again.fetch(["v1"], namespace="ns")["vectors"]["v1"]["metadata"] == {"n": 100}
+
+
+def test_journal_is_compacted_into_the_snapshot(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store, "_COMPACT_MIN", 8)
+    idx = _reopen(tmp_path)
+    for i in range(9):
+        idx.upsert([(f"v{i}", _vec(i), {"n": i})], namespace="ns")
+
+    ns_dir = tmp_path / "ns"
+    assert not (ns_dir / "rows.log").exists()
+    assert json.loads((ns_dir / "rows.json").read_text())["ids"] == [f"v{i}" for i in range(9)]
+
+    idx.upsert([("v9", _vec(9), {"n": 9})], namespace="ns")
+    assert len((ns_dir / "rows.log").read_text().splitlines()) == 1
+    assert len(_reopen(tmp_path)._ns("ns").row_of) == 10
+
+
+def test_torn_last_journal_line_is_ignored(tmp_path):
+    idx = _reopen(tmp_path)
+    idx.upsert([("a", _vec(0), {}), ("b", _vec(1), {})], namespace="ns")
+    with open(os.path.join(tmp_path, "ns", "rows.log"), "a") as f:
+        f.write('[2, "c", {"n"')
+
+    assert sorted(_reopen(tmp_path)._ns("ns").row_of) == ["a", "b"]